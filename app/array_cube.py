@@ -0,0 +1,161 @@
+import json
+import os
+import re
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+
+class ArrayCube:
+    """
+    KPI cube held as dense NumPy arrays: state x year x quarter x utilization type.
+
+    Dimensions are integer-coded (position in the sorted dimension values) and
+    every measure is a float64 array of that shape, with `present` marking the
+    cells that have rows. The SDUD cube is a few thousand cells, so KPI tables,
+    national rollups and trend lines are a handful of array lookups instead of
+    a database round trip.
+
+    `save` writes one .npy file per array; `load(mmap=True)` maps them read-only,
+    so every worker process on a host shares the same pages.
+    """
+
+    MEASURES = (
+        "total_amount_reimbursed",
+        "medicaid_amount_reimbursed",
+        "total_prescriptions",
+        "total_units_reimbursed",
+    )
+    DIMENSIONS = ("state", "year", "quarter", "utilization_type")
+    _CAST = {"state": str, "year": int, "quarter": int, "utilization_type": str}
+
+    def __init__(self, dims: dict, measures: dict, present: np.ndarray, data_version=None):
+        self.dims = {name: list(dims[name]) for name in self.DIMENSIONS}
+        self.measures = measures
+        self.present = present
+        self.data_version = data_version
+        self._index = {name: {v: i for i, v in enumerate(values)} for name, values in self.dims.items()}
+        self._named_states = np.flatnonzero(np.asarray(self.dims["state"], dtype=object) != "")
+
+    # -- building ----------------------------------------------------------
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, data_version=None) -> "ArrayCube":
+        """Build from one row per cell (DIMENSIONS + MEASURES columns)."""
+        # Rows without a state keep their own cells (state ""), left out of national totals
+        df = df.dropna(subset=["year", "quarter", "utilization_type"]).assign(state=df["state"].fillna(""))
+        keys = {name: df[name].astype(cls._CAST[name]) for name in cls.DIMENSIONS}
+        dims = {name: sorted(keys[name].unique().tolist()) for name in cls.DIMENSIONS}
+        shape = tuple(len(dims[name]) for name in cls.DIMENSIONS)
+        codes = tuple(pd.Categorical(keys[name], categories=dims[name]).codes for name in cls.DIMENSIONS)
+
+        measures = {}
+        for m in cls.MEASURES:
+            arr = np.zeros(shape, dtype="float64")
+            # SUM semantics: NULL measures add nothing; repeated cells accumulate
+            np.add.at(arr, codes, pd.to_numeric(df[m], errors="coerce").fillna(0.0).to_numpy("float64"))
+            measures[m] = arr
+        present = np.zeros(shape, dtype=bool)
+        present[codes] = True
+        return cls(dims, measures, present, data_version)
+
+    # -- persistence -------------------------------------------------------
+    def save(self, path: str) -> None:
+        """Write to directory `path` (built aside and renamed, so readers never see a partial cube)."""
+        tmp = f"{path}.tmp-{uuid.uuid4().hex[:8]}"
+        os.makedirs(tmp)
+        try:
+            for name, arr in {**self.measures, "present": self.present}.items():
+                np.save(os.path.join(tmp, f"{name}.npy"), arr)
+            with open(os.path.join(tmp, "dims.json"), "w", encoding="utf-8") as fh:
+                json.dump({"dims": self.dims, "data_version": self.data_version}, fh)
+            os.rename(tmp, path)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+            # Another worker saved the same cube first
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "ArrayCube":
+        with open(os.path.join(path, "dims.json"), encoding="utf-8") as fh:
+            meta = json.load(fh)
+        mode = "r" if mmap else None
+        measures = {m: np.load(os.path.join(path, f"{m}.npy"), mmap_mode=mode) for m in cls.MEASURES}
+        present = np.load(os.path.join(path, "present.npy"), mmap_mode=mode)
+        return cls(meta["dims"], measures, present, meta.get("data_version"))
+
+    @staticmethod
+    def version_dir(root: str, data_version) -> str:
+        return os.path.join(root, "v-" + re.sub(r"[^0-9A-Za-z]+", "-", str(data_version)).strip("-"))
+
+    # -- queries -----------------------------------------------------------
+    def _select(self, state=None, year=None, quarter=None, util_type=None):
+        """
+        Index tuple for the slice; None means all values of a dimension (for
+        state: every named state). None if a value is unknown.
+        """
+        sel = []
+        for name, value in zip(self.DIMENSIONS, (state, year, quarter, util_type)):
+            if value is None:
+                if name == "state":
+                    sel.append(self._named_states)
+                else:
+                    sel.append(slice(None))
+                continue
+            i = self._index[name].get(self._CAST[name](value))
+            if i is None:
+                return None
+            sel.append(i)
+        return tuple(sel)
+
+    def kpi(self, state, year, quarter, util_type) -> dict:
+        """Same keys as the KPI statements in queries.py; state=None is the national total."""
+        sel = self._select(state, year, quarter, util_type)
+        if sel is None or not self.present[sel].any():
+            # SUM over no rows is NULL
+            return {"total_reimbursed": None, "medicaid_reimbursed": None, "prescriptions": None, "units": None}
+        return {
+            "total_reimbursed": float(self.measures["total_amount_reimbursed"][sel].sum()),
+            "medicaid_reimbursed": float(self.measures["medicaid_amount_reimbursed"][sel].sum()),
+            "prescriptions": float(self.measures["total_prescriptions"][sel].sum()),
+            "units": float(self.measures["total_units_reimbursed"][sel].sum()),
+        }
+
+    def trend(self, state, year, util_type) -> pd.DataFrame:
+        """Quarterly totals for one year (year_quarter, quarter, total_reimbursed); state=None is national."""
+        sel = self._select(state, year, None, util_type)
+        if sel is None:
+            return pd.DataFrame({"year_quarter": [], "quarter": [], "total_reimbursed": []})
+        # Axes left after indexing: quarter (+ state when national)
+        totals = self.measures["total_amount_reimbursed"][sel]
+        present = self.present[sel]
+        if state is None:
+            totals, present = totals.sum(axis=0), present.any(axis=0)
+        quarters = np.asarray(self.dims["quarter"])[present]
+        return pd.DataFrame(
+            {
+                "year_quarter": [f"{int(year)}Q{q}" for q in quarters],
+                "quarter": quarters,
+                "total_reimbursed": totals[present],
+            }
+        )
+
+    def ranking(self, year, quarter, util_type) -> pd.DataFrame:
+        """Per-state KPIs of one slice: state plus the keys of the KPI statements."""
+        cols = ["state", "total_reimbursed", "medicaid_reimbursed", "prescriptions", "units"]
+        sel = self._select(None, year, quarter, util_type)
+        if sel is None:
+            return pd.DataFrame(columns=cols)
+        present = self.present[sel]
+        return pd.DataFrame(
+            {
+                "state": np.asarray(self.dims["state"])[self._named_states][present],
+                "total_reimbursed": self.measures["total_amount_reimbursed"][sel][present],
+                "medicaid_reimbursed": self.measures["medicaid_amount_reimbursed"][sel][present],
+                "prescriptions": self.measures["total_prescriptions"][sel][present],
+                "units": self.measures["total_units_reimbursed"][sel][present],
+            },
+            columns=cols,
+        )
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_handle(session_id, name: str, filters: dict) -> dict:
+    """Small JSON-able reference the browser keeps instead of the artifact itself."""
+    return {"session_id": session_id, "name": name, "filters": dict(filters)}
+
+
+class ArtifactStore:
+    """
+    Server-side home for download artifacts (figures, frames).
+
+    One slot per (session, artifact name): a newer put() for the same session
+    replaces the previous filters' artifact. Entries expire after `ttl_seconds`
+    and the least recently used are evicted beyond `max_entries`. get() returns
+    None on a miss, in which case the caller rebuilds from the handle's filters.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 1800.0):
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def put(self, session_id, name: str, filters: dict, value) -> dict:
+        handle = make_handle(session_id, name, filters)
+        if self.max_entries <= 0:
+            return handle
+        key = (session_id, name)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), handle["filters"], value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return handle
+
+    def get(self, handle: dict | None):
+        if not handle:
+            return None
+        key = (handle.get("session_id"), handle.get("name"))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] != handle.get("filters"):
+                self.misses += 1
+                return None
+            if time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
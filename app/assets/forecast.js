@@ -0,0 +1,108 @@
+// Forecast tab view, drawn in the browser from the fitted forecast the server
+// keeps in store_forecast (MAX_HORIZON quarters at multiplier 1, see
+// dashboard.py). Horizon and scenario multiplier only truncate and scale it, so
+// moving the slider re-renders here without a server round trip.
+// build_forecast in dashboard.py draws the same figure for PNG downloads.
+(function () {
+    var COLORS = ["#636efa", "#EF553B"];
+
+    function figure(fit, fc, method) {
+        var traces = [
+            {x: fit.history.date, y: fit.history.value, name: "Historical", color: COLORS[0]},
+            {x: fc.date, y: fc.value, name: "Forecast (" + method + ")", color: COLORS[1]},
+        ].map(function (t) {
+            return {
+                type: "scatter",
+                mode: "lines+markers",
+                x: t.x,
+                y: t.y,
+                name: t.name,
+                legendgroup: t.name,
+                line: {color: t.color},
+                marker: {color: t.color},
+                hovertemplate: "series=" + t.name + "<br>date=%{x}<br>total_reimbursed=%{y}<extra></extra>",
+            };
+        });
+        // Confidence interval shaded band
+        traces.push({
+            type: "scatter", mode: "lines", x: fc.date, y: fc.upper,
+            line: {width: 0}, showlegend: false, hoverinfo: "skip",
+        });
+        traces.push({
+            type: "scatter", mode: "lines", x: fc.date, y: fc.lower,
+            line: {width: 0}, fillcolor: "rgba(68, 68, 68, 0.2)", fill: "tonexty", name: "95% CI",
+            hovertemplate: "<b>95% CI</b><br>Date: %{x}<br>Lower: $%{y:,.0f}<extra></extra>",
+        });
+        if (fc.lower_80) {
+            // Inner 80% band of the bootstrap
+            traces.push({
+                type: "scatter", mode: "lines", x: fc.date, y: fc.upper_80,
+                line: {width: 0}, showlegend: false, hoverinfo: "skip",
+            });
+            traces.push({
+                type: "scatter", mode: "lines", x: fc.date, y: fc.lower_80,
+                line: {width: 0}, fillcolor: "rgba(68, 68, 68, 0.3)", fill: "tonexty", name: "80% CI",
+                hovertemplate: "<b>80% CI</b><br>Date: %{x}<br>Lower: $%{y:,.0f}<extra></extra>",
+            });
+        }
+        return {
+            data: traces,
+            layout: {
+                title: {text: "Forecast: Total Amount Reimbursed — " + fit.state + " [" + fit.util_type + "] (95% CI)"},
+                legend: {title: {text: "series"}, tracegroupgap: 0},
+                xaxis: {title: {text: "date"}},
+                yaxis: {title: {text: "total_reimbursed"}, tickformat: "$,"},
+                margin: {l: 20, r: 20, t: 50, b: 20},
+            },
+        };
+    }
+
+    // Rows for the forecast DataTable; its column formats (tables.py) format them
+    function rows(fc) {
+        return fc.period.map(function (period, i) {
+            return {period: period, value: fc.value[i], lower: fc.lower[i], upper: fc.upper[i]};
+        });
+    }
+
+    function render(fit, horizon, multiplier, scope, sessionId) {
+        var empty = {data: [], layout: {title: {text: "No forecast data"}}};
+        if (!fit || !horizon || !multiplier || !scope) {
+            return [empty, [], "", "", {}];
+        }
+        var label = "Multiplier: " + multiplier.toFixed(2);
+        var scopeNote = "Forecast uses State series.";
+        if (!fit.method) {
+            return [empty, [], "No time series available for forecast. " + scopeNote, label, {}];
+        }
+
+        var fc = {period: fit.forecast.period.slice(0, horizon), date: fit.forecast.date.slice(0, horizon)};
+        ["value", "lower", "upper", "lower_80", "upper_80"].forEach(function (k) {
+            if (fit.forecast[k]) {
+                fc[k] = fit.forecast[k].slice(0, horizon).map(function (v) { return v * multiplier; });
+            }
+        });
+        var method = fit.method.toUpperCase();
+        // Auto: the candidate with the lowest rolling-origin backtest error (WAPE)
+        var model = fit.model === "auto"
+            ? "AUTO → " + method + (fit.score != null ? " (backtest WAPE " + (100 * fit.score).toFixed(1) + "%)" : "")
+            : method;
+        var interval = fit.interval === "bootstrap" ? "Interval: bootstrap (5,000 paths) | " : "";
+        var note = "Model: " + model + " | " + interval + "Horizon: " + horizon + " quarters | " +
+            "Scenario multiplier: " + multiplier.toFixed(2) + " | " + scopeNote +
+            (fit.source === "batch" ? " Precomputed by the batch forecast job." : "");
+        // Same handle artifact_store.make_handle builds; downloads redraw the figure server-side
+        var handle = {
+            session_id: sessionId,
+            name: "forecast",
+            filters: {
+                state: fit.state, util_type: fit.util_type, scope: scope,
+                horizon: horizon, multiplier: multiplier, model_name: fit.model, interval: fit.interval,
+            },
+        };
+        return [figure(fit, fc, method), rows(fc), note, label, handle];
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        forecast: {render: render},
+    });
+})();
@@ -0,0 +1,141 @@
+"""
+Database backends for the dashboard, selected by DATABASE_URL.
+
+    mssql+pyodbc://...               SQL Server (the default, see dashboard.py)
+    duckdb:////path/to/sdud.duckdb   DuckDB database file with a `dbo` schema
+    parquet:///path/to/snapshot      Parquet files, queried in-process by DuckDB
+
+For parquet:// every `<table>.parquet` file and every `<table>/` directory of
+Parquet files (hive-partitioned, e.g. `year=2024/quarter=1/part-0.parquet`)
+under the root becomes a view `dbo.<table>` on each pooled DuckDB connection.
+The dashboard's queries run unchanged apart from the dialect (see queries.py),
+and nothing but the files is needed: no server, no ODBC driver.
+
+A snapshot bundle (a root with manifest.json, written by
+scripts/06_snapshot_parquet.py) is opened as memory-mapped Arrow datasets
+instead: its tables come from the manifest, pages are shared through the OS
+page cache across connections and processes, and filters on year/quarter skip
+the partitions a query does not touch.
+"""
+import json
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
+
+# Optional embedded engine
+try:
+    import duckdb  # noqa: F401
+    import duckdb_engine  # noqa: F401
+    HAS_DUCKDB = True
+except Exception:
+    HAS_DUCKDB = False
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pa_ds
+    import pyarrow.fs as pa_fs
+    HAS_PYARROW = True
+except Exception:
+    HAS_PYARROW = False
+
+PARQUET_SCHEME = "parquet://"
+MANIFEST = "manifest.json"
+
+
+def _sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def parquet_tables(root: str) -> dict:
+    """{table name: DuckDB table function reading it} for the Parquet files under `root`."""
+    tables = {}
+    for entry in sorted(os.listdir(root)):
+        path = os.path.join(root, entry)
+        if os.path.isfile(path) and entry.endswith(".parquet"):
+            tables[entry[: -len(".parquet")]] = f"read_parquet({_sql_literal(path)})"
+        elif os.path.isdir(path) and not entry.startswith("."):
+            glob = os.path.join(path, "**", "*.parquet")
+            tables[entry] = f"read_parquet({_sql_literal(glob)}, hive_partitioning = true, union_by_name = true)"
+    return tables
+
+
+def read_manifest(root: str) -> dict | None:
+    try:
+        with open(os.path.join(root, MANIFEST), encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def bundle_datasets(root: str, manifest: dict) -> dict:
+    """{table name: memory-mapped pyarrow dataset} for a snapshot bundle."""
+    fs = pa_fs.LocalFileSystem(use_mmap=True)
+    datasets = {}
+    for name, info in manifest["tables"].items():
+        partitioning = None
+        if info.get("partitioned_by"):
+            partitioning = pa_ds.partitioning(
+                pa.schema([(col, pa.int64()) for col in info["partitioned_by"]]), flavor="hive"
+            )
+        datasets[name] = pa_ds.dataset(
+            os.path.join(root, info["path"]), format="parquet", filesystem=fs, partitioning=partitioning
+        )
+    return datasets
+
+
+def create_parquet_engine(root: str, pool_size: int = 8):
+    if not HAS_DUCKDB:
+        raise RuntimeError("the parquet:// backend requires the duckdb and duckdb-engine packages")
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"parquet snapshot directory not found: {root}")
+
+    manifest = read_manifest(root)
+    if manifest is not None:
+        if not HAS_PYARROW:
+            raise RuntimeError("snapshot bundles require pyarrow")
+        datasets = bundle_datasets(root, manifest)
+        tables = {name: f"sdud_arrow_{name}" for name in datasets}
+    else:
+        datasets = {}
+        tables = parquet_tables(root)
+
+    # Each pooled connection is its own in-memory database holding only views;
+    # the data stays in the files and DuckDB scans just the columns and
+    # partitions a query touches.
+    engine = create_engine("duckdb:///:memory:", poolclass=QueuePool, pool_size=pool_size, max_overflow=4)
+
+    @event.listens_for(engine, "connect")
+    def _register_views(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        cur.execute("CREATE SCHEMA IF NOT EXISTS dbo")
+        for name, dataset in datasets.items():
+            cur.register(tables[name], dataset)
+        for name, source in tables.items():
+            cur.execute(f'CREATE OR REPLACE VIEW dbo."{name}" AS SELECT * FROM {source}')
+        cur.close()
+
+    if manifest is not None:
+        rows = sum(t["rows"] for t in manifest["tables"].values())
+        print(
+            f"[backends] snapshot bundle {root} | tables={len(tables)} rows={rows:,} "
+            f"data_version={manifest.get('data_version')} created_at={manifest.get('created_at')}"
+        )
+    else:
+        print(f"[backends] parquet snapshot {root} | tables={sorted(tables)}")
+    return engine
+
+
+def create_engine_from_url(url, pool_size: int = 8):
+    """SQLAlchemy engine for DATABASE_URL, including the parquet:// scheme."""
+    if isinstance(url, str) and url.startswith(PARQUET_SCHEME):
+        return create_parquet_engine(url[len(PARQUET_SCHEME):], pool_size=pool_size)
+    return create_engine(url, pool_pre_ping=True)
+
+
+def pool_capacity(engine) -> int | None:
+    """Connections the engine's pool hands out at once (size + overflow), None if unbounded."""
+    pool = engine.pool
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return None
+    return pool.size() + pool._max_overflow
@@ -1,22 +1,46 @@
 import io
 import os
+import json
+import time
+import uuid
+import shutil
+from urllib.parse import urlencode
+import itertools
+import threading
 import datetime as dt
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.engine import URL
 
-from dash import Dash, dcc, html, Input, Output, State
+from dash import ClientsideFunction, Dash, dcc, html, Input, Output, State
 from dash.exceptions import PreventUpdate
 import plotly.express as px
-import plotly.io as pio
 
-# Optional forecasting dependency
-try:
-    from statsmodels.tsa.holtwinters import ExponentialSmoothing
-    HAS_STATSMODELS = True
-except Exception:
-    HAS_STATSMODELS = False
+from array_cube import ArrayCube
+from artifact_store import ArtifactStore
+from backends import create_engine_from_url, pool_capacity
+from export import HAS_PYARROW, register_export_route
+from forecasting import (
+    AUTO,
+    AUTO_CANDIDATES,
+    BAND_QUANTILES,
+    HAS_STATSMODELS,
+    MAX_HORIZON,
+    ForecastCache,
+    fit_forecast,
+    select_model,
+    selection_pool,
+)
+from metrics import top1_spend_share_head
+from query_cache import QueryCache
+import queries
+from quantile_sketch import QuantileSketch
+from tables import MONEY0, MONEY2, NUM0, PCT2, column, data_table
+from queries import CPP_NBINS, CPP_SKETCH_TABLE, FORECASTS_TABLE, KPI_CUBE_TABLE, TOP_DRIVERS_TABLE
 
 print(f"[dashboard] imports complete | statsmodels={HAS_STATSMODELS}")
 
@@ -24,9 +48,11 @@ print(f"[dashboard] imports complete | statsmodels={HAS_STATSMODELS}")
 # DB connection (env-configurable)
 # -----------------------------
 # If DATABASE_URL is provided, it takes precedence. Otherwise assemble from parts.
+# Besides SQLAlchemy URLs it accepts parquet:///path/to/snapshot, which runs the
+# dashboard in-process on Parquet files (see backends.py).
 _DATABASE_URL = os.getenv("DATABASE_URL")
 if _DATABASE_URL:
-    engine = create_engine(_DATABASE_URL, pool_pre_ping=True)
+    engine = create_engine_from_url(_DATABASE_URL)
 else:
     DB_HOST = os.getenv("DB_HOST", "localhost")
     DB_PORT = int(os.getenv("DB_PORT", "1433"))
@@ -50,21 +76,188 @@ else:
     )
     engine = create_engine(_url, pool_pre_ping=True)
 
+# SQL dialect of the backend (T-SQL or DuckDB), see queries.py
+SQL = queries.dialect_for(engine.dialect.name)
+
+# -----------------------------
+# Query cache
+# -----------------------------
+# Every dashboard query goes through `read_sql` / `fetch_one`,
+# which cache results by normalized SQL + params. Entries expire after
+# QUERY_CACHE_TTL seconds, the least recently used are evicted beyond
+# QUERY_CACHE_SIZE, and everything is dropped when the ETL load marker in
+# dbo.sdud_data_version changes. QUERY_CACHE_SIZE=0 disables caching.
+def fetch_data_version():
+    with engine.begin() as conn:
+        return conn.execute(text("SELECT MAX(loaded_at) FROM dbo.sdud_data_version")).scalar()
+
+
+query_cache = QueryCache(
+    max_entries=int(os.getenv("QUERY_CACHE_SIZE", "512")),
+    ttl_seconds=float(os.getenv("QUERY_CACHE_TTL", "900")),
+    version_fn=fetch_data_version,
+    version_check_seconds=float(os.getenv("DATA_VERSION_CHECK_SECONDS", "30")),
+)
+
+
+# Fitted forecasts per (state, utilization type, model, interval, data version);
+# the forecast tab's multiplier and horizon are applied in the browser. Without
+# a data version (no dbo.sdud_data_version) entries expire after QUERY_CACHE_TTL.
+forecast_cache = ForecastCache(max_entries=int(os.getenv("FORECAST_CACHE_SIZE", "256")))
+# The "auto" model's choice and backtest score per (state, utilization type, data version)
+selection_cache = ForecastCache(max_entries=int(os.getenv("FORECAST_CACHE_SIZE", "256")))
+
+# The "auto" model backtests its candidates in parallel on FORECAST_WORKERS
+# processes (1 scores them in the request thread), each within
+# FORECAST_FIT_BUDGET seconds. The pool is started by the background refresh
+# thread, so the workers' cold start isn't paid by the first request.
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", str(min(len(AUTO_CANDIDATES), os.cpu_count() or 1))))
+FORECAST_FIT_BUDGET = float(os.getenv("FORECAST_FIT_BUDGET", "5"))
+if __name__ == "__main__" and FORECAST_WORKERS > 1:
+    # Workers re-import the main script, here all of dashboard.py (see serve.py)
+    print("[dashboard] started as dashboard.py: auto model candidates are scored in-process; use app/serve.py")
+    FORECAST_WORKERS = 1
+_selection_pool = None
+_selection_pool_lock = threading.Lock()
+
+
+def get_selection_pool():
+    global _selection_pool
+    if FORECAST_WORKERS <= 1:
+        return None
+    with _selection_pool_lock:
+        if _selection_pool is None:
+            t0 = time.perf_counter()
+            _selection_pool = selection_pool(FORECAST_WORKERS)
+            # Workers are started on demand, one per task submitted while none is idle
+            wait([_selection_pool.submit(time.perf_counter) for _ in range(FORECAST_WORKERS)])
+            print(f"[dashboard] model selection pool up | workers={FORECAST_WORKERS} in {time.perf_counter() - t0:.1f}s")
+        return _selection_pool
+
+# Download artifacts (figures) kept server-side; the browser only holds handles.
+artifact_store = ArtifactStore(
+    max_entries=int(os.getenv("ARTIFACT_STORE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("ARTIFACT_STORE_TTL", "1800")),
+)
+
+
 # -----------------------------
 # Helpers
 # -----------------------------
-def fetch_distinct(sql: str) -> list:
+def read_sql(sql: str, params: dict | None = None) -> pd.DataFrame:
+    df = query_cache.get_or_load(sql, params, lambda: pd.read_sql(text(sql), engine, params=params))
+    # Callers add columns to the frames they get back; keep the cached copy clean
+    return df.copy()
+
+
+def _fetch_one(sql: str, params: dict | None) -> dict:
     with engine.begin() as conn:
-        rows = conn.execute(text(sql)).fetchall()
-    return [r[0] for r in rows if r[0] is not None]
+        row = conn.execute(text(sql), params or {}).mappings().first()
+    return dict(row) if row else {}
+
+
+def fetch_one(sql: str, params: dict | None = None) -> dict:
+    return dict(query_cache.get_or_load(sql, params, lambda: _fetch_one(sql, params)))
+
 
+def table_exists(name: str, schema: str = "dbo") -> bool:
+    try:
+        return inspect(engine).has_table(name, schema=schema)
+    except Exception:
+        return False
 
-def fmt_money0(x: float) -> str:
-    return f"${x:,.0f}"
 
+def column_exists(table: str, column: str, schema: str = "dbo") -> bool:
+    # An empty result's column list works on every backend, unlike column reflection
+    try:
+        with engine.connect() as conn:
+            return column in conn.execute(text(f"SELECT * FROM {schema}.{table} WHERE 1 = 0")).keys()
+    except Exception:
+        return False
 
-def fmt_num0(x: float) -> str:
-    return f"{x:,.0f}"
+
+# Independent statements of one callback are issued concurrently over the engine's
+# connection pool. QUERY_WORKERS bounds the number of in-flight queries per process
+# and is capped at what the pool can hand out (size + overflow), so workers never
+# queue on a checkout and run into the pool timeout.
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "8"))
+if (_pool_capacity := pool_capacity(engine)) is not None and QUERY_WORKERS > _pool_capacity:
+    print(f"[dashboard] QUERY_WORKERS={QUERY_WORKERS} exceeds the connection pool; using {_pool_capacity}")
+    QUERY_WORKERS = _pool_capacity
+query_pool = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="sdud-query")
+last_query_timings: dict = {}
+_timings_lock = threading.Lock()
+
+
+def _run_statement(kind: str, sql: str, params: dict):
+    t0 = time.perf_counter()
+    out = fetch_one(sql, params) if kind == "row" else read_sql(sql, params)
+    return out, (time.perf_counter() - t0) * 1000.0
+
+
+class RequestTracker:
+    """
+    Remembers the newest request per (session, callback). A request that has been
+    superseded by a later filter change stops waiting on its queries, cancels the
+    ones not yet started and skips building figures nobody will see.
+    """
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._latest: OrderedDict = OrderedDict()
+        self._tokens = itertools.count(1)
+
+    def begin(self, session_id, name: str):
+        key = (session_id, name)
+        token = next(self._tokens)
+        with self._lock:
+            self._latest[key] = token
+            self._latest.move_to_end(key)
+            while len(self._latest) > self.max_keys:
+                self._latest.popitem(last=False)
+        return lambda: self._latest.get(key) == token
+
+
+request_tracker = RequestTracker()
+
+
+def run_statements(label: str, statements: dict, is_current=None) -> dict:
+    """
+    Run {name: (kind, sql, params)} concurrently and return {name: result}.
+    Per-statement timings are logged and kept in `last_query_timings[label]`.
+    If `is_current()` turns false while waiting, queries that have not started
+    are cancelled and PreventUpdate is raised (running ones finish into the cache).
+    """
+    t0 = time.perf_counter()
+    futures = {query_pool.submit(_run_statement, *stmt): name for name, stmt in statements.items()}
+    results, timings = {}, {}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=0.05, return_when=FIRST_COMPLETED)
+        for fut in done:
+            results[futures[fut]], timings[futures[fut]] = fut.result()
+        if pending and is_current is not None and not is_current():
+            cancelled = [futures[f] for f in pending if f.cancel()]
+            print(f"[dashboard] {label} superseded | cancelled={cancelled}")
+            raise PreventUpdate
+    wall_ms = (time.perf_counter() - t0) * 1000.0
+
+    critical = max(timings, key=timings.get) if timings else None
+    with _timings_lock:
+        last_query_timings[label] = {
+            "wall_ms": round(wall_ms, 1),
+            "sum_ms": round(sum(timings.values()), 1),
+            "critical_path": critical,
+            "queries_ms": {k: round(v, 1) for k, v in sorted(timings.items(), key=lambda kv: -kv[1])},
+        }
+    print(
+        f"[dashboard] {label} queries | wall={wall_ms:.0f}ms sum={sum(timings.values()):.0f}ms "
+        f"critical={critical} | " + " ".join(f"{k}={v:.0f}ms" for k, v in timings.items())
+    )
+    if is_current is not None and not is_current():
+        raise PreventUpdate
+    return results
 
 
 def write_fig_png(fig):
@@ -76,48 +269,246 @@ def write_fig_png(fig):
     return _writer
 
 
+# -----------------------------
+# Gold tables (see queries.py)
+# -----------------------------
+# Until the gold tables' presence is confirmed with the filter options, the
+# statements fall back to aggregating the analytics rows.
+HAS_KPI_CUBE = False
+HAS_TOP_DRIVERS = False
+HAS_THERA_CLASS = False
+HAS_CPP_SKETCH = False
+HAS_FORECASTS = False
+
 # -----------------------------
 # Load filter options
 # -----------------------------
-states = fetch_distinct(
-    """
-SELECT DISTINCT state
-FROM dbo.sdud_analytics
-WHERE state <> 'XX'
-ORDER BY state
-"""
+# One grouped query over the KPI cube (a few hundred rows) replaces four DISTINCT
+# scans of the analytics table. The result is snapshotted to disk: a restart
+# serves the snapshot immediately while a background thread refreshes it, so the
+# server binds its port without waiting for the database.
+FILTER_OPTIONS_SNAPSHOT = os.getenv(
+    "FILTER_OPTIONS_SNAPSHOT",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "filter_options.json"),
 )
 
-years = fetch_distinct(
-    """
-SELECT DISTINCT [year]
-FROM dbo.sdud_analytics
-ORDER BY [year]
-"""
-)
+states, years, quarters, util_types = [], [], [], []
+DEFAULT_STATE = DEFAULT_YEAR = DEFAULT_QUARTER = DEFAULT_UTIL = None
+
+
+def apply_filter_options(opts: dict, source: str) -> None:
+    global states, years, quarters, util_types
+    global HAS_KPI_CUBE, HAS_TOP_DRIVERS, HAS_THERA_CLASS, HAS_CPP_SKETCH, HAS_FORECASTS
+    global DEFAULT_STATE, DEFAULT_YEAR, DEFAULT_QUARTER, DEFAULT_UTIL
+
+    states = list(opts.get("states", []))
+    years = [int(y) for y in opts.get("years", [])]
+    quarters = [int(q) for q in opts.get("quarters", [])]
+    util_types = list(opts.get("util_types", []))
+    HAS_KPI_CUBE = bool(opts.get("has_kpi_cube"))
+    HAS_TOP_DRIVERS = bool(opts.get("has_top_drivers"))
+    HAS_THERA_CLASS = bool(opts.get("has_thera_class"))
+    HAS_CPP_SKETCH = bool(opts.get("has_cpp_sketch"))
+    HAS_FORECASTS = bool(opts.get("has_forecasts"))
+
+    DEFAULT_STATE = states[0] if states else None
+    DEFAULT_YEAR = int(max(years)) if years else None
+    DEFAULT_QUARTER = int(max(quarters)) if quarters else None
+    DEFAULT_UTIL = util_types[0] if util_types else None
+
+    print(
+        f"[dashboard] options loaded ({source}) | states={len(states)} years={len(years)} "
+        f"quarters={len(quarters)} util_types={len(util_types)} kpi_cube={HAS_KPI_CUBE} "
+        f"top_drivers={HAS_TOP_DRIVERS} cpp_sketch={HAS_CPP_SKETCH} forecasts={HAS_FORECASTS}"
+    )
 
-quarters = fetch_distinct(
-    """
-SELECT DISTINCT quarter
-FROM dbo.sdud_analytics
-ORDER BY quarter
-"""
-)
 
-util_types = fetch_distinct(
-    """
-SELECT DISTINCT utilization_type
-FROM dbo.sdud_analytics
-ORDER BY utilization_type
+def load_filter_options_from_db() -> dict:
+    has_cube = table_exists("sdud_gold_kpi_cube")
+    dims = pd.read_sql(
+        text(
+            f"""
+SELECT state, {SQL.quote("year")}, quarter, utilization_type
+FROM {KPI_CUBE_TABLE if has_cube else queries.kpi_cube_fallback(SQL)}
+GROUP BY state, {SQL.quote("year")}, quarter, utilization_type;
 """
-)
+        ),
+        engine,
+    )
+    return {
+        "states": sorted(s for s in dims["state"].dropna().unique() if s != "XX"),
+        "years": sorted(int(y) for y in dims["year"].dropna().unique()),
+        "quarters": sorted(int(q) for q in dims["quarter"].dropna().unique()),
+        "util_types": sorted(dims["utilization_type"].dropna().unique()),
+        "has_kpi_cube": has_cube,
+        "has_top_drivers": table_exists("sdud_gold_top_drivers"),
+        "has_thera_class": column_exists("sdud_analytics", "thera_class"),
+        # Per-cell layout only (older loads kept one sketch per quarter)
+        "has_cpp_sketch": table_exists("sdud_gold_cpp_sketch") and column_exists("sdud_gold_cpp_sketch", "state"),
+        # Tables written before bootstrap intervals have no interval_method column
+        "has_forecasts": table_exists("sdud_gold_forecasts")
+        and column_exists("sdud_gold_forecasts", "interval_method"),
+    }
+
 
-DEFAULT_STATE = states[0] if states else None
-DEFAULT_YEAR = int(max(years)) if years else None
-DEFAULT_QUARTER = int(max(quarters)) if quarters else None
-DEFAULT_UTIL = util_types[0] if util_types else None
+def read_filter_options_snapshot() -> dict | None:
+    try:
+        with open(FILTER_OPTIONS_SNAPSHOT, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def write_filter_options_snapshot(opts: dict) -> None:
+    try:
+        os.makedirs(os.path.dirname(FILTER_OPTIONS_SNAPSHOT), exist_ok=True)
+        tmp = FILTER_OPTIONS_SNAPSHOT + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump({**opts, "saved_at": dt.datetime.now().isoformat(timespec="seconds")}, fh)
+        os.replace(tmp, FILTER_OPTIONS_SNAPSHOT)
+    except OSError as exc:
+        print(f"[dashboard] could not write options snapshot: {exc}")
+
+
+def reload_filter_options() -> None:
+    """Options and gold table checks from the database (raises if it doesn't answer)."""
+    opts = load_filter_options_from_db()
+    snapshot = read_filter_options_snapshot() or {}
+    if {k: snapshot.get(k) for k in opts} != opts:
+        write_filter_options_snapshot(opts)
+    apply_filter_options(opts, "database")
+
+
+def refresh_filter_options(retry_seconds: float = 5.0) -> None:
+    """Load options from the database, retrying until it answers."""
+    while True:
+        try:
+            reload_filter_options()
+            return
+        except Exception as exc:
+            print(f"[dashboard] database not ready for options ({exc.__class__.__name__}); retrying in {retry_seconds:.0f}s")
+            time.sleep(retry_seconds)
+
+
+def current_data_version() -> str | None:
+    try:
+        version = fetch_data_version()
+    except Exception:
+        return None
+    return None if version is None else str(version)
 
-print(f"[dashboard] options loaded | states={len(states)} years={len(years)} quarters={len(quarters)} util_types={len(util_types)}")
+
+# -----------------------------
+# In-process array cube
+# -----------------------------
+# The KPI table, state ranking and trend lines (state and national) are answered
+# from a NumPy copy of the KPI cube; SQL is left for row-level statements. The
+# first worker to see a data version builds the arrays into
+# ARRAY_CUBE_DIR/v-<version>/, and every worker memory-maps that directory
+# read-only. The data version is re-checked every DATA_VERSION_CHECK_SECONDS. ARRAY_CUBE_DIR="" disables the array cube.
+# Without a data version there is nothing to name or invalidate a saved cube by,
+# so each worker keeps its own in memory and rebuilds it every QUERY_CACHE_TTL.
+ARRAY_CUBE_DIR = os.getenv(
+    "ARRAY_CUBE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "kpi_cube"),
+)
+ARRAY_CUBE_KEYS = ("kpi_state", "kpi_nat", "trend_state", "trend_nat", "ranking")
+array_cube = None
+array_cube_built_at = float("-inf")
+
+
+def build_array_cube(version) -> ArrayCube:
+    t0 = time.perf_counter()
+    cells = pd.read_sql(text(queries.kpi_cube_cells_sql(KPI_CUBE_TABLE if HAS_KPI_CUBE else None, SQL)), engine)
+    cube = ArrayCube.from_frame(cells, version)
+    print(f"[dashboard] array cube built | cells={len(cells)} in {time.perf_counter() - t0:.2f}s")
+    return cube
+
+
+def refresh_array_cube() -> None:
+    """Map the array cube for the current data version, building it if no worker has yet."""
+    global array_cube, array_cube_built_at
+    version = current_data_version()
+    if version is None:
+        if array_cube is None or array_cube.data_version is not None or (
+            time.monotonic() - array_cube_built_at > query_cache.ttl_seconds
+        ):
+            array_cube = build_array_cube(None)
+            array_cube_built_at = time.monotonic()
+        return
+    if array_cube is not None and array_cube.data_version == version:
+        return
+
+    path = ArrayCube.version_dir(ARRAY_CUBE_DIR, version)
+    if not os.path.isdir(path):
+        os.makedirs(ARRAY_CUBE_DIR, exist_ok=True)
+        build_array_cube(version).save(path)
+
+    array_cube = ArrayCube.load(path)
+    print(
+        f"[dashboard] array cube mapped ({os.path.basename(path)}) | "
+        + " x ".join(f"{len(v)} {k}" for k, v in array_cube.dims.items())
+    )
+    for entry in os.listdir(ARRAY_CUBE_DIR):
+        # Earlier versions; workers still mapping them keep their pages
+        if entry.startswith("v-") and entry != os.path.basename(path):
+            shutil.rmtree(os.path.join(ARRAY_CUBE_DIR, entry), ignore_errors=True)
+
+
+def array_cube_results(filters: dict, keys) -> dict:
+    """Results for the cube-backed statements in `keys`, or {} without an array cube."""
+    cube = array_cube
+    if cube is None:
+        return {}
+    state, year, quarter, util_type = filters["state"], filters["year"], filters["quarter"], filters["util_type"]
+    out = {}
+    for key in keys:
+        if key == "kpi_state":
+            out[key] = cube.kpi(state, year, quarter, util_type)
+        elif key == "kpi_nat":
+            out[key] = cube.kpi(None, year, quarter, util_type)
+        elif key == "trend_state":
+            out[key] = cube.trend(state, year, util_type)
+        elif key == "trend_nat":
+            out[key] = cube.trend(None, year, util_type)
+        elif key == "ranking":
+            out[key] = cube.ranking(year, quarter, util_type)
+    return out
+
+
+def background_refresh() -> None:
+    """
+    Load options, start the model selection pool, then poll the data version
+    every DATA_VERSION_CHECK_SECONDS: a new load re-runs the gold table checks
+    (HAS_KPI_CUBE, HAS_FORECASTS, ...) and the options, and refreshes the array cube.
+    """
+    version = current_data_version()
+    refresh_filter_options()
+    try:
+        get_selection_pool()
+    except Exception as exc:
+        print(f"[dashboard] model selection pool failed to start ({exc.__class__.__name__}: {exc})")
+    interval_seconds = float(os.getenv("DATA_VERSION_CHECK_SECONDS", "30"))
+    while True:
+        latest = current_data_version()
+        if latest != version:
+            try:
+                reload_filter_options()
+                version = latest
+            except Exception as exc:
+                print(f"[dashboard] options reload failed ({exc.__class__.__name__}: {exc})")
+        if ARRAY_CUBE_DIR:
+            try:
+                refresh_array_cube()
+            except Exception as exc:
+                print(f"[dashboard] array cube refresh failed ({exc.__class__.__name__}: {exc})")
+        time.sleep(interval_seconds)
+
+
+_snapshot = read_filter_options_snapshot()
+if _snapshot:
+    apply_filter_options(_snapshot, "snapshot")
+threading.Thread(target=background_refresh, name="sdud-options", daemon=True).start()
 
 # -----------------------------
 # Dash UI
@@ -126,325 +517,357 @@ app = Dash(__name__)
 app.title = "SDUD Professional Dashboard"
 
 
-def kpi_card(title: str, value_id: str):
+@app.server.route("/_cache_stats")
+def cache_stats():
+    return {
+        **query_cache.stats(),
+        "artifacts": artifact_store.stats(),
+        "forecasts": forecast_cache.stats(),
+        "model_selections": selection_cache.stats(),
+    }
+
+
+@app.server.route("/_query_timings")
+def query_timings():
+    with _timings_lock:
+        return dict(last_query_timings)
+
+
+# Full-slice CSV/Parquet export, streamed straight from a server-side cursor
+register_export_route(app.server, engine, chunk_rows=int(os.getenv("EXPORT_CHUNK_ROWS", "50000")))
+
+
+# Tables (see tables.py): callbacks send raw numbers, formatted in the browser
+KPI_COLUMNS = [
+    column("scope", "Scope"),
+    column("total_reimbursed", "Total Reimbursed", MONEY0),
+    column("medicaid_reimbursed", "Medicaid Reimbursed", MONEY0),
+    column("prescriptions", "Prescriptions", NUM0),
+    column("units", "Units", NUM0),
+    column("cost_per_rx", "Cost per Rx", MONEY2),
+]
+TOP1_COLUMNS = [column("scope", "Scope"), column("top1_spend_share", "Top 1% Spend Share", PCT2)]
+RANKING_COLUMNS = [
+    column("rank", "Rank", NUM0),
+    column("state", "State"),
+    column("total_reimbursed", "Total Reimbursed", MONEY0),
+    column("national_share", "Share of National", PCT2),
+    column("medicaid_reimbursed", "Medicaid Reimbursed", MONEY0),
+    column("prescriptions", "Prescriptions", NUM0),
+    column("units", "Units", NUM0),
+    column("cost_per_rx", "Cost per Rx", MONEY2),
+]
+FORECAST_COLUMNS = [
+    column("period", "Quarter"),
+    column("value", "Forecast", MONEY0),
+    column("lower", "Lower (95%)", MONEY0),
+    column("upper", "Upper (95%)", MONEY0),
+]
+
+KPI_TABLE_STYLE = {"height": "130px", "overflowY": "auto"}
+# Applied through `running=` while the callback that owns a table is in flight
+KPI_TABLE_STYLE_RUNNING = {**KPI_TABLE_STYLE, "opacity": 0.35}
+
+
+def serve_layout():
+    # Built per page load so every browser session gets its own session_id
     return html.Div(
-        style={
-            "border": "1px solid #ddd",
-            "borderRadius": "14px",
-            "padding": "14px",
-            "minWidth": "180px",
-            "boxShadow": "0 1px 3px rgba(0,0,0,0.08)",
-        },
+        style={"fontFamily": "system-ui, -apple-system, Segoe UI, Roboto", "padding": "18px"},
         children=[
-            html.Div(title, style={"fontSize": "12px", "opacity": 0.75}),
-            html.Div(id=value_id, style={"fontSize": "22px", "fontWeight": "700", "marginTop": "6px"}),
-        ],
-    )
+            html.H2("State Drug Utilization Data (SDUD) — Professional Dashboard", style={"marginBottom": "6px"}),
+            html.Div("Source: dbo.sdud_analytics (non-suppressed rows only)", style={"opacity": 0.7, "marginBottom": "12px"}),
+
+            # Filters row
+            html.Div(
+                style={"display": "flex", "gap": "12px", "flexWrap": "wrap", "marginBottom": "10px"},
+                children=[
+                    html.Div(
+                        [
+                            html.Div("State"),
+                            dcc.Dropdown(
+                                options=[{"label": s, "value": s} for s in states],
+                                value=DEFAULT_STATE,
+                                clearable=False,
+                                id="state_dd",
+                                style={"minWidth": "220px"},
+                            ),
+                        ]
+                    ),
+                    html.Div(
+                        [
+                            html.Div("Year"),
+                            dcc.Dropdown(
+                                options=[{"label": str(y), "value": int(y)} for y in years],
+                                value=DEFAULT_YEAR,
+                                clearable=False,
+                                id="year_dd",
+                                style={"minWidth": "160px"},
+                            ),
+                        ]
+                    ),
+                    html.Div(
+                        [
+                            html.Div("Quarter"),
+                            dcc.Dropdown(
+                                options=[{"label": f"Q{q}", "value": int(q)} for q in quarters],
+                                value=DEFAULT_QUARTER,
+                                clearable=False,
+                                id="quarter_dd",
+                                style={"minWidth": "160px"},
+                            ),
+                        ]
+                    ),
+                    html.Div(
+                        [
+                            html.Div("Utilization Type"),
+                            dcc.Dropdown(
+                                options=[{"label": u, "value": u} for u in util_types],
+                                value=DEFAULT_UTIL,
+                                clearable=False,
+                                id="util_dd",
+                                style={"minWidth": "200px"},
+                            ),
+                        ]
+                    ),
+                    html.Div(
+                        [
+                            html.Div("Scope"),
+                            dcc.RadioItems(
+                                options=[
+                                    {"label": "State only", "value": "state"},
+                                    {"label": "State vs National", "value": "state_vs_national"},
+                                ],
+                                value="state",
+                                id="scope_toggle",
+                                inline=True,
+                                style={"marginTop": "6px"},
+                            ),
+                        ]
+                    ),
+                ],
+            ),
 
+            # Professional download dropdown row
+            html.Div(
+                style={"display": "flex", "gap": "10px", "flexWrap": "wrap", "alignItems": "center", "marginBottom": "10px"},
+                children=[
+                    dcc.Dropdown(
+                        id="download_selector",
+                        options=[
+                            {"label": "KPIs (CSV)", "value": "kpi_csv"},
+                            {"label": "Filtered Data (CSV) — top 5000 rows", "value": "data_csv"},
+                            {"label": "Trend Chart (PNG)", "value": "trend_png"},
+                            {"label": "Top Drivers Chart (PNG)", "value": "drivers_png"},
+                            {"label": "Cost Distribution (PNG)", "value": "cost_png"},
+                            {"label": "Forecast Chart (PNG)", "value": "forecast_png"},
+                        ],
+                        placeholder="Download…",
+                        clearable=True,
+                        style={"width": "360px"},
+                    ),
+                    html.Button("Download", id="download_btn", n_clicks=0),
+                    dcc.Download(id="download_target"),
+                    html.Span("Full filtered slice:", style={"fontSize": "12px", "opacity": 0.75, "marginLeft": "8px"}),
+                    html.A("CSV (gzip)", id="export_csv_link", href="", target="_blank"),
+                    html.A(
+                        "Parquet (zstd)",
+                        id="export_parquet_link",
+                        href="",
+                        target="_blank",
+                        style={} if HAS_PYARROW else {"display": "none"},
+                    ),
+                ],
+            ),
 
-app.layout = html.Div(
-    style={"fontFamily": "system-ui, -apple-system, Segoe UI, Roboto", "padding": "18px"},
-    children=[
-        html.H2("State Drug Utilization Data (SDUD) — Professional Dashboard", style={"marginBottom": "6px"}),
-        html.Div("Source: dbo.sdud_analytics (non-suppressed rows only)", style={"opacity": 0.7, "marginBottom": "12px"}),
-
-        # Filters row
-        html.Div(
-            style={"display": "flex", "gap": "12px", "flexWrap": "wrap", "marginBottom": "10px"},
-            children=[
-                html.Div(
-                    [
-                        html.Div("State"),
-                        dcc.Dropdown(
-                            options=[{"label": s, "value": s} for s in states],
-                            value=DEFAULT_STATE,
-                            clearable=False,
-                            id="state_dd",
-                            style={"minWidth": "220px"},
-                        ),
-                    ]
-                ),
-                html.Div(
-                    [
-                        html.Div("Year"),
-                        dcc.Dropdown(
-                            options=[{"label": str(y), "value": int(y)} for y in years],
-                            value=DEFAULT_YEAR,
-                            clearable=False,
-                            id="year_dd",
-                            style={"minWidth": "160px"},
-                        ),
-                    ]
-                ),
-                html.Div(
-                    [
-                        html.Div("Quarter"),
-                        dcc.Dropdown(
-                            options=[{"label": f"Q{q}", "value": int(q)} for q in quarters],
-                            value=DEFAULT_QUARTER,
-                            clearable=False,
-                            id="quarter_dd",
-                            style={"minWidth": "160px"},
-                        ),
-                    ]
-                ),
-                html.Div(
-                    [
-                        html.Div("Utilization Type"),
-                        dcc.Dropdown(
-                            options=[{"label": u, "value": u} for u in util_types],
-                            value=DEFAULT_UTIL,
-                            clearable=False,
-                            id="util_dd",
-                            style={"minWidth": "200px"},
-                        ),
-                    ]
-                ),
-                html.Div(
-                    [
-                        html.Div("Scope"),
-                        dcc.RadioItems(
-                            options=[
-                                {"label": "State only", "value": "state"},
-                                {"label": "State vs National", "value": "state_vs_national"},
-                            ],
-                            value="state",
-                            id="scope_toggle",
-                            inline=True,
-                            style={"marginTop": "6px"},
-                        ),
-                    ]
-                ),
-            ],
-        ),
+            # KPI row
+            html.Div(
+                style={"display": "flex", "gap": "12px", "flexWrap": "wrap", "marginBottom": "8px"},
+                children=[
+                    html.Div(data_table("kpi_table", KPI_COLUMNS, height="130px"), style={"flex": "5 1 720px"}),
+                    html.Div(data_table("kpi_top1_table", TOP1_COLUMNS, height="130px"), style={"flex": "1 1 260px"}),
+                ],
+            ),
 
-        # Professional download dropdown row
-        html.Div(
-            style={"display": "flex", "gap": "10px", "flexWrap": "wrap", "alignItems": "center", "marginBottom": "10px"},
-            children=[
-                dcc.Dropdown(
-                    id="download_selector",
-                    options=[
-                        {"label": "KPIs (CSV)", "value": "kpi_csv"},
-                        {"label": "Filtered Data (CSV) — top 5000 rows", "value": "data_csv"},
-                        {"label": "Trend Chart (PNG)", "value": "trend_png"},
-                        {"label": "Top Drivers Chart (PNG)", "value": "drivers_png"},
-                        {"label": "Cost Distribution (PNG)", "value": "cost_png"},
-                        {"label": "Forecast Chart (PNG)", "value": "forecast_png"},
-                    ],
-                    placeholder="Download…",
-                    clearable=True,
-                    style={"width": "360px"},
-                ),
-                html.Button("Download", id="download_btn", n_clicks=0),
-                dcc.Download(id="download_target"),
-            ],
-        ),
+            html.Div("Suppressed rows excluded per CMS privacy rules", style={"opacity": 0.65, "fontSize": "12px"}),
+
+            dcc.Tabs(
+                id="tabs",
+                value="tab_exec",
+                children=[
+                    dcc.Tab(
+                        label="Executive Dashboard",
+                        value="tab_exec",
+                        children=[
+                            html.Div(style={"height": "10px"}),
+                            dcc.Loading(dcc.Graph(id="trend_graph"), delay_show=150),
+                            html.Div(
+                                style={"display": "grid", "gridTemplateColumns": "1fr 1fr", "gap": "14px"},
+                                children=[
+                                    dcc.Loading(dcc.Graph(id="top_drugs_graph"), delay_show=150),
+                                    dcc.Loading(dcc.Graph(id="cpp_graph"), delay_show=150),
+                                ],
+                            ),
+                            html.H4("State ranking", style={"margin": "12px 0 6px"}),
+                            data_table("ranking_table", RANKING_COLUMNS, sort_action="native"),
+                        ],
+                    ),
+                    dcc.Tab(
+                        label="Forecasting",
+                        value="tab_forecast",
+                        children=[
+                            html.Div(style={"height": "12px"}),
+                            html.Div(
+                                style={"display": "flex", "gap": "16px", "flexWrap": "wrap", "alignItems": "center"},
+                                children=[
+                                    html.Div(
+                                        [
+                                            html.Div("Forecast horizon (quarters)"),
+                                            dcc.Dropdown(
+                                                id="fc_horizon",
+                                                options=[{"label": str(n), "value": n} for n in [4, 8, 12]],
+                                                value=4,
+                                                clearable=False,
+                                                style={"minWidth": "220px"},
+                                            ),
+                                        ]
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Div("Scenario: spend multiplier"),
+                                            dcc.Slider(
+                                                id="fc_multiplier",
+                                                min=0.80,
+                                                max=1.30,
+                                                step=0.01,
+                                                value=1.00,
+                                                marks={0.8: "0.80", 1.0: "1.00", 1.2: "1.20", 1.3: "1.30"},
+                                            ),
+                                            html.Div(id="fc_multiplier_label", style={"fontSize": "12px", "opacity": 0.75}),
+                                        ],
+                                        style={"minWidth": "420px"},
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Div("Model"),
+                                            dcc.Dropdown(
+                                                id="fc_model",
+                                                options=[
+                                                    {"label": "ETS (Holt-Winters)", "value": "ets"},
+                                                    {"label": "Naive (last value)", "value": "naive"},
+                                                    {"label": "Auto (best backtest)", "value": AUTO},
+                                                ],
+                                                value="ets" if HAS_STATSMODELS else "naive",
+                                                clearable=False,
+                                                style={"minWidth": "220px"},
+                                            ),
+                                        ]
+                                    ),
+                                    html.Div(
+                                        [
+                                            html.Div("Interval"),
+                                            dcc.Dropdown(
+                                                id="fc_interval",
+                                                options=[
+                                                    {"label": "Normal (±1.96σ)", "value": "normal"},
+                                                    {"label": "Bootstrap (80% / 95% bands)", "value": "bootstrap"},
+                                                ],
+                                                value="normal",
+                                                clearable=False,
+                                                style={"minWidth": "240px"},
+                                            ),
+                                        ]
+                                    ),
+                                ],
+                            ),
+                            html.Div(style={"height": "10px"}),
+                            dcc.Graph(id="forecast_graph"),
+                            html.Div(
+                                data_table("forecast_table", FORECAST_COLUMNS, height="280px"),
+                                style={"maxWidth": "820px"},
+                            ),
+                            html.Div(
+                                id="forecast_note",
+                                style={"marginTop": "8px", "fontSize": "12px", "opacity": 0.75},
+                            ),
+                        ],
+                    ),
+                ],
+            ),
 
-        # KPI row
-        html.Div(
-            style={"display": "flex", "gap": "12px", "flexWrap": "wrap", "marginBottom": "8px"},
-            children=[
-                kpi_card("Total Reimbursed", "kpi_total"),
-                kpi_card("Medicaid Reimbursed", "kpi_medicaid"),
-                kpi_card("Prescriptions", "kpi_rx"),
-                kpi_card("Units", "kpi_units"),
-                kpi_card("Cost per Rx", "kpi_cpp"),
-                kpi_card("Top 1% Spend Share", "kpi_top1pc"),
-            ],
-        ),
+            # Per-page-load id: lets the server drop superseded executive requests
+            dcc.Store(id="session_id", data=uuid.uuid4().hex),
+
+            # Stores for downloads
+            dcc.Store(id="store_kpis"),
+            dcc.Store(id="store_kpi_top1"),
+            dcc.Store(id="store_fig_trend"),
+            dcc.Store(id="store_fig_top"),
+            dcc.Store(id="store_fig_cpp"),
+            dcc.Store(id="store_fig_fc"),
+            # Fitted forecast (MAX_HORIZON quarters, multiplier 1); rendered by assets/forecast.js
+            dcc.Store(id="store_forecast"),
+        ],
+    )
 
-        html.Div("Suppressed rows excluded per CMS privacy rules", style={"opacity": 0.65, "fontSize": "12px"}),
-
-        dcc.Tabs(
-            id="tabs",
-            value="tab_exec",
-            children=[
-                dcc.Tab(
-                    label="Executive Dashboard",
-                    value="tab_exec",
-                    children=[
-                        html.Div(style={"height": "10px"}),
-                        dcc.Graph(id="trend_graph"),
-                        html.Div(
-                            style={"display": "grid", "gridTemplateColumns": "1fr 1fr", "gap": "14px"},
-                            children=[
-                                dcc.Graph(id="top_drugs_graph"),
-                                dcc.Graph(id="cpp_graph"),
-                            ],
-                        ),
-                    ],
-                ),
-                dcc.Tab(
-                    label="Forecasting",
-                    value="tab_forecast",
-                    children=[
-                        html.Div(style={"height": "12px"}),
-                        html.Div(
-                            style={"display": "flex", "gap": "16px", "flexWrap": "wrap", "alignItems": "center"},
-                            children=[
-                                html.Div(
-                                    [
-                                        html.Div("Forecast horizon (quarters)"),
-                                        dcc.Dropdown(
-                                            id="fc_horizon",
-                                            options=[{"label": str(n), "value": n} for n in [4, 8, 12]],
-                                            value=4,
-                                            clearable=False,
-                                            style={"minWidth": "220px"},
-                                        ),
-                                    ]
-                                ),
-                                html.Div(
-                                    [
-                                        html.Div("Scenario: spend multiplier"),
-                                        dcc.Slider(
-                                            id="fc_multiplier",
-                                            min=0.80,
-                                            max=1.30,
-                                            step=0.01,
-                                            value=1.00,
-                                            marks={0.8: "0.80", 1.0: "1.00", 1.2: "1.20", 1.3: "1.30"},
-                                        ),
-                                        html.Div(id="fc_multiplier_label", style={"fontSize": "12px", "opacity": 0.75}),
-                                    ],
-                                    style={"minWidth": "420px"},
-                                ),
-                                html.Div(
-                                    [
-                                        html.Div("Model"),
-                                        dcc.Dropdown(
-                                            id="fc_model",
-                                            options=[
-                                                {"label": "ETS (Holt-Winters)", "value": "ets"},
-                                                {"label": "Naive (last value)", "value": "naive"},
-                                            ],
-                                            value="ets" if HAS_STATSMODELS else "naive",
-                                            clearable=False,
-                                            style={"minWidth": "220px"},
-                                        ),
-                                    ]
-                                ),
-                            ],
-                        ),
-                        html.Div(style={"height": "10px"}),
-                        dcc.Graph(id="forecast_graph"),
-                        html.Div(id="forecast_table"),
-                        html.Div(
-                            id="forecast_note",
-                            style={"marginTop": "8px", "fontSize": "12px", "opacity": 0.75},
-                        ),
-                    ],
-                ),
-            ],
-        ),
 
-        # Stores for downloads
-        dcc.Store(id="store_kpis"),
-        dcc.Store(id="store_filtered_head"),
-        dcc.Store(id="store_fig_trend"),
-        dcc.Store(id="store_fig_top"),
-        dcc.Store(id="store_fig_cpp"),
-        dcc.Store(id="store_fig_fc"),
-    ],
-)
+app.layout = serve_layout
 
 
 # -----------------------------
-# Executive callback (KPIs + charts)
+# Executive tab callbacks (KPIs + charts)
 # -----------------------------
-@app.callback(
-    Output("kpi_total", "children"),
-    Output("kpi_medicaid", "children"),
-    Output("kpi_rx", "children"),
-    Output("kpi_units", "children"),
-    Output("kpi_cpp", "children"),
-    Output("kpi_top1pc", "children"),
-    Output("trend_graph", "figure"),
-    Output("top_drugs_graph", "figure"),
-    Output("cpp_graph", "figure"),
-    Output("store_kpis", "data"),
-    Output("store_filtered_head", "data"),
-    Output("store_fig_trend", "data"),
-    Output("store_fig_top", "data"),
-    Output("store_fig_cpp", "data"),
-    Input("state_dd", "value"),
-    Input("year_dd", "value"),
-    Input("quarter_dd", "value"),
-    Input("util_dd", "value"),
-    Input("scope_toggle", "value"),
-)
-def update_executive(state, year, quarter, util_type, scope):
-    empty = px.bar(title="No data")
-    if not (state and year and quarter and util_type and scope):
-        return "—", "—", "—", "—", "—", "—", empty, empty, empty, {}, [], {}, {}, {}
-
-    params_state = {"state": state, "year": int(year), "quarter": int(quarter), "util": util_type}
-    params_nat = {"year": int(year), "quarter": int(quarter), "util": util_type}
-
-    # KPI
-    kpi_state_sql = """
-SELECT
-  SUM(total_amount_reimbursed) AS total_reimbursed,
-  SUM(medicaid_amount_reimbursed) AS medicaid_reimbursed,
-  SUM(number_of_prescriptions) AS prescriptions,
-  SUM(units_reimbursed) AS units
-FROM dbo.sdud_analytics
-WHERE state = :state AND [year] = :year AND quarter = :quarter AND utilization_type = :util;
-"""
-    kpi_nat_sql = """
-SELECT
-  SUM(total_amount_reimbursed) AS total_reimbursed,
-  SUM(medicaid_amount_reimbursed) AS medicaid_reimbursed,
-  SUM(number_of_prescriptions) AS prescriptions,
-  SUM(units_reimbursed) AS units
-FROM dbo.sdud_analytics
-WHERE state <> 'XX' AND [year] = :year AND quarter = :quarter AND utilization_type = :util;
-"""
+def executive_statements(state, year, quarter, util_type, scope) -> dict:
+    return queries.executive_statements(
+        state,
+        year,
+        quarter,
+        util_type,
+        scope,
+        kpi_cube=KPI_CUBE_TABLE if HAS_KPI_CUBE else None,
+        top_drivers_table=TOP_DRIVERS_TABLE if HAS_TOP_DRIVERS else None,
+        thera_class="thera_class" if HAS_THERA_CLASS else None,
+        cpp_sketch_table=CPP_SKETCH_TABLE if HAS_CPP_SKETCH else None,
+        dialect=SQL,
+    )
 
-    with engine.begin() as conn:
-        k = conn.execute(text(kpi_state_sql), params_state).mappings().first()
 
-    total = float(k["total_reimbursed"] or 0.0)
-    medicaid = float(k["medicaid_reimbursed"] or 0.0)
-    rx = float(k["prescriptions"] or 0.0)
-    units = float(k["units"] or 0.0)
-    cpp = (total / rx) if rx > 0 else 0.0
+def executive_results(label: str, filters: dict, keys, is_current=None) -> dict:
+    """
+    Run the subset `keys` of the executive statements for `filters`
+    (state, year, quarter, util_type, scope). National keys are skipped
+    automatically in State-only scope.
+    """
+    statements = executive_statements(**filters)
+    keys = [k for k in keys if k in statements]
 
-    kpi_total_txt = fmt_money0(total)
-    kpi_medicaid_txt = fmt_money0(medicaid)
-    kpi_rx_txt = fmt_num0(rx)
-    kpi_units_txt = fmt_num0(units)
+    t0 = time.perf_counter()
+    results = array_cube_results(filters, [k for k in keys if k in ARRAY_CUBE_KEYS])
+    if results:
+        with _timings_lock:
+            last_query_timings[f"{label}:array_cube"] = {
+                "wall_us": round((time.perf_counter() - t0) * 1e6, 1),
+                "keys": sorted(results),
+            }
+    remaining = {k: statements[k] for k in keys if k not in results}
+    if remaining:
+        results.update(run_statements(label, remaining, is_current))
+    return results
+
+
+def filters_ready(state, year, quarter, util_type, scope) -> bool:
+    return bool(state and year and quarter and util_type and scope)
 
-    kpi_cpp_txt = f"${cpp:,.2f}"
-    if scope == "state_vs_national":
-        with engine.begin() as conn:
-            kn = conn.execute(text(kpi_nat_sql), params_nat).mappings().first()
-        nat_total = float(kn["total_reimbursed"] or 0.0)
-        nat_rx = float(kn["prescriptions"] or 0.0)
-        nat_cpp = (nat_total / nat_rx) if nat_rx > 0 else 0.0
-        kpi_cpp_txt = f"${cpp:,.2f} (Nat ${nat_cpp:,.2f})"
+
+def build_trend_figure(state, year, quarter, util_type, scope, is_current=None):
+    filters = dict(state=state, year=year, quarter=quarter, util_type=util_type, scope=scope)
+    res = executive_results("trend", filters, ["trend_state", "trend_nat"], is_current)
 
     # Trend
-    trend_state_sql = """
-SELECT year_quarter, quarter, SUM(total_amount_reimbursed) AS total_reimbursed
-FROM dbo.sdud_analytics
-WHERE state = :state AND [year] = :year AND utilization_type = :util
-GROUP BY year_quarter, quarter
-ORDER BY quarter;
-"""
-    trend_nat_sql = """
-SELECT year_quarter, quarter, SUM(total_amount_reimbursed) AS total_reimbursed
-FROM dbo.sdud_analytics
-WHERE state <> 'XX' AND [year] = :year AND utilization_type = :util
-GROUP BY year_quarter, quarter
-ORDER BY quarter;
-"""
-    trend_state = pd.read_sql(text(trend_state_sql), engine, params={"state": state, "year": int(year), "util": util_type})
+    trend_state = res["trend_state"]
     trend_state["scope"] = "State"
 
     if scope == "state_vs_national":
-        trend_nat = pd.read_sql(text(trend_nat_sql), engine, params={"year": int(year), "util": util_type})
+        trend_nat = res["trend_nat"]
         trend_nat["scope"] = "National"
         trend_df = pd.concat([trend_state, trend_nat], ignore_index=True)
         trend_fig = px.line(
@@ -466,30 +889,19 @@ ORDER BY quarter;
     trend_fig.update_layout(margin=dict(l=20, r=20, t=50, b=20))
     trend_fig.update_yaxes(tickformat="$,")
 
-    # Top drivers (first token proxy)
-    top_state_sql = """
-SELECT TOP 15
-  LEFT(product_name_norm, CHARINDEX(' ', product_name_norm + ' ') - 1) AS thera_class,
-  SUM(total_amount_reimbursed) AS total_reimbursed
-FROM dbo.sdud_analytics
-WHERE state = :state AND [year] = :year AND quarter = :quarter AND utilization_type = :util
-GROUP BY LEFT(product_name_norm, CHARINDEX(' ', product_name_norm + ' ') - 1)
-ORDER BY total_reimbursed DESC;
-"""
-    top_nat_sql = """
-SELECT TOP 15
-  LEFT(product_name_norm, CHARINDEX(' ', product_name_norm + ' ') - 1) AS thera_class,
-  SUM(total_amount_reimbursed) AS total_reimbursed
-FROM dbo.sdud_analytics
-WHERE state <> 'XX' AND [year] = :year AND quarter = :quarter AND utilization_type = :util
-GROUP BY LEFT(product_name_norm, CHARINDEX(' ', product_name_norm + ' ') - 1)
-ORDER BY total_reimbursed DESC;
-"""
-    top_state = pd.read_sql(text(top_state_sql), engine, params=params_state)
+    return trend_fig
+
+
+def build_top_drivers_figure(state, year, quarter, util_type, scope, is_current=None):
+    filters = dict(state=state, year=year, quarter=quarter, util_type=util_type, scope=scope)
+    res = executive_results("top_drivers", filters, ["top_state", "top_nat"], is_current)
+
+    # Top drivers
+    top_state = res["top_state"]
     top_state["scope"] = "State"
 
     if scope == "state_vs_national":
-        top_nat = pd.read_sql(text(top_nat_sql), engine, params=params_nat)
+        top_nat = res["top_nat"]
         top_nat["scope"] = "National"
         top_df = pd.concat([top_state, top_nat], ignore_index=True)
         order = (
@@ -520,260 +932,380 @@ ORDER BY total_reimbursed DESC;
     top_fig.update_layout(margin=dict(l=20, r=20, t=50, b=20), yaxis_title="")
     top_fig.update_xaxes(tickformat="$,")
 
-    # Cost per Rx distribution + top 1% spend share
-    cpp_state_sql = """
-SELECT
-  (total_amount_reimbursed / NULLIF(number_of_prescriptions, 0)) AS cost_per_rx,
-  number_of_prescriptions,
-  total_amount_reimbursed
-FROM dbo.sdud_analytics
-WHERE state = :state AND [year] = :year AND quarter = :quarter AND utilization_type = :util
-  AND number_of_prescriptions > 0 AND total_amount_reimbursed IS NOT NULL;
-"""
-    cpp_nat_sql = """
-SELECT
-  (total_amount_reimbursed / NULLIF(number_of_prescriptions, 0)) AS cost_per_rx,
-  number_of_prescriptions,
-  total_amount_reimbursed
-FROM dbo.sdud_analytics
-WHERE state <> 'XX' AND [year] = :year AND quarter = :quarter AND utilization_type = :util
-  AND number_of_prescriptions > 0 AND total_amount_reimbursed IS NOT NULL;
-"""
+    return top_fig
 
-    def top1_spend_share(df_in: pd.DataFrame) -> float:
-        if df_in is None or df_in.empty:
-            return 0.0
-        dfc = df_in.dropna().copy()
-        dfc = dfc[dfc["number_of_prescriptions"] > 0]
-        if dfc.empty:
-            return 0.0
-
-        dfc = dfc.sort_values("cost_per_rx", ascending=False)
-        total_rx = float(dfc["number_of_prescriptions"].sum())
-        total_spend = float(dfc["total_amount_reimbursed"].sum())
-        if total_rx <= 0 or total_spend <= 0:
-            return 0.0
-
-        threshold = total_rx * 0.01
-        cum_rx = 0.0
-        top_spend = 0.0
-
-        for _, r in dfc.iterrows():
-            rx_i = float(r["number_of_prescriptions"])
-            cpp_i = float(r["cost_per_rx"])
-            if rx_i <= 0:
-                continue
-            if cum_rx + rx_i <= threshold:
-                top_spend += cpp_i * rx_i
-                cum_rx += rx_i
-            else:
-                remaining = threshold - cum_rx
-                if remaining > 0:
-                    top_spend += cpp_i * remaining
-                break
-
-        return top_spend / total_spend
-
-    cpp_state = pd.read_sql(text(cpp_state_sql), engine, params=params_state).dropna()
-    cpp_state["scope"] = "State"
-    state_share = top1_spend_share(cpp_state)
-    kpi_top1_txt = f"{state_share:.2%}" if state_share > 0 else "—"
 
+def sketch_histogram(sketches: pd.DataFrame) -> pd.DataFrame:
+    """
+    Same frame as the cpp_hist statement (scope, bin, x_max, n), from per-cell
+    sketches: cells are merged per scope and the p99 cap is taken over both
+    scopes, as the SQL histogram does over the union of their rows.
+    """
+    cells = {}
+    for scope, raw in zip(sketches["scope"], sketches["sketch"]):
+        cells.setdefault(scope, []).append(QuantileSketch.from_dict(json.loads(raw)))
+    # Merged at the accuracy the cells were written with
+    merged = {scope: QuantileSketch.merge_all(parts) for scope, parts in cells.items()}
+    both = QuantileSketch.merge_all(merged.values())
+    x_max = both.quantile(0.99) if both.count else 0.0
+    rows = [
+        {"scope": scope, "bin": i, "x_max": x_max, "n": int(n)}
+        for scope, sketch in sorted(merged.items())
+        for i, n in enumerate(sketch.histogram(CPP_NBINS, x_max))
+        if n
+    ]
+    return pd.DataFrame(rows, columns=["scope", "bin", "x_max", "n"])
+
+
+def build_cost_distribution(state, year, quarter, util_type, scope, is_current=None):
+    """Returns (figure, {"State": top-1% spend share[, "National": ...]})."""
+    filters = dict(state=state, year=year, quarter=quarter, util_type=util_type, scope=scope)
+    res = executive_results(
+        "cost_distribution", filters, ["cpp_sketches", "cpp_hist", "share_state", "share_nat"], is_current
+    )
+
+    # Cost per Rx distribution + top 1% spend share
+    shares = {"State": top1_spend_share_head(res["share_state"])}
     if scope == "state_vs_national":
-        cpp_nat = pd.read_sql(text(cpp_nat_sql), engine, params=params_nat).dropna()
-        cpp_nat["scope"] = "National"
-        nat_share = top1_spend_share(cpp_nat)
-        kpi_top1_txt = f"{state_share:.2%} (Nat {nat_share:.2%})"
-        cpp_df = pd.concat([cpp_state, cpp_nat], ignore_index=True)
-    else:
-        cpp_df = cpp_state
+        shares["National"] = top1_spend_share_head(res["share_nat"])
+
+    hist_df = sketch_histogram(res["cpp_sketches"]) if "cpp_sketches" in res else res["cpp_hist"]
+    x_max = float(hist_df["x_max"].iloc[0]) if len(hist_df) else 0.0
+    bin_width = (x_max / CPP_NBINS) if x_max > 0 else 1.0
+    hist_df["cost_per_rx"] = (hist_df["bin"].astype(float) + 0.5) * bin_width
+    hist_df = hist_df.rename(columns={"n": "count"})
+
+    cpp_fig = px.bar(
+        hist_df,
+        x="cost_per_rx",
+        y="count",
+        color="scope" if scope == "state_vs_national" else None,
+        title=f"Cost per Prescription Distribution — {state} {year}Q{quarter}",
+        opacity=0.6 if scope == "state_vs_national" else None,
+    )
+    cpp_fig.update_traces(width=bin_width)
+    cpp_fig.update_layout(barmode="overlay", bargap=0, margin=dict(l=20, r=20, t=50, b=20))
+    cpp_fig.update_xaxes(range=[0, x_max if x_max > 0 else 1], tickformat="$,")
 
-    if len(cpp_df) > 250000:
-        cpp_df = cpp_df.sample(250000, random_state=42)
+    return cpp_fig, shares
 
-    if scope == "state_vs_national":
-        cpp_fig = px.histogram(
-            cpp_df,
-            x="cost_per_rx",
-            color="scope",
-            nbins=60,
-            title=f"Cost per Prescription Distribution — {state} {year}Q{quarter}",
-            opacity=0.6,
-        )
-        cpp_fig.update_layout(barmode="overlay")
-    else:
-        cpp_fig = px.histogram(
-            cpp_df,
-            x="cost_per_rx",
-            nbins=60,
-            title=f"Cost per Prescription Distribution — {state} {year}Q{quarter}",
-        )
 
-    cpp_fig.update_layout(margin=dict(l=20, r=20, t=50, b=20))
-    if len(cpp_df):
-        cpp_fig.update_xaxes(range=[0, float(cpp_df["cost_per_rx"].quantile(0.99))], tickformat="$,")
-    else:
-        cpp_fig.update_xaxes(range=[0, 1], tickformat="$,")
+def load_filtered_head(state, year, quarter, util_type, scope="state") -> pd.DataFrame:
+    filters = dict(state=state, year=year, quarter=quarter, util_type=util_type, scope=scope)
+    return executive_results("filtered_head", filters, ["head"])["head"]
 
-    # Filtered data sample (TOP 5000)
-    filtered_head_sql = """
-SELECT TOP 5000 *
-FROM dbo.sdud_analytics
-WHERE state = :state AND [year] = :year AND quarter = :quarter AND utilization_type = :util;
-"""
-    head_df = pd.read_sql(text(filtered_head_sql), engine, params=params_state)
+
+# Each block of the executive tab has its own callback, so the cheap cube-backed
+# KPI table paints first and the heavier charts fill in as their queries finish.
+# Figures for download stay server-side in `artifact_store`; the browser stores
+# only a handle (session, artifact name, filters).
+@app.callback(
+    Output("kpi_table", "data"),
+    Output("store_kpis", "data"),
+    Input("state_dd", "value"),
+    Input("year_dd", "value"),
+    Input("quarter_dd", "value"),
+    Input("util_dd", "value"),
+    Input("scope_toggle", "value"),
+    State("session_id", "data"),
+    running=[(Output("kpi_table", "style_table"), KPI_TABLE_STYLE_RUNNING, KPI_TABLE_STYLE)],
+)
+def update_kpis(state, year, quarter, util_type, scope, session_id):
+    if not filters_ready(state, year, quarter, util_type, scope):
+        return [], {}
+
+    filters = dict(state=state, year=year, quarter=quarter, util_type=util_type, scope=scope)
+    is_current = request_tracker.begin(session_id, "kpis")
+    res = executive_results("kpis", filters, ["kpi_state", "kpi_nat"], is_current)
+
+    # KPI: one row per scope
+    rows = []
+    for label, key in [(state, "kpi_state"), ("National", "kpi_nat")]:
+        if key not in res:
+            continue
+        k = res[key]
+        total = float(k.get("total_reimbursed") or 0.0)
+        rx = float(k.get("prescriptions") or 0.0)
+        rows.append(
+            {
+                "scope": label,
+                "total_reimbursed": total,
+                "medicaid_reimbursed": float(k.get("medicaid_reimbursed") or 0.0),
+                "prescriptions": rx,
+                "units": float(k.get("units") or 0.0),
+                "cost_per_rx": (total / rx) if rx > 0 else 0.0,
+            }
+        )
 
     kpis_payload = {
         "state": state,
         "year": int(year),
         "quarter": int(quarter),
         "utilization_type": util_type,
-        "total_reimbursed": total,
-        "medicaid_reimbursed": medicaid,
-        "prescriptions": rx,
-        "units": units,
-        "cost_per_rx": cpp,
-        "top1_spend_share": state_share,
+        **{k: v for k, v in rows[0].items() if k != "scope"},
         "as_of": dt.datetime.now().isoformat(timespec="seconds"),
     }
 
-    return (
-        kpi_total_txt,
-        kpi_medicaid_txt,
-        kpi_rx_txt,
-        kpi_units_txt,
-        kpi_cpp_txt,
-        kpi_top1_txt,
-        trend_fig,
-        top_fig,
-        cpp_fig,
-        kpis_payload,
-        head_df.to_dict("records"),
-        trend_fig.to_dict(),
-        top_fig.to_dict(),
-        cpp_fig.to_dict(),
-    )
+    return rows, kpis_payload
 
 
-# -----------------------------
-# Forecast tab callback
-# -----------------------------
 @app.callback(
-    Output("forecast_graph", "figure"),
-    Output("forecast_table", "children"),
-    Output("forecast_note", "children"),
-    Output("fc_multiplier_label", "children"),
-    Output("store_fig_fc", "data"),
+    Output("trend_graph", "figure"),
+    Output("store_fig_trend", "data"),
     Input("state_dd", "value"),
+    Input("year_dd", "value"),
+    Input("quarter_dd", "value"),
     Input("util_dd", "value"),
     Input("scope_toggle", "value"),
-    Input("fc_horizon", "value"),
-    Input("fc_multiplier", "value"),
-    Input("fc_model", "value"),
+    State("session_id", "data"),
 )
-def update_forecast(state, util_type, scope, horizon, multiplier, model_name):
-    empty = px.line(title="No forecast data")
-    if not (state and util_type and horizon and multiplier and model_name and scope):
-        return empty, "—", "", "", {}
-
-    scope_note = "Forecast uses State series."
-
-    ts_sql = """
-SELECT
-  [year],
-  quarter,
-  MIN(year_quarter) AS year_quarter,
-  SUM(total_amount_reimbursed) AS total_reimbursed
-FROM dbo.sdud_analytics
-WHERE state = :state AND utilization_type = :util
-GROUP BY [year], quarter
-ORDER BY [year], quarter;
-"""
-    ts = pd.read_sql(text(ts_sql), engine, params={"state": state, "util": util_type})
+def update_trend(state, year, quarter, util_type, scope, session_id):
+    if not filters_ready(state, year, quarter, util_type, scope):
+        return px.line(title="No data"), {}
+
+    filters = dict(state=state, year=year, quarter=quarter, util_type=util_type, scope=scope)
+    fig = build_trend_figure(**filters, is_current=request_tracker.begin(session_id, "trend"))
+    return fig, artifact_store.put(session_id, "trend", filters, fig)
+
+
+@app.callback(
+    Output("top_drugs_graph", "figure"),
+    Output("store_fig_top", "data"),
+    Input("state_dd", "value"),
+    Input("year_dd", "value"),
+    Input("quarter_dd", "value"),
+    Input("util_dd", "value"),
+    Input("scope_toggle", "value"),
+    State("session_id", "data"),
+)
+def update_top_drivers(state, year, quarter, util_type, scope, session_id):
+    if not filters_ready(state, year, quarter, util_type, scope):
+        return px.bar(title="No data"), {}
+
+    filters = dict(state=state, year=year, quarter=quarter, util_type=util_type, scope=scope)
+    fig = build_top_drivers_figure(**filters, is_current=request_tracker.begin(session_id, "top_drivers"))
+    return fig, artifact_store.put(session_id, "top_drivers", filters, fig)
+
+
+@app.callback(
+    Output("cpp_graph", "figure"),
+    Output("kpi_top1_table", "data"),
+    Output("store_fig_cpp", "data"),
+    Output("store_kpi_top1", "data"),
+    Input("state_dd", "value"),
+    Input("year_dd", "value"),
+    Input("quarter_dd", "value"),
+    Input("util_dd", "value"),
+    Input("scope_toggle", "value"),
+    State("session_id", "data"),
+    running=[(Output("kpi_top1_table", "style_table"), KPI_TABLE_STYLE_RUNNING, KPI_TABLE_STYLE)],
+)
+def update_cost_distribution(state, year, quarter, util_type, scope, session_id):
+    if not filters_ready(state, year, quarter, util_type, scope):
+        return px.bar(title="No data"), [], {}, {}
+
+    filters = dict(state=state, year=year, quarter=quarter, util_type=util_type, scope=scope)
+    fig, shares = build_cost_distribution(**filters, is_current=request_tracker.begin(session_id, "cost_distribution"))
+    handle = artifact_store.put(session_id, "cost_distribution", filters, fig)
+    rows = [{"scope": state if label == "State" else label, "top1_spend_share": share} for label, share in shares.items()]
+    return fig, rows, handle, {"top1_spend_share": shares["State"]}
+
+
+def build_state_ranking(state, year, quarter, util_type, scope="state", is_current=None) -> pd.DataFrame:
+    """Every state's KPIs for the slice, ranked by total reimbursed."""
+    filters = dict(state=state, year=year, quarter=quarter, util_type=util_type, scope=scope)
+    ranking = executive_results("ranking", filters, ["ranking"], is_current)["ranking"]
+    ranking = ranking.sort_values("total_reimbursed", ascending=False, ignore_index=True)
+    national = ranking["total_reimbursed"].sum()
+    return ranking.assign(
+        rank=np.arange(1, len(ranking) + 1),
+        national_share=ranking["total_reimbursed"] / national if national else 0.0,
+        cost_per_rx=ranking["total_reimbursed"] / ranking["prescriptions"].where(ranking["prescriptions"] > 0),
+    )
+
+
+@app.callback(
+    Output("ranking_table", "data"),
+    Output("ranking_table", "style_data_conditional"),
+    Input("state_dd", "value"),
+    Input("year_dd", "value"),
+    Input("quarter_dd", "value"),
+    Input("util_dd", "value"),
+    State("session_id", "data"),
+)
+def update_state_ranking(state, year, quarter, util_type, session_id):
+    if not (state and year and quarter and util_type):
+        return [], []
+    ranking = build_state_ranking(
+        state, year, quarter, util_type, is_current=request_tracker.begin(session_id, "ranking")
+    )
+    # The selected state is highlighted by the table itself, wherever sorting moves it
+    highlight = [{"if": {"filter_query": f'{{state}} = "{state}"'}, "backgroundColor": "#eef3ff", "fontWeight": "600"}]
+    return ranking.to_dict("records"), highlight
+
+
+@app.callback(
+    Output("export_csv_link", "href"),
+    Output("export_parquet_link", "href"),
+    Input("state_dd", "value"),
+    Input("year_dd", "value"),
+    Input("quarter_dd", "value"),
+    Input("util_dd", "value"),
+)
+def update_export_links(state, year, quarter, util_type):
+    if not (state and year and quarter and util_type):
+        return "", ""
+    query = {"state": state, "year": int(year), "quarter": int(quarter), "util": util_type}
+    return (
+        "/export/filtered?" + urlencode({**query, "format": "csv", "compression": "gzip"}),
+        "/export/filtered?" + urlencode({**query, "format": "parquet", "compression": "zstd"}),
+    )
+
+
+# -----------------------------
+# Forecast tab callbacks
+# -----------------------------
+# The server only fits: one forecast per (state, utilization type, model, data
+# version), for MAX_HORIZON quarters, kept in `forecast_cache`. Horizon and
+# scenario multiplier just truncate and scale it, which the clientside
+# callback below (assets/forecast.js) does in the browser, so dragging the
+# slider never reaches the server.
+#
+# Forecasts precomputed by scripts/07_batch_forecasts.py are served from
+# dbo.sdud_gold_forecasts while their data version is current; other cells
+# (new series, a load since the batch ran) are fitted live. A live "auto" fit
+# reuses the model selected for its series and data version, see
+# `selection_cache`.
+def stored_forecast(state, util_type, model_name, interval, version) -> dict | None:
+    """Forecast of the batch job for the current data version, or None if missing or stale."""
+    if not HAS_FORECASTS or version is None:
+        return None
+    params = {
+        "state": state,
+        "util": util_type,
+        "model": model_name,
+        "interval": interval,
+        "data_version": str(version),
+    }
+    rows = read_sql(queries.stored_forecast_sql(FORECASTS_TABLE), params)
+    if len(rows) < MAX_HORIZON:
+        return None
+    return {
+        "method": str(rows["method"].iloc[0]),
+        "forecast": rows["forecast"].to_numpy(dtype="float64"),
+        "lower": rows["lower_bound"].to_numpy(dtype="float64"),
+        "upper": rows["upper_bound"].to_numpy(dtype="float64"),
+        "bands": {
+            q: rows[col].to_numpy(dtype="float64")
+            for q, col in [(0.1, "lower_80"), (0.9, "upper_80")]
+            if rows[col].notna().all()
+        },
+        "score": None if pd.isna(rows["score"].iloc[0]) else float(rows["score"].iloc[0]),
+    }
+
+
+def load_selection(state, util_type, values, version) -> tuple:
+    """(model, backtest score) of the "auto" model for a state series, selected once per data version."""
+
+    def _select():
+        t0 = time.perf_counter()
+        best, score, scores = select_model(values, get_selection_pool(), FORECAST_WORKERS, FORECAST_FIT_BUDGET)
+        print(
+            f"[dashboard] model selection {state}/{util_type} -> {best} in {(time.perf_counter() - t0) * 1000:.0f}ms | "
+            + " ".join(f"{k}={v:.3f}" for k, v in scores.items())
+        )
+        return best, score
+
+    return selection_cache.get_or_fit((state, util_type, version), _select, unversioned_ttl(version))
+
+
+def fit_state_forecast(state, util_type, model_name, interval="normal", version=None) -> dict:
+    """Quarterly history of a state series plus its forecast, as JSON-able lists."""
+    ts = read_sql(queries.state_series_sql(SQL), {"state": state, "util": util_type})
+    out = {"state": state, "util_type": util_type, "model": model_name, "interval": interval, "method": None}
     if ts.empty or ts["total_reimbursed"].isna().all():
-        return empty, "No time series available for forecast.", scope_note, f"Multiplier: {multiplier:.2f}", {}
+        return out
 
-    ts = ts.copy()
     ts["total_reimbursed"] = ts["total_reimbursed"].astype(float)
-
-    # Create quarterly timestamps
-    ts["date"] = pd.PeriodIndex(
+    periods = pd.PeriodIndex(
         ts["year"].astype(int).astype(str) + "Q" + ts["quarter"].astype(int).astype(str),
         freq="Q",
-    ).to_timestamp()
-    ts = ts.sort_values("date")
+    )
+    ts = ts.assign(period=periods).sort_values("period")
+
+    fit = stored_forecast(state, util_type, model_name, interval, version)
+    source = "batch"
+    if fit is None:
+        t0 = time.perf_counter()
+        values = ts["total_reimbursed"].to_numpy()
+        selection = load_selection(state, util_type, values, version) if model_name == AUTO else None
+        fit = fit_forecast(values, model_name, MAX_HORIZON, selection, interval, BAND_QUANTILES)
+        source = "live"
+        print(
+            f"[dashboard] forecast fit {state}/{util_type}/{model_name}/{interval} -> {fit['method']} "
+            f"in {(time.perf_counter() - t0) * 1000:.0f}ms"
+        )
 
-    fc_method_used = model_name
-    fc_values = None
-    fc_lower = None
-    fc_upper = None
+    fc_periods = [ts["period"].iloc[-1] + i for i in range(1, MAX_HORIZON + 1)]
+    return {
+        **out,
+        "method": fit["method"],
+        "score": fit["score"],
+        "source": source,
+        "history": {
+            "date": [p.to_timestamp().strftime("%Y-%m-%d") for p in ts["period"]],
+            "value": ts["total_reimbursed"].tolist(),
+        },
+        "forecast": {
+            "period": [str(p) for p in fc_periods],
+            "date": [p.to_timestamp().strftime("%Y-%m-%d") for p in fc_periods],
+            "value": fit["forecast"].tolist(),
+            "lower": fit["lower"].tolist(),
+            "upper": fit["upper"].tolist(),
+            # Inner 80% band, bootstrap intervals only
+            "lower_80": fit["bands"][0.1].tolist() if 0.1 in fit["bands"] else None,
+            "upper_80": fit["bands"][0.9].tolist() if 0.9 in fit["bands"] else None,
+        },
+    }
 
-    if model_name == "ets" and HAS_STATSMODELS and len(ts) >= 8:
-        try:
-            fit = ExponentialSmoothing(
-                ts["total_reimbursed"],
-                trend="add",
-                seasonal="add",
-                seasonal_periods=4,
-                initialization_method="estimated",
-            ).fit(optimized=True)
-            fc_obj = fit.forecast(int(horizon))
-            fc_values = fc_obj if isinstance(fc_obj, np.ndarray) else fc_obj.values
-            
-            # Compute 95% CI using residual-based approach
-            residuals = fit.fittedvalues - ts["total_reimbursed"]
-            std_error = np.std(residuals)
-            z_score = 1.96  # 95% CI
-            fc_lower = []
-            fc_upper = []
-            for h_i in range(1, int(horizon) + 1):
-                expansion = np.sqrt(h_i)  # Error grows with horizon
-                se = std_error * expansion
-                fc_lower.append(fc_values[h_i - 1] - z_score * se)
-                fc_upper.append(fc_values[h_i - 1] + z_score * se)
-            fc_lower = np.array(fc_lower)
-            fc_upper = np.array(fc_upper)
-        except Exception:
-            fc_values = None
-            fc_method_used = "naive"
-
-    if fc_values is None:
-        last = float(ts["total_reimbursed"].iloc[-1])
-        fc_values = [last] * int(horizon)
-        fc_method_used = "naive"
-        # Simple CI for naive: use historical std
-        hist_std = ts["total_reimbursed"].std()
-        z_score = 1.96
-        fc_lower = np.array([last - z_score * hist_std * np.sqrt(i) for i in range(1, int(horizon) + 1)])
-        fc_upper = np.array([last + z_score * hist_std * np.sqrt(i) for i in range(1, int(horizon) + 1)])
-
-    fc_values = pd.Series(fc_values) * float(multiplier)
-    if fc_lower is not None:
-        fc_lower = pd.Series(fc_lower) * float(multiplier)
-        fc_upper = pd.Series(fc_upper) * float(multiplier)
-
-    last_period = pd.Period(ts["date"].iloc[-1], freq="Q")
-    fc_periods = [last_period + i for i in range(1, int(horizon) + 1)]
-    fc_dates = [p.to_timestamp() for p in fc_periods]
-    fc_labels = [str(p) for p in fc_periods]
-
-    fc_df = pd.DataFrame(
-        {
-            "date": fc_dates,
-            "period": fc_labels,
-            "forecast_total_reimbursed": fc_values.values,
-            "lower_bound": fc_lower.values if fc_lower is not None else fc_values.values,
-            "upper_bound": fc_upper.values if fc_upper is not None else fc_values.values,
-        }
-    )
 
-    hist_df = ts[["date", "total_reimbursed"]].copy()
-    hist_df["series"] = "Historical"
-    fplot = fc_df.rename(columns={"forecast_total_reimbursed": "total_reimbursed"}).copy()
-    fplot["series"] = f"Forecast ({fc_method_used.upper()})"
+def unversioned_ttl(version) -> float | None:
+    """Lifetime of a cached fit: until the data version changes, or QUERY_CACHE_TTL without one."""
+    return query_cache.ttl_seconds if version is None else None
+
+
+def load_forecast(state, util_type, model_name, interval="normal") -> dict:
+    version = query_cache.current_version()
+    key = (state, util_type, model_name, interval, version)
+    return forecast_cache.get_or_fit(
+        key, lambda: fit_state_forecast(state, util_type, model_name, interval, version), unversioned_ttl(version)
+    )
 
-    plot_df = pd.concat([hist_df, fplot[["date", "total_reimbursed", "series"]]], ignore_index=True)
 
+def build_forecast(state, util_type, scope, horizon, multiplier, model_name, interval="normal"):
+    """Forecast figure for downloads; the same view assets/forecast.js draws in the browser."""
+    if not (state and util_type and horizon and multiplier and model_name and scope):
+        return px.line(title="No forecast data")
+    data = load_forecast(state, util_type, model_name, interval)
+    if data["method"] is None:
+        return px.line(title="No forecast data")
+
+    horizon, multiplier = int(horizon), float(multiplier)
+    fc = {k: v[:horizon] for k, v in data["forecast"].items() if v is not None}
+    fc_dates = pd.to_datetime(fc["date"])
+    scaled = {k: np.asarray(fc[k]) * multiplier for k in ("value", "lower", "upper", "lower_80", "upper_80") if k in fc}
+
+    plot_df = pd.concat(
+        [
+            pd.DataFrame(
+                {"date": pd.to_datetime(data["history"]["date"]), "total_reimbursed": data["history"]["value"], "series": "Historical"}
+            ),
+            pd.DataFrame(
+                {"date": fc_dates, "total_reimbursed": scaled["value"], "series": f"Forecast ({data['method'].upper()})"}
+            ),
+        ],
+        ignore_index=True,
+    )
     fig = px.line(
         plot_df,
         x="date",
@@ -782,90 +1314,109 @@ ORDER BY [year], quarter;
         markers=True,
         title=f"Forecast: Total Amount Reimbursed — {state} [{util_type}] (95% CI)",
     )
-    
-    # Add confidence interval shaded bands
-    if fc_lower is not None and fc_upper is not None:
-        fig.add_scatter(
-            x=fc_dates,
-            y=fc_upper.values,
-            mode="lines",
-            line=dict(width=0),
-            showlegend=False,
-            hoverinfo="skip",
-        )
+
+    # Confidence interval shaded band
+    fig.add_scatter(x=fc_dates, y=scaled["upper"], mode="lines", line=dict(width=0), showlegend=False, hoverinfo="skip")
+    fig.add_scatter(
+        x=fc_dates,
+        y=scaled["lower"],
+        mode="lines",
+        line=dict(width=0),
+        fillcolor="rgba(68, 68, 68, 0.2)",
+        fill="tonexty",
+        name="95% CI",
+        hovertemplate="<b>95% CI</b><br>Date: %{x}<br>Lower: $%{y:,.0f}<extra></extra>",
+    )
+    if "lower_80" in scaled:
+        # Inner 80% band of the bootstrap
+        fig.add_scatter(x=fc_dates, y=scaled["upper_80"], mode="lines", line=dict(width=0), showlegend=False, hoverinfo="skip")
         fig.add_scatter(
             x=fc_dates,
-            y=fc_lower.values,
+            y=scaled["lower_80"],
             mode="lines",
             line=dict(width=0),
-            fillcolor="rgba(68, 68, 68, 0.2)",
+            fillcolor="rgba(68, 68, 68, 0.3)",
             fill="tonexty",
-            name="95% CI",
-            hovertemplate="<b>95% CI</b><br>Date: %{x}<br>Lower: $%{y:,.0f}<extra></extra>",
+            name="80% CI",
+            hovertemplate="<b>80% CI</b><br>Date: %{x}<br>Lower: $%{y:,.0f}<extra></extra>",
         )
-    
     fig.update_yaxes(tickformat="$,")
     fig.update_layout(margin=dict(l=20, r=20, t=50, b=20))
+    return fig
 
-    # Table with CI bounds
-    tbl = fc_df.copy()
-    tbl["forecast_total_reimbursed"] = tbl["forecast_total_reimbursed"].map(lambda v: f"${v:,.0f}")
-    tbl["lower_bound"] = tbl["lower_bound"].map(lambda v: f"${v:,.0f}")
-    tbl["upper_bound"] = tbl["upper_bound"].map(lambda v: f"${v:,.0f}")
 
-    table = html.Table(
-        style={"borderCollapse": "collapse", "width": "100%", "maxWidth": "820px"},
-        children=[
-            html.Thead(
-                html.Tr(
-                    [
-                        html.Th("Quarter", style={"textAlign": "left", "borderBottom": "1px solid #ddd", "padding": "8px"}),
-                        html.Th("Forecast", style={"textAlign": "right", "borderBottom": "1px solid #ddd", "padding": "8px"}),
-                        html.Th("Lower (95%)", style={"textAlign": "right", "borderBottom": "1px solid #ddd", "padding": "8px"}),
-                        html.Th("Upper (95%)", style={"textAlign": "right", "borderBottom": "1px solid #ddd", "padding": "8px"}),
-                    ]
-                )
-            ),
-            html.Tbody(
-                [
-                    html.Tr(
-                        [
-                            html.Td(r["period"], style={"padding": "8px", "borderBottom": "1px solid #f0f0f0"}),
-                            html.Td(r["forecast_total_reimbursed"], style={"padding": "8px", "textAlign": "right", "borderBottom": "1px solid #f0f0f0"}),
-                            html.Td(r["lower_bound"], style={"padding": "8px", "textAlign": "right", "borderBottom": "1px solid #f0f0f0", "color": "#666"}),
-                            html.Td(r["upper_bound"], style={"padding": "8px", "textAlign": "right", "borderBottom": "1px solid #f0f0f0", "color": "#666"}),
-                        ]
-                    )
-                    for _, r in tbl.iterrows()
-                ]
-            ),
-        ],
-    )
+@app.callback(
+    Output("store_forecast", "data"),
+    Input("state_dd", "value"),
+    Input("util_dd", "value"),
+    Input("fc_model", "value"),
+    Input("fc_interval", "value"),
+)
+def update_forecast(state, util_type, model_name, interval):
+    if not (state and util_type and model_name and interval):
+        return None
+    return load_forecast(state, util_type, model_name, interval)
 
-    note = (
-        f"Model: {fc_method_used.upper()} | Horizon: {horizon} quarters | "
-        f"Scenario multiplier: {multiplier:.2f} | {scope_note}"
-    )
 
-    return fig, table, note, f"Multiplier: {multiplier:.2f}", fig.to_dict()
+# Figure, table rows, note, multiplier label and the download handle
+app.clientside_callback(
+    ClientsideFunction(namespace="forecast", function_name="render"),
+    Output("forecast_graph", "figure"),
+    Output("forecast_table", "data"),
+    Output("forecast_note", "children"),
+    Output("fc_multiplier_label", "children"),
+    Output("store_fig_fc", "data"),
+    Input("store_forecast", "data"),
+    Input("fc_horizon", "value"),
+    Input("fc_multiplier", "value"),
+    Input("scope_toggle", "value"),
+    State("session_id", "data"),
+)
 
 
 # -----------------------------
 # Download callback (dropdown + Download button)
 # -----------------------------
+ARTIFACT_BUILDERS = {
+    "trend": build_trend_figure,
+    "top_drivers": build_top_drivers_figure,
+    "cost_distribution": lambda **f: build_cost_distribution(**f)[0],
+    "forecast": build_forecast,
+}
+
+
+def artifact_figure(handle: dict | None):
+    """Figure behind a download handle: the server-side copy if still held, else rebuilt from its filters."""
+    if not handle:
+        return None
+    fig = artifact_store.get(handle)
+    if fig is None:
+        builder = ARTIFACT_BUILDERS.get(handle.get("name"))
+        if builder is None:
+            return None
+        fig = builder(**handle.get("filters", {}))
+    return fig
+
+
 @app.callback(
     Output("download_target", "data"),
     Input("download_btn", "n_clicks"),
     State("download_selector", "value"),
     State("store_kpis", "data"),
-    State("store_filtered_head", "data"),
+    State("store_kpi_top1", "data"),
+    State("state_dd", "value"),
+    State("year_dd", "value"),
+    State("quarter_dd", "value"),
+    State("util_dd", "value"),
     State("store_fig_trend", "data"),
     State("store_fig_top", "data"),
     State("store_fig_cpp", "data"),
     State("store_fig_fc", "data"),
     prevent_initial_call=True,
 )
-def handle_download(n_clicks, selection, kpis, head_rows, fig_trend, fig_top, fig_cpp, fig_fc):
+def handle_download(
+    n_clicks, selection, kpis, kpi_top1, state, year, quarter, util_type, fig_trend, fig_top, fig_cpp, fig_fc
+):
     if not selection:
         raise PreventUpdate
 
@@ -873,33 +1424,41 @@ def handle_download(n_clicks, selection, kpis, head_rows, fig_trend, fig_top, fi
 
     # CSV downloads
     if selection == "kpi_csv":
-        df = pd.DataFrame([kpis or {}])
+        df = pd.DataFrame([{**(kpis or {}), **(kpi_top1 or {})}])
         return dcc.send_data_frame(df.to_csv, f"sdud_kpis_{ts}.csv", index=False)
 
     if selection == "data_csv":
-        df = pd.DataFrame(head_rows or [])
+        # Fetched on demand (through the query cache) rather than on every filter change
+        if state and year and quarter and util_type:
+            df = load_filtered_head(state, year, quarter, util_type)
+        else:
+            df = pd.DataFrame()
         return dcc.send_data_frame(df.to_csv, f"sdud_filtered_top5000_{ts}.csv", index=False)
 
     # PNG downloads
     if selection == "trend_png":
-        fig = pio.from_json(pio.to_json(fig_trend)) if fig_trend else px.line(title="No trend chart")
+        fig = artifact_figure(fig_trend) or px.line(title="No trend chart")
         return dcc.send_bytes(write_fig_png(fig), f"sdud_trend_{ts}.png")
 
     if selection == "drivers_png":
-        fig = pio.from_json(pio.to_json(fig_top)) if fig_top else px.bar(title="No top drivers chart")
+        fig = artifact_figure(fig_top) or px.bar(title="No top drivers chart")
         return dcc.send_bytes(write_fig_png(fig), f"sdud_top_drivers_{ts}.png")
 
     if selection == "cost_png":
-        fig = pio.from_json(pio.to_json(fig_cpp)) if fig_cpp else px.histogram(title="No cost distribution chart")
+        fig = artifact_figure(fig_cpp) or px.histogram(title="No cost distribution chart")
         return dcc.send_bytes(write_fig_png(fig), f"sdud_cost_distribution_{ts}.png")
 
     if selection == "forecast_png":
-        fig = pio.from_json(pio.to_json(fig_fc)) if fig_fc else px.line(title="No forecast chart")
+        fig = artifact_figure(fig_fc) or px.line(title="No forecast chart")
         return dcc.send_bytes(write_fig_png(fig), f"sdud_forecast_{ts}.png")
 
     raise PreventUpdate
 
 
-if __name__ == "__main__":
+def main():
     print("Starting Dash app on http://0.0.0.0:8050")
-    app.run(host="0.0.0.0", port=8050, debug=True, use_reloader=False)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=8050, debug=True, use_reloader=False)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,217 @@
+import csv
+import datetime as dt
+import decimal
+import io
+import itertools
+import re
+import zlib
+from contextlib import contextmanager
+
+from flask import Response, request
+from sqlalchemy import text
+
+from queries import MSSQL, SqlDialect, dialect_for
+
+# Optional export dependencies
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PYARROW = True
+except Exception:
+    HAS_PYARROW = False
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except Exception:
+    HAS_ZSTD = False
+
+
+def export_sql(dialect: SqlDialect = MSSQL) -> str:
+    return f"""
+SELECT *
+FROM dbo.sdud_analytics
+WHERE state = :state AND {dialect.quote("year")} = :year AND quarter = :quarter AND utilization_type = :util;
+"""
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back to the response generator."""
+
+    def __init__(self):
+        self._parts = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        out = b"".join(self._parts)
+        self._parts.clear()
+        return out
+
+
+def _compressor(compression: str):
+    if compression == "gzip":
+        return zlib.compressobj(6, zlib.DEFLATED, 31)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    return None
+
+
+@contextmanager
+def _streaming_result(engine, sql: str, params: dict, chunk_rows: int):
+    """Result on a server-side cursor; read it with `.partitions(chunk_rows)`."""
+    with engine.connect() as conn:
+        yield conn.execution_options(yield_per=chunk_rows).execute(text(sql), params)
+
+
+def iter_csv(engine, sql: str, params: dict, chunk_rows: int, compression: str = "gzip"):
+    comp = _compressor(compression)
+    header_written = False
+    with _streaming_result(engine, sql, params, chunk_rows) as result:
+        columns = list(result.keys())
+        for rows in result.partitions(chunk_rows):
+            buf = io.StringIO()
+            writer = csv.writer(buf, lineterminator="\n")
+            if not header_written:
+                writer.writerow(columns)
+                header_written = True
+            writer.writerows(rows)
+            data = buf.getvalue().encode("utf-8")
+            data = comp.compress(data) if comp else data
+            if data:
+                yield data
+    if comp:
+        yield comp.flush()
+
+
+# DB-API type codes: pyodbc (SQL Server) reports Python types, DuckDB its SQL type names
+_NAMED_TYPES = {
+    "BOOLEAN": "bool_", "TINYINT": "int64", "SMALLINT": "int64", "INTEGER": "int64", "BIGINT": "int64",
+    "FLOAT": "float64", "REAL": "float64", "DOUBLE": "float64", "VARCHAR": "string", "BLOB": "binary",
+    "DATE": "date32", "TIMESTAMP": "timestamp",
+}
+_PYTHON_TYPES = {
+    bool: "bool_", int: "int64", float: "float64", str: "string", bytes: "binary", bytearray: "binary",
+    dt.date: "date32", dt.datetime: "timestamp",
+}
+
+
+def arrow_type(type_code, precision=None, scale=None):
+    """Arrow type for one cursor.description entry, or None if the type code is not known."""
+    if type_code is decimal.Decimal and precision:
+        return pa.decimal128(precision, scale or 0)
+    name = _PYTHON_TYPES.get(type_code) if isinstance(type_code, type) else None
+    if name is None and type_code is not None:
+        spelled = str(type_code).upper()
+        if m := re.fullmatch(r"DECIMAL\((\d+),\s*(\d+)\)", spelled):
+            return pa.decimal128(int(m.group(1)), int(m.group(2)))
+        name = _NAMED_TYPES.get(spelled)
+    if name == "timestamp":
+        return pa.timestamp("us")
+    return getattr(pa, name)() if name else None
+
+
+def result_schema(description, first_rows=()):
+    """
+    Arrow schema of a result from the column types in its cursor description, so
+    that every chunk (and an empty result) is written with the same schema. Columns whose type the driver
+    does not report are inferred from `first_rows`, and are strings when those are
+    all NULL.
+    """
+    fields = []
+    for i, (name, type_code, _, _, precision, scale, _) in enumerate(description):
+        type_ = arrow_type(type_code, precision, scale)
+        if type_ is None:
+            type_ = pa.array([r[i] for r in first_rows]).type
+            type_ = pa.string() if pa.types.is_null(type_) else type_
+        fields.append(pa.field(name, type_))
+    return pa.schema(fields)
+
+
+def iter_parquet(engine, sql: str, params: dict, chunk_rows: int, compression: str = "zstd"):
+    # Compression is applied per column chunk inside the Parquet file; each
+    # database partition becomes one row group.
+    sink = _ChunkSink()
+    with _streaming_result(engine, sql, params, chunk_rows) as result:
+        description = result.cursor.description  # gone once the rows are exhausted
+        partitions = result.partitions(chunk_rows)
+        first = next(partitions, None)
+        schema = result_schema(description, first or ())
+        writer = pq.ParquetWriter(sink, schema, compression=compression or "none", use_dictionary=True)
+        try:
+            for rows in itertools.chain([first], partitions) if first is not None else ():
+                cols = {name: [r[i] for r in rows] for i, name in enumerate(schema.names)}
+                writer.write_table(pa.Table.from_pydict(cols, schema=schema))
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            # Also for an empty result: the footer makes it a valid zero-row file
+            writer.close()
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def register_export_route(server, engine, chunk_rows: int = 50000):
+    """
+    GET /export/filtered?state=&year=&quarter=&util=&format=csv|parquet&compression=gzip|zstd|none
+
+    Streams the complete filtered slice of dbo.sdud_analytics in chunks, so memory
+    stays constant regardless of slice size and the Dash callbacks are not involved.
+    """
+    sql = export_sql(dialect_for(engine.dialect.name))
+
+    @server.route("/export/filtered")
+    def export_filtered():
+        args = request.args
+        fmt = args.get("format", "csv").lower()
+        compression = args.get("compression", "gzip" if fmt == "csv" else "zstd").lower()
+        try:
+            params = {
+                "state": args["state"],
+                "year": int(args["year"]),
+                "quarter": int(args["quarter"]),
+                "util": args["util"],
+            }
+        except (KeyError, ValueError):
+            return Response("state, year, quarter and util are required\n", status=400, mimetype="text/plain")
+
+        if compression not in ("gzip", "zstd", "none"):
+            return Response(f"unsupported compression: {compression}\n", status=400, mimetype="text/plain")
+        if compression == "zstd" and fmt == "csv" and not HAS_ZSTD:
+            return Response("zstd export requires the zstandard package\n", status=400, mimetype="text/plain")
+
+        stem = re.sub(
+            r"[^A-Za-z0-9_-]+", "_", f"sdud_{params['state']}_{params['year']}Q{params['quarter']}_{params['util']}"
+        )
+        if fmt == "csv":
+            body = iter_csv(engine, sql, params, chunk_rows, compression)
+            suffix = {"gzip": ".csv.gz", "zstd": ".csv.zst", "none": ".csv"}[compression]
+            mimetype = "text/csv" if compression == "none" else "application/octet-stream"
+        elif fmt == "parquet":
+            if not HAS_PYARROW:
+                return Response("parquet export requires pyarrow\n", status=400, mimetype="text/plain")
+            body = iter_parquet(engine, sql, params, chunk_rows, None if compression == "none" else compression)
+            suffix = ".parquet"
+            mimetype = "application/vnd.apache.parquet"
+        else:
+            return Response(f"unsupported format: {fmt}\n", status=400, mimetype="text/plain")
+
+        return Response(
+            body,
+            mimetype=mimetype,
+            headers={"Content-Disposition": f'attachment; filename="{stem}{suffix}"'},
+            direct_passthrough=True,
+        )
+
+    return export_filtered
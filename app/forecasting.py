@@ -0,0 +1,350 @@
+import math
+import multiprocessing
+import threading
+import time
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+import numpy as np
+
+# Optional forecasting dependency
+try:
+    from statsmodels.tsa.holtwinters import ExponentialSmoothing
+    HAS_STATSMODELS = True
+except Exception:
+    HAS_STATSMODELS = False
+
+# Fits are always made for the longest horizon the tab offers; shorter horizons
+# are a prefix of it, and the scenario multiplier only scales it.
+MAX_HORIZON = 12
+MIN_ETS_POINTS = 8
+SEASON = 4
+Z_95 = 1.96
+
+# Bootstrap intervals: future paths simulated from resampled residuals, drawn
+# from a fixed seed so the same series always gets the same bands.
+BOOTSTRAP_PATHS = 5000
+BOOTSTRAP_SEED = 20240417
+# Quantiles the bootstrap reports: the 95% interval plus an inner 80% band
+BAND_QUANTILES = (0.025, 0.1, 0.9, 0.975)
+
+# -----------------------------
+# Candidate models
+# -----------------------------
+# ETS variants are (trend, damped, seasonal) for statsmodels' ExponentialSmoothing;
+# "ets" is the tab's fixed additive Holt-Winters.
+ETS_SPECS = {
+    "ets": ("add", False, "add"),
+    "ets_damped": ("add", True, "add"),
+    "ets_mul": ("add", False, "mul"),
+    "ets_damped_mul": ("add", True, "mul"),
+}
+AUTO = "auto"
+AUTO_CANDIDATES = ["ets", "ets_damped", "ets_mul", "ets_damped_mul", "snaive", "naive"]
+
+# Rolling-origin backtest: forecast BACKTEST_HORIZON quarters from each of the
+# last BACKTEST_ORIGINS origins that leave enough history to fit on.
+BACKTEST_ORIGINS = 4
+BACKTEST_HORIZON = 4
+
+
+def min_points(name: str) -> int:
+    if name in ETS_SPECS:
+        return MIN_ETS_POINTS
+    return SEASON if name == "snaive" else 1
+
+
+def error_cycle(name: str) -> int:
+    """Steps after which a model's forecast takes on one more residual's worth of error."""
+    return SEASON if name == "snaive" else 1
+
+
+def candidate_forecast(values, name: str, horizon: int) -> tuple[np.ndarray, float, np.ndarray]:
+    """
+    (point forecast, residual std, residuals) of model `name` for `horizon`
+    quarters. Errors add up one residual per error_cycle(name) steps, so the
+    95% half-width at step h is Z_95 * residual std * sqrt(ceil(h / cycle)).
+    Raises if the model can't be fitted.
+    """
+    y = np.asarray(values, dtype="float64")
+    if len(y) < min_points(name):
+        raise ValueError(f"{name} needs at least {min_points(name)} points")
+
+    if name in ETS_SPECS:
+        if not HAS_STATSMODELS:
+            raise RuntimeError("ETS requires statsmodels")
+        trend, damped, seasonal = ETS_SPECS[name]
+        if seasonal == "mul" and not (y > 0).all():
+            raise ValueError("multiplicative seasonality needs a positive series")
+        fit = ExponentialSmoothing(
+            y,
+            trend=trend,
+            damped_trend=damped,
+            seasonal=seasonal,
+            seasonal_periods=SEASON,
+            initialization_method="estimated",
+        ).fit(optimized=True)
+        forecast = np.asarray(fit.forecast(horizon), dtype="float64")
+        if not np.isfinite(forecast).all():
+            raise ValueError(f"{name} produced a non-finite forecast")
+        residuals = y - fit.fittedvalues
+        return forecast, float(np.std(residuals)), residuals
+
+    if name == "snaive":
+        # Same quarter last year; the error grows with the number of years ahead
+        forecast = y[len(y) - SEASON + np.arange(horizon) % SEASON]
+        diffs = y[SEASON:] - y[:-SEASON]
+        residual_std = float(np.std(diffs, ddof=1)) if len(diffs) > 1 else 0.0
+        return forecast, residual_std, diffs
+
+    if name == "naive":
+        # Last value, interval from the historical std
+        residual_std = float(np.std(y, ddof=1)) if len(y) > 1 else 0.0
+        return np.full(horizon, y[-1]), residual_std, y - y.mean()
+
+    raise ValueError(f"unknown model {name!r}")
+
+
+def backtest_score(
+    values, name: str, budget_seconds: float | None = None, deadline: float | None = None
+) -> float:
+    """
+    Weighted absolute percentage error (sum |error| / sum |actual|) of `name`
+    over the rolling-origin backtest; inf if no origin has enough history, a
+    fit fails or the time runs out: `budget_seconds` from the start, or the
+    wall-clock `deadline` (time.time()). Both are checked between fits.
+    """
+    y = np.asarray(values, dtype="float64")
+    t0 = time.perf_counter()
+    abs_err = abs_actual = 0.0
+    origins = 0
+    for k in range(BACKTEST_ORIGINS):
+        origin = len(y) - BACKTEST_HORIZON - k
+        if origin < min_points(name):
+            break
+        if deadline is not None and time.time() > deadline:
+            return math.inf
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            try:
+                forecast, _, _ = candidate_forecast(y[:origin], name, BACKTEST_HORIZON)
+            except Exception:
+                return math.inf
+        actual = y[origin : origin + BACKTEST_HORIZON]
+        abs_err += float(np.abs(forecast - actual).sum())
+        abs_actual += float(np.abs(actual).sum())
+        origins += 1
+        if budget_seconds is not None and time.perf_counter() - t0 > budget_seconds:
+            return math.inf
+    if not origins or abs_actual == 0:
+        return math.inf
+    return abs_err / abs_actual
+
+
+def _score_task(task) -> tuple[str, float]:
+    values, name, budget_seconds, deadline = task
+    return name, backtest_score(values, name, budget_seconds, deadline)
+
+
+def _quiet_worker() -> None:
+    # ETS emits a convergence warning for most short series; failed fits score inf
+    warnings.simplefilter("ignore")
+
+
+def selection_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool for select_model. Fits are CPU-bound Python, so threads would
+    serialize on the GIL. Workers are spawned (the caller may already run
+    threads) and import this module once, so start the pool ahead of the first
+    request if its cold start matters.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn"), initializer=_quiet_worker
+    )
+
+
+def select_model(
+    values, pool=None, workers: int = 1, budget_seconds: float | None = None
+) -> tuple[str, float, dict]:
+    """
+    Backtest every AUTO_CANDIDATES model and return (best name, its score,
+    {name: score}). With `pool` (a selection_pool of `workers` processes) the
+    candidates are scored in parallel. Falls back to naive when nothing scores.
+
+    `budget_seconds` per candidate is best-effort: a fit in progress can't be
+    interrupted. Each backtest stops at its next origin once its budget, or the
+    deadline of the whole selection (one budget per round of the pool), has
+    passed; candidates still queued at the deadline are cancelled, and running
+    ones finish their current fit in the background and score inf.
+    """
+    y = np.asarray(values, dtype="float64")
+    candidates = [c for c in AUTO_CANDIDATES if HAS_STATSMODELS or c not in ETS_SPECS]
+    deadline = None
+    if pool is not None and budget_seconds is not None:
+        # Wall clock: the deadline is checked in the worker processes as well
+        deadline = time.time() + budget_seconds * math.ceil(len(candidates) / max(1, workers))
+    tasks = [(y, name, budget_seconds, deadline) for name in candidates]
+    if pool is None:
+        scores = dict(_score_task(t) for t in tasks)
+    else:
+        futures = {name: pool.submit(_score_task, t) for name, t in zip(candidates, tasks)}
+        scores = {}
+        for name, fut in futures.items():
+            timeout = None if deadline is None else max(0.0, deadline - time.time())
+            try:
+                scores[name] = fut.result(timeout=timeout)[1]
+            except TimeoutError:
+                fut.cancel()
+                scores[name] = math.inf
+            except Exception:
+                scores[name] = math.inf
+
+    finite = {name: score for name, score in scores.items() if math.isfinite(score)}
+    if not finite:
+        return "naive", math.nan, scores
+    best = min(finite, key=lambda name: (finite[name], candidates.index(name)))
+    return best, finite[best], scores
+
+
+def bootstrap_bands(
+    forecast,
+    residuals,
+    cycle: int = 1,
+    quantiles=BAND_QUANTILES,
+    n_paths: int = BOOTSTRAP_PATHS,
+    seed: int = BOOTSTRAP_SEED,
+) -> np.ndarray:
+    """
+    Quantiles (len(quantiles) x horizon) of `n_paths` simulated future paths.
+    A path adds to the point forecast one centered residual per `cycle` steps,
+    resampled with replacement; all paths are drawn, accumulated and ranked as
+    one array. The same seed and residuals give the same bands.
+    """
+    forecast = np.asarray(forecast, dtype="float64")
+    r = np.asarray(residuals, dtype="float64")
+    r = r[np.isfinite(r)]
+    if len(r) == 0:
+        return np.tile(forecast, (len(quantiles), 1))
+    r = r - r.mean()
+
+    horizon = len(forecast)
+    years = -(-horizon // cycle)
+    rng = np.random.default_rng(seed)
+    # (paths, cycles, position within the cycle): errors accumulate across cycles
+    draws = rng.choice(r, size=(n_paths, years, cycle))
+    errors = np.cumsum(draws, axis=1).reshape(n_paths, years * cycle)[:, :horizon]
+    return np.quantile(forecast + errors, quantiles, axis=0)
+
+
+def fit_forecast(
+    values,
+    model_name: str,
+    horizon: int = MAX_HORIZON,
+    selection: tuple | None = None,
+    interval: str = "normal",
+    quantiles=BAND_QUANTILES,
+) -> dict:
+    """
+    Forecast `horizon` quarters after the quarterly series `values`, with a 95%
+    interval. Returns {"method", "forecast", "lower", "upper", "bands",
+    "residual_std", "score"} (arrays of length `horizon`). "auto" forecasts
+    with the model of `selection` ((name, score) from select_model), running
+    select_model serially when it is not given; `score` is the backtest error
+    of the model that made the forecast, None for fixed models. Any model that
+    can't be fitted falls back to naive.
+
+    interval="normal" is Z_95 * residual std, widening with the horizon.
+    interval="bootstrap" takes the interval and `bands` ({quantile: array}
+    for every one of `quantiles`) from bootstrap_bands.
+    """
+    y = np.asarray(values, dtype="float64")
+    score = None
+    if model_name == AUTO:
+        model_name, score = selection if selection is not None else select_model(y)[:2]
+        score = None if math.isnan(score) else score
+
+    if model_name != "naive":
+        try:
+            fitted = candidate_forecast(y, model_name, horizon)
+            return _with_interval(model_name, *fitted, score, interval, quantiles)
+        except Exception:
+            pass
+
+    if score is not None and model_name != "naive":
+        # The selected model's score doesn't describe the naive fallback
+        score = backtest_score(y, "naive")
+        score = score if math.isfinite(score) else None
+    fitted = candidate_forecast(y, "naive", horizon)
+    return _with_interval("naive", *fitted, score, interval, quantiles)
+
+
+def _with_interval(
+    method: str, forecast: np.ndarray, residual_std: float, residuals: np.ndarray, score, interval: str, quantiles
+) -> dict:
+    cycle = error_cycle(method)
+    out = {"method": method, "forecast": forecast, "bands": {}, "residual_std": residual_std, "score": score}
+    if interval == "bootstrap":
+        qs = sorted(set(quantiles) | {0.025, 0.975})
+        bands = dict(zip(qs, bootstrap_bands(forecast, residuals, cycle, qs)))
+        out["bands"] = {q: bands[q] for q in quantiles}
+        return {**out, "lower": bands[0.025], "upper": bands[0.975]}
+    if interval != "normal":
+        raise ValueError(f"unknown interval {interval!r}")
+    half_width = Z_95 * residual_std * np.sqrt((np.arange(len(forecast)) // cycle) + 1)
+    return {**out, "lower": forecast - half_width, "upper": forecast + half_width}
+
+
+class ForecastCache:
+    """
+    LRU cache of fitted forecasts keyed by (state, utilization type, model,
+    data version), or of auto model selections keyed by (state, utilization
+    type, data version). A new load changes the data version in every key, so
+    fits of older data are never served again and simply age out. Without a
+    data version nothing tells when the data changes, so callers pass a
+    `ttl_seconds` for those entries.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = int(max_entries)
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_fit(self, key: tuple, fit_fn, ttl_seconds: float | None = None):
+        """Return the cached forecast for `key`, calling `fit_fn()` on a miss (or once `ttl_seconds` passed)."""
+        if self.max_entries <= 0:
+            return fit_fn()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now < entry[0]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = fit_fn()
+
+        expires_at = float("inf") if ttl_seconds is None else time.monotonic() + ttl_seconds
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
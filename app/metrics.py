@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+
+def top_share_arrays(
+    cost_per_rx,
+    prescriptions,
+    spend,
+    share: float = 0.01,
+    total_rx: float | None = None,
+    total_spend: float | None = None,
+) -> float:
+    """
+    Fraction of total spend captured by the most expensive `share` of prescriptions.
+
+    Rows are ranked by cost per Rx (descending) and whole rows are taken while the
+    cumulative prescription count stays within the threshold; the first row that
+    crosses it contributes only the remaining fraction of its prescriptions.
+    Cumulative sums run in row order, so the result matches the row-by-row loop.
+
+    Pass `total_rx`/`total_spend` when the arrays only hold the leading rows of a
+    larger population (e.g. the head selected server-side).
+    """
+    cpp = np.asarray(cost_per_rx, dtype="float64")
+    rx = np.asarray(prescriptions, dtype="float64")
+    amt = np.asarray(spend, dtype="float64")
+
+    keep = ~(np.isnan(cpp) | np.isnan(rx) | np.isnan(amt)) & (rx > 0)
+    if not keep.any():
+        return 0.0
+    cpp, rx, amt = cpp[keep], rx[keep], amt[keep]
+
+    total_rx = float(rx.sum()) if total_rx is None else float(total_rx)
+    total_spend = float(amt.sum()) if total_spend is None else float(total_spend)
+    if total_rx <= 0 or total_spend <= 0:
+        return 0.0
+
+    order = np.argsort(-cpp, kind="stable")
+    cpp, rx = cpp[order], rx[order]
+
+    threshold = total_rx * share
+    cum_rx = np.cumsum(rx)
+    cum_spend = np.cumsum(cpp * rx)
+
+    # Number of leading rows that fit entirely inside the threshold.
+    k = int(np.searchsorted(cum_rx, threshold, side="right"))
+    top_spend = float(cum_spend[k - 1]) if k > 0 else 0.0
+    if k < len(rx):
+        remaining = threshold - (float(cum_rx[k - 1]) if k > 0 else 0.0)
+        if remaining > 0:
+            top_spend += float(cpp[k]) * remaining
+
+    return top_spend / total_spend
+
+
+def top1_spend_share(df_in: pd.DataFrame) -> float:
+    """
+    Top 1% spend share for a frame with cost_per_rx, number_of_prescriptions and
+    total_amount_reimbursed columns.
+    """
+    if df_in is None or df_in.empty:
+        return 0.0
+    dfc = df_in.dropna()
+    return top_share_arrays(
+        dfc["cost_per_rx"].to_numpy(dtype="float64"),
+        dfc["number_of_prescriptions"].to_numpy(dtype="float64"),
+        dfc["total_amount_reimbursed"].to_numpy(dtype="float64"),
+        share=0.01,
+    )
+
+
+def top1_spend_share_head(df_head: pd.DataFrame) -> float:
+    """
+    Top 1% spend share from a pre-selected head of the cost ranking.
+
+    Expects the leading rows by cost per Rx plus `total_rx`/`total_spend` columns
+    carrying the population totals (see the top-share query in the dashboard).
+    """
+    if df_head is None or df_head.empty:
+        return 0.0
+    return top_share_arrays(
+        df_head["cost_per_rx"].to_numpy(dtype="float64"),
+        df_head["number_of_prescriptions"].to_numpy(dtype="float64"),
+        df_head["total_amount_reimbursed"].to_numpy(dtype="float64"),
+        share=0.01,
+        total_rx=float(df_head["total_rx"].iloc[0]),
+        total_spend=float(df_head["total_spend"].iloc[0]),
+    )
@@ -0,0 +1,223 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+# 1%: every quantile is within 1% of the exact value. Bucket count grows with
+# 1 / accuracy; at 1% a cell spanning cents to thousands of dollars per Rx
+# needs a few hundred buckets, a few KB of JSON.
+RELATIVE_ACCURACY = 0.01
+# to_dict layout: 2 stores each bucket store as key deltas + counts (1 was {key: count})
+ENCODING = 2
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees (DDSketch-style).
+
+    Values are counted in logarithmic buckets, so any quantile estimate is within
+    `relative_accuracy` of the true value while memory depends only on the value
+    range, not on the number of values. Two sketches with the same accuracy merge
+    exactly, which lets chunks, partitions or cells be summarized independently.
+    count / mean / std / min / max are tracked exactly alongside the buckets.
+    """
+
+    def __init__(self, relative_accuracy: float = RELATIVE_ACCURACY, min_value: float = 1e-9):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = float(relative_accuracy)
+        self.min_value = float(min_value)
+        self._gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+        self.positive: dict = {}
+        self.negative: dict = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    # -- building ----------------------------------------------------------
+    def _keys(self, magnitudes: np.ndarray) -> np.ndarray:
+        return np.ceil(np.log(magnitudes) / self._log_gamma).astype("int64")
+
+    @staticmethod
+    def _add_counts(store: dict, keys: np.ndarray) -> None:
+        uniq, counts = np.unique(keys, return_counts=True)
+        for k, c in zip(uniq.tolist(), counts.tolist()):
+            store[k] = store.get(k, 0) + c
+
+    def update(self, values) -> "QuantileSketch":
+        """Add an array of values; NaN and +/-inf are ignored."""
+        x = np.asarray(values, dtype="float64")
+        x = x[np.isfinite(x)]
+        n = int(x.size)
+        if n == 0:
+            return self
+
+        pos = x[x >= self.min_value]
+        neg = x[x <= -self.min_value]
+        if pos.size:
+            self._add_counts(self.positive, self._keys(pos))
+        if neg.size:
+            self._add_counts(self.negative, self._keys(-neg))
+        self.zero_count += n - int(pos.size) - int(neg.size)
+
+        # Exact moments, combined with Chan et al.'s parallel update
+        self._merge_moments(n, float(x.sum()), float(((x - x.mean()) ** 2).sum()))
+        self.min = min(self.min, float(x.min()))
+        self.max = max(self.max, float(x.max()))
+        return self
+
+    def _merge_moments(self, n: int, total: float, m2: float) -> None:
+        if self.count == 0:
+            self.count, self.total, self._m2 = n, total, m2
+            return
+        delta = total / n - self.total / self.count
+        combined = self.count + n
+        self._m2 += m2 + delta * delta * self.count * n / combined
+        self.total += total
+        self.count = combined
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.relative_accuracy != self.relative_accuracy or other.min_value != self.min_value:
+            raise ValueError("can only merge sketches built with the same accuracy")
+        if other.count == 0:
+            return self
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for k, c in other_store.items():
+                store[k] = store.get(k, 0) + c
+        self.zero_count += other.zero_count
+        self._merge_moments(other.count, other.total, other._m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @classmethod
+    def merge_all(cls, sketches) -> "QuantileSketch":
+        """One sketch of everything in `sketches`, at their (shared) accuracy; empty if none."""
+        merged = None
+        for sketch in sketches:
+            if merged is None:
+                merged = cls(sketch.relative_accuracy, sketch.min_value)
+            merged.merge(sketch)
+        return merged if merged is not None else cls()
+
+    # -- reading -----------------------------------------------------------
+    def _value(self, key: int) -> float:
+        return 2.0 * self._gamma**key / (self._gamma + 1.0)
+
+    def _order_statistic(self, rank: int) -> float:
+        """Estimate of the `rank`-th smallest value (0-based)."""
+        seen = 0
+        for k in sorted(self.negative, reverse=True):
+            seen += self.negative[k]
+            if seen > rank:
+                return max(-self._value(k), self.min)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.positive):
+            seen += self.positive[k]
+            if seen > rank:
+                return min(self._value(k), self.max)
+        return self.max
+
+    def quantile(self, q: float) -> float:
+        """Linear interpolation between order statistics, like pandas and PERCENTILE_CONT."""
+        if self.count == 0:
+            return math.nan
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+
+        rank = q * (self.count - 1)
+        lo = math.floor(rank)
+        value = self._order_statistic(lo)
+        if rank > lo:
+            value += (rank - lo) * (self._order_statistic(lo + 1) - value)
+        return value
+
+    def histogram(self, nbins: int, upper: float) -> np.ndarray:
+        """
+        Counts in `nbins` equal-width bins over [0, upper]. Values above `upper`
+        or below 0 are left out and `upper` itself falls in the last bin. Each
+        bucket is counted at its representative value, so a value can only land
+        in a neighbouring bin when it is within `relative_accuracy` of a bin edge.
+        """
+        counts = np.zeros(int(nbins), dtype="int64")
+        if self.count == 0 or upper <= 0:
+            return counts
+        counts[0] += self.zero_count
+        keys = np.fromiter(self.positive, dtype="int64", count=len(self.positive))
+        n = np.fromiter(self.positive.values(), dtype="int64", count=len(self.positive))
+        values = np.clip(2.0 * self._gamma ** keys.astype("float64") / (self._gamma + 1.0), self.min, self.max)
+        inside = values <= upper
+        bins = np.minimum((values[inside] * nbins / upper).astype("int64"), nbins - 1)
+        np.add.at(counts, bins, n[inside])
+        return counts
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else math.nan
+
+    @property
+    def std(self) -> float:
+        # Sample standard deviation (ddof=1), as in pandas
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def describe(self, percentiles=(0.25, 0.5, 0.75)) -> pd.Series:
+        """Same index layout as `pd.Series.describe(percentiles=...)`."""
+        pcts = sorted(set(percentiles) | {0.5})
+        index = ["count", "mean", "std", "min"] + [f"{p * 100:g}%" for p in pcts] + ["max"]
+        values = [float(self.count), self.mean, self.std, self.min if self.count else math.nan]
+        values += [self.quantile(p) for p in pcts]
+        values.append(self.max if self.count else math.nan)
+        return pd.Series(values, index=index)
+
+    # -- persistence -------------------------------------------------------
+    @staticmethod
+    def _encode_store(store: dict) -> dict:
+        """Sorted keys as deltas (mostly 1) and their counts: small JSON integers."""
+        keys = sorted(store)
+        return {"key_deltas": np.diff(keys, prepend=0).tolist(), "counts": [store[k] for k in keys]}
+
+    @staticmethod
+    def _decode_store(data: dict, encoding: int) -> dict:
+        if encoding < 2:
+            return {int(k): int(v) for k, v in data.items()}
+        keys = np.cumsum(data["key_deltas"], dtype="int64").tolist()
+        return dict(zip(keys, map(int, data["counts"])))
+
+    def to_dict(self) -> dict:
+        return {
+            "encoding": ENCODING,
+            "relative_accuracy": self.relative_accuracy,
+            "min_value": self.min_value,
+            "positive": self._encode_store(self.positive),
+            "negative": self._encode_store(self.negative),
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "total": self.total,
+            "m2": self._m2,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(data["relative_accuracy"], data["min_value"])
+        encoding = data.get("encoding", 1)
+        sketch.positive = cls._decode_store(data["positive"], encoding)
+        sketch.negative = cls._decode_store(data["negative"], encoding)
+        sketch.zero_count = int(data["zero_count"])
+        sketch.count = int(data["count"])
+        sketch.total = float(data["total"])
+        sketch._m2 = float(data["m2"])
+        if sketch.count:
+            sketch.min = float(data["min"])
+            sketch.max = float(data["max"])
+        return sketch
@@ -0,0 +1,432 @@
+"""
+SQL behind the dashboard's executive tab.
+
+Kept free of app state so other tools (e.g. scripts/05_migrate_analytics.py)
+can time exactly the statements the dashboard runs. Statements are rendered
+for the backend's dialect: T-SQL for SQL Server, or DuckDB for the embedded
+Parquet backend (see backends.py).
+"""
+
+
+# -----------------------------
+# Dialects
+# -----------------------------
+class SqlDialect:
+    """T-SQL rendering of the few constructs that differ between backends."""
+
+    name = "mssql"
+    float_type = "FLOAT"
+
+    def quote(self, ident: str) -> str:
+        return f"[{ident}]"
+
+    def top(self, n: int) -> str:
+        # Goes right after SELECT
+        return f"TOP {n} "
+
+    def limit(self, n: int) -> str:
+        # Goes after ORDER BY
+        return ""
+
+    def first_token(self, expr: str) -> str:
+        return f"LEFT({expr}, CHARINDEX(' ', {expr} + ' ') - 1)"
+
+    def quantile_over_all(self, q: float, expr: str) -> str:
+        return f"PERCENTILE_CONT({q}) WITHIN GROUP (ORDER BY {expr}) OVER ()"
+
+
+class DuckDBDialect(SqlDialect):
+    name = "duckdb"
+    float_type = "DOUBLE"
+
+    def quote(self, ident: str) -> str:
+        return f'"{ident}"'
+
+    def top(self, n: int) -> str:
+        return ""
+
+    def limit(self, n: int) -> str:
+        return f" LIMIT {n}"
+
+    def first_token(self, expr: str) -> str:
+        return f"split_part({expr}, ' ', 1)"
+
+    def quantile_over_all(self, q: float, expr: str) -> str:
+        return f"quantile_cont({expr}, {q}) OVER ()"
+
+
+MSSQL = SqlDialect()
+DUCKDB = DuckDBDialect()
+
+
+def dialect_for(name: str) -> SqlDialect:
+    """Dialect for a SQLAlchemy dialect name; anything unknown is treated as SQL Server."""
+    return DUCKDB if name == "duckdb" else MSSQL
+
+
+# -----------------------------
+# KPI cube (state x year x quarter x utilization type)
+# -----------------------------
+# Built by scripts/04_phase3_eda_kpis.py. The KPI table and trend lines read a few
+# hundred cube rows instead of scanning dbo.sdud_analytics; national figures are
+# the sum of the state rows. The cube keeps rows without a state as their own
+# cells; like `state <> 'XX'` over the analytics rows, national figures leave
+# them out. Without the gold table, an equivalent derived table
+# over the analytics rows keeps the queries working.
+KPI_CUBE_TABLE = "dbo.sdud_gold_kpi_cube"
+
+
+def kpi_cube_fallback(dialect: SqlDialect = MSSQL) -> str:
+    y = dialect.quote("year")
+    return f"""(
+  SELECT
+    state, {y}, quarter, year_quarter, utilization_type,
+    SUM(total_amount_reimbursed) AS total_amount_reimbursed,
+    SUM(medicaid_amount_reimbursed) AS medicaid_amount_reimbursed,
+    SUM(number_of_prescriptions) AS total_prescriptions,
+    SUM(units_reimbursed) AS total_units_reimbursed
+  FROM dbo.sdud_analytics
+  WHERE state <> 'XX'
+  GROUP BY state, {y}, quarter, year_quarter, utilization_type
+) AS kpi_cube"""
+
+
+def kpi_cube_cells_sql(kpi_cube: str | None = None, dialect: SqlDialect = MSSQL) -> str:
+    """One row per cube cell, for the in-process array cube (array_cube.py)."""
+    y = dialect.quote("year")
+    return f"""
+SELECT
+  state, {y}, quarter, utilization_type,
+  SUM(total_amount_reimbursed) AS total_amount_reimbursed,
+  SUM(medicaid_amount_reimbursed) AS medicaid_amount_reimbursed,
+  SUM(total_prescriptions) AS total_prescriptions,
+  SUM(total_units_reimbursed) AS total_units_reimbursed
+FROM {kpi_cube or kpi_cube_fallback(dialect)}
+GROUP BY state, {y}, quarter, utilization_type;
+"""
+
+
+# -----------------------------
+# Top cost drivers (therapeutic class = first token of the product name)
+# -----------------------------
+# The class key is materialized at load time (thera_class column on the analytics
+# table, see scripts/02_ingest_csv.py) and pre-aggregated per slice in
+# dbo.sdud_gold_top_drivers by scripts/04_phase3_eda_kpis.py. Older loads
+# without either fall back to deriving it per row.
+TOP_DRIVERS_TABLE = "dbo.sdud_gold_top_drivers"
+
+
+def thera_class_expr(dialect: SqlDialect = MSSQL) -> str:
+    return dialect.first_token("product_name_norm")
+
+
+# -----------------------------
+# Cost per Rx sketches
+# -----------------------------
+# One mergeable quantile sketch per state/year/quarter/utilization cell, written
+# by scripts/04_phase3_eda_kpis.py (see app/quantile_sketch.py). The histogram
+# and its p99 cap come from merging a handful of cells instead of reading every
+# analytics row of the slice.
+CPP_SKETCH_TABLE = "dbo.sdud_gold_cpp_sketch"
+
+# -----------------------------
+# Executive tab statements
+# -----------------------------
+CPP_NBINS = 60
+
+
+def int_literal(value) -> str:
+    """A validated integer rendered into the SQL text (for fixed constants, not user input)."""
+    if isinstance(value, bool) or int(value) != value:
+        raise ValueError(f"not an integer: {value!r}")
+    return str(int(value))
+
+
+def executive_statements(
+    state,
+    year,
+    quarter,
+    util_type,
+    scope,
+    kpi_cube: str | None = None,
+    top_drivers_table: str | None = None,
+    thera_class: str | None = None,
+    cpp_sketch_table: str | None = None,
+    dialect: SqlDialect = MSSQL,
+) -> dict:
+    """
+    SQL behind the executive tab as {name: (kind, sql, params)}; kind is "row"
+    (fetch_one) or "frame" (read_sql). National statements are only included
+    in State vs National scope.
+
+    `kpi_cube` is the cube table (None for the derived-table fallback),
+    `top_drivers_table` the pre-aggregated top drivers table (None to aggregate
+    the analytics rows) and `thera_class` the class column on the analytics table
+    (None to derive it from the product name). With `cpp_sketch_table` the
+    cost-per-Rx histogram is replaced by "cpp_sketches", the cells' sketches to
+    merge client-side.
+    """
+    d = dialect
+    y = d.quote("year")
+    kpi_cube = kpi_cube or kpi_cube_fallback(d)
+    thera_class = thera_class or thera_class_expr(d)
+    params_state = {"state": state, "year": int(year), "quarter": int(quarter), "util": util_type}
+    params_nat = {"year": int(year), "quarter": int(quarter), "util": util_type}
+
+    # KPI
+    kpi_state_sql = f"""
+SELECT
+  SUM(total_amount_reimbursed) AS total_reimbursed,
+  SUM(medicaid_amount_reimbursed) AS medicaid_reimbursed,
+  SUM(total_prescriptions) AS prescriptions,
+  SUM(total_units_reimbursed) AS units
+FROM {kpi_cube}
+WHERE state = :state AND {y} = :year AND quarter = :quarter AND utilization_type = :util;
+"""
+    kpi_nat_sql = f"""
+SELECT
+  SUM(total_amount_reimbursed) AS total_reimbursed,
+  SUM(medicaid_amount_reimbursed) AS medicaid_reimbursed,
+  SUM(total_prescriptions) AS prescriptions,
+  SUM(total_units_reimbursed) AS units
+FROM {kpi_cube}
+WHERE state IS NOT NULL AND {y} = :year AND quarter = :quarter AND utilization_type = :util;
+"""
+
+    # Per-state ranking of the slice
+    ranking_sql = f"""
+SELECT
+  state,
+  SUM(total_amount_reimbursed) AS total_reimbursed,
+  SUM(medicaid_amount_reimbursed) AS medicaid_reimbursed,
+  SUM(total_prescriptions) AS prescriptions,
+  SUM(total_units_reimbursed) AS units
+FROM {kpi_cube}
+WHERE state IS NOT NULL AND {y} = :year AND quarter = :quarter AND utilization_type = :util
+GROUP BY state;
+"""
+
+    # Trend
+    trend_state_sql = f"""
+SELECT year_quarter, quarter, SUM(total_amount_reimbursed) AS total_reimbursed
+FROM {kpi_cube}
+WHERE state = :state AND {y} = :year AND utilization_type = :util
+GROUP BY year_quarter, quarter
+ORDER BY quarter;
+"""
+    trend_nat_sql = f"""
+SELECT year_quarter, quarter, SUM(total_amount_reimbursed) AS total_reimbursed
+FROM {kpi_cube}
+WHERE state IS NOT NULL AND {y} = :year AND utilization_type = :util
+GROUP BY year_quarter, quarter
+ORDER BY quarter;
+"""
+
+    # Top drivers (first token proxy)
+    if top_drivers_table:
+        # One pre-aggregated row per class and slice: the state query is an index seek
+        top_state_sql = f"""
+SELECT {d.top(15)}thera_class, total_reimbursed
+FROM {top_drivers_table}
+WHERE state = :state AND {y} = :year AND quarter = :quarter AND utilization_type = :util
+ORDER BY total_reimbursed DESC{d.limit(15)};
+"""
+        top_nat_sql = f"""
+SELECT {d.top(15)}thera_class, SUM(total_reimbursed) AS total_reimbursed
+FROM {top_drivers_table}
+WHERE {y} = :year AND quarter = :quarter AND utilization_type = :util
+GROUP BY thera_class
+ORDER BY total_reimbursed DESC{d.limit(15)};
+"""
+    else:
+        top_state_sql = f"""
+SELECT {d.top(15)}
+  {thera_class} AS thera_class,
+  SUM(total_amount_reimbursed) AS total_reimbursed
+FROM dbo.sdud_analytics
+WHERE state = :state AND {y} = :year AND quarter = :quarter AND utilization_type = :util
+GROUP BY {thera_class}
+ORDER BY total_reimbursed DESC{d.limit(15)};
+"""
+        top_nat_sql = f"""
+SELECT {d.top(15)}
+  {thera_class} AS thera_class,
+  SUM(total_amount_reimbursed) AS total_reimbursed
+FROM dbo.sdud_analytics
+WHERE state <> 'XX' AND {y} = :year AND quarter = :quarter AND utilization_type = :util
+GROUP BY {thera_class}
+ORDER BY total_reimbursed DESC{d.limit(15)};
+"""
+
+    # Cost per Rx distribution + top 1% spend share
+    # Both are computed server-side: the histogram comes back as pre-counted bins
+    # (60 equal-width bins over [0, p99], the p99 taken over every qualifying row)
+    # and the top-share query returns only the rows that make up the top 1%.
+    cpp_state_rows = f"""
+  SELECT
+    'State' AS scope,
+    (total_amount_reimbursed / NULLIF(number_of_prescriptions, 0)) AS cost_per_rx,
+    number_of_prescriptions,
+    total_amount_reimbursed
+  FROM dbo.sdud_analytics
+  WHERE state = :state AND {y} = :year AND quarter = :quarter AND utilization_type = :util
+    AND number_of_prescriptions > 0 AND total_amount_reimbursed IS NOT NULL
+"""
+    cpp_nat_rows = f"""
+  SELECT
+    'National' AS scope,
+    (total_amount_reimbursed / NULLIF(number_of_prescriptions, 0)) AS cost_per_rx,
+    number_of_prescriptions,
+    total_amount_reimbursed
+  FROM dbo.sdud_analytics
+  WHERE state <> 'XX' AND {y} = :year AND quarter = :quarter AND utilization_type = :util
+    AND number_of_prescriptions > 0 AND total_amount_reimbursed IS NOT NULL
+"""
+
+    # The bin count is a constant: rendered as a literal so SQL Server types the
+    # bucket expression from it instead of from an untyped parameter
+    nbins = int_literal(CPP_NBINS)
+
+    def cpp_hist_sql(rows: str) -> str:
+        return f"""
+WITH c AS ({rows}),
+cap AS (
+  SELECT DISTINCT {d.quantile_over_all(0.99, 'cost_per_rx')} AS x_max
+  FROM c
+),
+binned AS (
+  SELECT
+    c.scope,
+    cap.x_max,
+    CASE
+      WHEN cap.x_max <= 0 THEN 0
+      WHEN c.cost_per_rx >= cap.x_max THEN {nbins} - 1
+      ELSE CAST(FLOOR(c.cost_per_rx * {nbins} / cap.x_max) AS INT)
+    END AS bin
+  FROM c CROSS JOIN cap
+  WHERE c.cost_per_rx >= 0 AND c.cost_per_rx <= cap.x_max
+)
+SELECT scope, bin, MAX(x_max) AS x_max, COUNT(*) AS n
+FROM binned
+GROUP BY scope, bin
+ORDER BY scope, bin;
+"""
+
+    def top_share_sql(rows: str) -> str:
+        return f"""
+WITH c AS ({rows}),
+ranked AS (
+  SELECT
+    cost_per_rx,
+    number_of_prescriptions,
+    total_amount_reimbursed,
+    SUM(number_of_prescriptions) OVER (ORDER BY cost_per_rx DESC ROWS UNBOUNDED PRECEDING) AS cum_rx,
+    SUM(CAST(number_of_prescriptions AS {d.float_type})) OVER () AS total_rx,
+    SUM(CAST(total_amount_reimbursed AS {d.float_type})) OVER () AS total_spend
+  FROM c
+)
+SELECT cost_per_rx, number_of_prescriptions, total_amount_reimbursed, total_rx, total_spend
+FROM ranked
+WHERE cum_rx - number_of_prescriptions < 0.01 * total_rx
+ORDER BY cost_per_rx DESC;
+"""
+
+    if scope == "state_vs_national":
+        # One cap and one set of bins across both scopes so the overlay lines up
+        hist_sql = cpp_hist_sql(cpp_state_rows + "  UNION ALL" + cpp_nat_rows)
+    else:
+        hist_sql = cpp_hist_sql(cpp_state_rows)
+
+    cpp_sketches_sql = f"""
+SELECT 'State' AS scope, sketch
+FROM {cpp_sketch_table}
+WHERE state = :state AND {y} = :year AND quarter = :quarter AND utilization_type = :util
+"""
+    if scope == "state_vs_national":
+        cpp_sketches_sql += f"""UNION ALL
+SELECT 'National' AS scope, sketch
+FROM {cpp_sketch_table}
+WHERE state <> 'XX' AND {y} = :year AND quarter = :quarter AND utilization_type = :util
+"""
+
+    # Filtered data sample (first 5000 rows)
+    filtered_head_sql = f"""
+SELECT {d.top(5000)}*
+FROM dbo.sdud_analytics
+WHERE state = :state AND {y} = :year AND quarter = :quarter AND utilization_type = :util{d.limit(5000)};
+"""
+
+    statements = {
+        "kpi_state": ("row", kpi_state_sql, params_state),
+        "trend_state": ("frame", trend_state_sql, {"state": state, "year": int(year), "util": util_type}),
+        "top_state": ("frame", top_state_sql, params_state),
+        "share_state": ("frame", top_share_sql(cpp_state_rows), params_state),
+        "head": ("frame", filtered_head_sql, params_state),
+        "ranking": ("frame", ranking_sql, params_nat),
+    }
+    if cpp_sketch_table:
+        statements["cpp_sketches"] = ("frame", cpp_sketches_sql, params_state)
+    else:
+        statements["cpp_hist"] = ("frame", hist_sql, params_state)
+    if scope == "state_vs_national":
+        statements.update(
+            {
+                "kpi_nat": ("row", kpi_nat_sql, params_nat),
+                "trend_nat": ("frame", trend_nat_sql, {"year": int(year), "util": util_type}),
+                "top_nat": ("frame", top_nat_sql, params_nat),
+                "share_nat": ("frame", top_share_sql(cpp_nat_rows), params_nat),
+            }
+        )
+    return statements
+
+
+# -----------------------------
+# Forecast series
+# -----------------------------
+# Quarterly total reimbursed per state and utilization type. The dashboard reads
+# one series; scripts/07_batch_forecasts.py reads all of them in one query and
+# writes their forecasts to dbo.sdud_gold_forecasts.
+FORECASTS_TABLE = "dbo.sdud_gold_forecasts"
+
+
+def state_series_sql(dialect: SqlDialect = MSSQL) -> str:
+    y = dialect.quote("year")
+    return f"""
+SELECT
+  {y},
+  quarter,
+  MIN(year_quarter) AS year_quarter,
+  SUM(total_amount_reimbursed) AS total_reimbursed
+FROM dbo.sdud_analytics
+WHERE state = :state AND utilization_type = :util
+GROUP BY {y}, quarter
+ORDER BY {y}, quarter;
+"""
+
+
+def all_series_sql(dialect: SqlDialect = MSSQL) -> str:
+    y = dialect.quote("year")
+    return f"""
+SELECT
+  state,
+  utilization_type,
+  {y},
+  quarter,
+  SUM(total_amount_reimbursed) AS total_reimbursed
+FROM dbo.sdud_analytics
+WHERE state IS NOT NULL AND state <> 'XX' AND utilization_type IS NOT NULL
+  AND {y} IS NOT NULL AND quarter IS NOT NULL
+GROUP BY state, utilization_type, {y}, quarter
+ORDER BY state, utilization_type, {y}, quarter;
+"""
+
+
+def stored_forecast_sql(forecasts_table: str = FORECASTS_TABLE) -> str:
+    return f"""
+SELECT step, period, method, forecast, lower_bound, upper_bound, lower_80, upper_80, score, fitted_at
+FROM {forecasts_table}
+WHERE state = :state AND utilization_type = :util AND model = :model AND interval_method = :interval
+  AND data_version = :data_version
+ORDER BY step;
+"""
+
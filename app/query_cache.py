@@ -0,0 +1,123 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace and trailing semicolons so formatting doesn't split cache keys."""
+    return _WS.sub(" ", str(sql)).strip().rstrip(";").strip()
+
+
+def make_key(sql: str, params: dict | None) -> tuple:
+    items = tuple(sorted((params or {}).items()))
+    return normalize_sql(sql), items
+
+
+class QueryCache:
+    """
+    LRU + TTL cache for query results, keyed on normalized SQL text plus bound params.
+
+    `version_fn` returns the current data-version marker (e.g. the ETL load
+    timestamp). It is polled at most every `version_check_seconds`; when the
+    value changes every entry is dropped.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 900.0,
+        version_fn=None,
+        version_check_seconds: float = 30.0,
+    ):
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+        self.version_fn = version_fn
+        self.version_check_seconds = float(version_check_seconds)
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._version = None
+        self._version_checked_at = float("-inf")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def _check_version(self, now: float) -> None:
+        if self.version_fn is None or now - self._version_checked_at < self.version_check_seconds:
+            return
+        self._version_checked_at = now
+        try:
+            version = self.version_fn()
+        except Exception:
+            return
+        with self._lock:
+            if version != self._version:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self._version = version
+
+    def current_version(self):
+        """Data-version marker as of the last check (re-polled when due)."""
+        self._check_version(time.monotonic())
+        return self._version
+
+    def get_or_load(self, sql: str, params: dict | None, loader):
+        """Return the cached result for (sql, params), calling `loader()` on a miss."""
+        if not self.enabled:
+            return loader()
+
+        now = time.monotonic()
+        self._check_version(now)
+        key = make_key(sql, params)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            version = self._version
+
+        value = loader()
+
+        with self._lock:
+            # Don't store results loaded against a version that was invalidated meanwhile
+            if version == self._version:
+                self._entries[key] = (time.monotonic(), value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "data_version": None if self._version is None else str(self._version),
+            }
@@ -0,0 +1,13 @@
+"""
+Start the dashboard: python app/serve.py
+
+The server runs from the imported `dashboard` module instead of dashboard.py
+being the main script. The model selection workers (forecasting.selection_pool)
+are spawned processes, which re-import the main script as __mp_main__: this
+file is a no-op then, whereas dashboard.py would rebuild the engine, caches,
+array cube and Dash app in every worker.
+"""
+if __name__ == "__main__":
+    import dashboard
+
+    dashboard.main()
@@ -0,0 +1,48 @@
+from dash import dash_table
+from dash.dash_table import FormatTemplate
+from dash.dash_table.Format import Format, Group, Scheme
+
+# Column formats. Callbacks send raw numbers; the DataTable formats them in the
+# browser (d3-format specifiers), so no per-cell string formatting in Python.
+MONEY0 = FormatTemplate.money(0)
+MONEY2 = FormatTemplate.money(2)
+NUM0 = Format(precision=0, scheme=Scheme.fixed, group=Group.yes)
+PCT2 = FormatTemplate.percentage(2)
+
+HEADER_STYLE = {"fontWeight": "600", "backgroundColor": "#fafafa", "borderBottom": "1px solid #ddd"}
+CELL_STYLE = {
+    "fontFamily": "inherit",
+    "fontSize": "14px",
+    "padding": "8px",
+    "border": "none",
+    "borderBottom": "1px solid #f0f0f0",
+    "minWidth": "110px",
+}
+
+
+def column(col_id: str, name: str, fmt=None) -> dict:
+    """DataTable column spec; `fmt` (one of the formats above) makes it a right-aligned numeric column."""
+    if fmt is None:
+        return {"id": col_id, "name": name, "type": "text"}
+    return {"id": col_id, "name": name, "type": "numeric", "format": fmt}
+
+
+def data_table(table_id: str, columns: list[dict], height: str = "360px", **kwargs) -> dash_table.DataTable:
+    """
+    Read-only, virtualized table: only the rows scrolled into the `height`
+    viewport are rendered, so tables of thousands of rows stay cheap.
+    """
+    return dash_table.DataTable(
+        id=table_id,
+        columns=columns,
+        data=[],
+        virtualization=True,
+        fixed_rows={"headers": True},
+        page_action="none",
+        style_table={"height": height, "overflowY": "auto"},
+        style_as_list_view=True,
+        style_header=HEADER_STYLE,
+        style_cell=CELL_STYLE,
+        style_cell_conditional=[{"if": {"column_type": "text"}, "textAlign": "left"}],
+        **kwargs,
+    )
@@ -1,5 +1,37 @@
+"""
+Phase 3 EDA + gold KPI tables from dbo.sdud_silver.
+
+    python scripts/04_phase3_eda_kpis.py                                  # whole table in memory
+    python scripts/04_phase3_eda_kpis.py --mode chunked --chunk-rows 200000
+    python scripts/04_phase3_eda_kpis.py --mode pushdown                  # aggregate on SQL Server
+    python scripts/04_phase3_eda_kpis.py --mode incremental               # only new/changed quarters
+
+`chunked` streams silver in fixed-size chunks with compact dtypes and folds each
+chunk into running aggregates, so peak memory depends on the chunk size and the
+number of groups, not on the table size. Sums, counts, mean and std match the
+in-memory mode; cost-per-Rx percentiles come from a mergeable quantile sketch
+and are within 1% of the exact values.
+
+`pushdown` runs the aggregations as a handful of T-SQL queries and only moves
+the results (a few hundred rows) over ODBC; percentiles use PERCENTILE_CONT,
+which interpolates like pandas.
+
+`incremental` re-aggregates only the (year, quarter) partitions that changed
+since the last run (see the watermark section below) and merges them in.
+"""
+import argparse
+import datetime as dt
+import json
+import sys
+import time
+from pathlib import Path
+
 import pandas as pd
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+from quantile_sketch import RELATIVE_ACCURACY, QuantileSketch  # noqa: E402
+from bulk_writer import bulk_merge, bulk_replace  # noqa: E402
 
 # --- connection ---
 conn_str = (
@@ -7,18 +39,9 @@ conn_str = (
     "?driver=ODBC+Driver+18+for+SQL+Server"
     "&TrustServerCertificate=yes"
 )
-engine = create_engine(conn_str)
-
-# --- load a light slice first (fast dev) ---
-df = pd.read_sql("SELECT * FROM dbo.sdud_silver;", engine)
-
-print("\n✅ Loaded from SQL:", df.shape)
+# fast_executemany: gold tables are bulk-loaded in parameter arrays (see bulk_writer.py)
+engine = create_engine(conn_str, fast_executemany=True)
 
-# 1) Suppression rate
-supp_rate = df["is_suppressed"].mean()
-print(f"\n📌 Suppression rate: {supp_rate:.2%}")
-
-# 2) Coverage of numeric fields (non-null)
 num_cols = [
     "units_reimbursed",
     "number_of_prescriptions",
@@ -26,79 +49,693 @@ num_cols = [
     "medicaid_amount_reimbursed",
     "non_medicaid_amount_reimbursed",
 ]
-coverage = df[num_cols].notna().mean().sort_values(ascending=False)
-print("\n📌 Numeric coverage (non-null proportion):")
-print((coverage * 100).round(2).astype(str) + "%")
+CUBE_KEYS = ["state", "year", "quarter", "year_quarter", "utilization_type"]
+TOP_DRIVER_KEYS = ["state", "year", "quarter", "utilization_type", "thera_class"]
+CPP_PERCENTILES = [0.5, 0.9, 0.95, 0.99]
 
-# 3) Top states by total reimbursed (excluding suppressed rows)
-df_nonsupp = df[df["is_suppressed"] == False].copy()
+# Chunked mode reads only the columns it aggregates. Low-cardinality text is
+# categorical and year/quarter are small ints; measures stay float64 so the sums
+# match the in-memory mode exactly.
+SILVER_COLUMNS_SQL = """
+SELECT state, [year], quarter, year_quarter, utilization_type, product_name, is_suppressed,
+       units_reimbursed, number_of_prescriptions, total_amount_reimbursed,
+       medicaid_amount_reimbursed, non_medicaid_amount_reimbursed
+FROM dbo.sdud_silver;
+"""
+SILVER_DTYPES = {
+    "state": "category",
+    "year": "Int16",
+    "quarter": "Int8",
+    "year_quarter": "category",
+    "utilization_type": "category",
+    "product_name": "category",
+    "is_suppressed": "boolean",
+    **{c: "float64" for c in num_cols},
+}
 
-# normalize product name for consistent grouping (operate on non-suppressed slice)
-df_nonsupp["product_name_norm"] = (
-    df_nonsupp["product_name"].str.upper().str.strip()
-)
 
-# exclude placeholder state code 'XX' for state-level KPIs
-df_state = df_nonsupp[df_nonsupp["state"] != "XX"].copy()
+# Top cost drivers per slice, read by the dashboard's "top cost drivers" chart. The
+# therapeutic class proxy is the first token of the normalized product name, the
+# same key the dashboard used to derive per row with LEFT/CHARINDEX.
+TOP_DRIVERS = "sdud_gold_top_drivers"
+TOP_DRIVERS_INDEX = """
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID(N'{table}') AND name = N'CIX_sdud_gold_top_drivers')
+  CREATE CLUSTERED INDEX CIX_sdud_gold_top_drivers ON {table} ([year], quarter, utilization_type, state, total_reimbursed DESC);
+"""
 
-top_states = (
-    df_state.groupby("state", as_index=False)["total_amount_reimbursed"]
-    .sum()
-    .sort_values("total_amount_reimbursed", ascending=False)
-    .head(10)
-)
-print("\n📌 Top 10 states by Total Amount Reimbursed (non-suppressed only):")
-print(top_states)
-
-# 4) High-cost drugs (top 10 by total reimbursed)
-top_drugs = (
-    df_state.groupby("product_name_norm", as_index=False)["total_amount_reimbursed"]
-    .sum()
-    .sort_values("total_amount_reimbursed", ascending=False)
-    .head(10)
-)
-print("\n📌 Top 10 drugs by Total Amount Reimbursed (non-suppressed only):")
-print(top_drugs)
-
-# --- Persist summary tables back to SQL ---
-# 1) State-level KPIs (full states summary)
-state_kpis = (
-    df_state.groupby("state", as_index=False)
-    .agg(
-        total_amount_reimbursed=("total_amount_reimbursed", "sum"),
-        total_prescriptions=("number_of_prescriptions", "sum"),
-        total_units_reimbursed=("units_reimbursed", "sum"),
-        rows=("state", "count"),
+
+# Cost per Rx sketches, one per cell (state x year x quarter x utilization type,
+# 'XX' and NULL keys included), read by the dashboard's cost distribution chart.
+# National, multi-quarter and overall distributions are merges of cells, with no
+# rescan of rows: merging is exact, and every quantile of a merged sketch is
+# within RELATIVE_ACCURACY (1%) of the exact order statistic.
+CPP_SKETCH = "sdud_gold_cpp_sketch"
+CPP_CELL_KEYS = ["state", "year", "quarter", "utilization_type"]
+CPP_SKETCH_INDEX = """
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID(N'{table}') AND name = N'CIX_sdud_gold_cpp_sketch')
+  CREATE CLUSTERED INDEX CIX_sdud_gold_cpp_sketch ON {table} ([year], quarter, utilization_type, state);
+"""
+
+
+def add_cell_sketches(sketches: dict, rows: pd.DataFrame) -> dict:
+    """Fold the cost per Rx of (non-suppressed) `rows` into `sketches`, keyed by cell."""
+    cpp = (rows["total_amount_reimbursed"] / rows["number_of_prescriptions"]).astype("float64")
+    for key, values in cpp.groupby([rows[k] for k in CPP_CELL_KEYS], dropna=False, observed=True):
+        state, year, quarter, util = (None if pd.isna(v) else v for v in key)
+        key = (
+            None if state is None else str(state),
+            None if year is None else int(year),
+            None if quarter is None else int(quarter),
+            None if util is None else str(util),
+        )
+        sketches.setdefault(key, QuantileSketch()).update(values.to_numpy())
+    return sketches
+
+
+def cell_sketch_rows(sketches: dict) -> pd.DataFrame:
+    """One row per non-empty cell: CPP_CELL_KEYS, n and the sketch as JSON."""
+    rows = [
+        {**dict(zip(CPP_CELL_KEYS, key)), "n": sk.count, "sketch": json.dumps(sk.to_dict())}
+        for key, sk in sketches.items()
+        if sk.count
+    ]
+    return pd.DataFrame(rows, columns=[*CPP_CELL_KEYS, "n", "sketch"])
+
+
+def merge_sketches(sketches) -> QuantileSketch:
+    return QuantileSketch.merge_all(sketches)
+
+
+def stored_sketch_accuracy(engine):
+    """Relative accuracy the stored cell sketches were built with (None if there are none)."""
+    with engine.connect() as conn:
+        row = conn.execute(text(f"SELECT sketch FROM dbo.{CPP_SKETCH}")).first()
+    return None if row is None else json.loads(row[0])["relative_accuracy"]
+
+
+def thera_class(product_name_norm: pd.Series) -> pd.Series:
+    return product_name_norm.str.split(" ", n=1).str[0]
+
+
+STATE_KPI_MEASURES = ["total_amount_reimbursed", "total_prescriptions", "total_units_reimbursed", "rows"]
+
+
+def state_kpis_from_cube(kpi_cube: pd.DataFrame) -> pd.DataFrame:
+    """State KPIs as a roll-up of cube rows (NULL states are dropped, as in groupby)."""
+    return kpi_cube.dropna(subset=["state"]).groupby("state", as_index=False)[STATE_KPI_MEASURES].sum()
+
+
+# -----------------------------
+# In-memory mode
+# -----------------------------
+def eda_in_memory(engine) -> dict:
+    df = pd.read_sql("SELECT * FROM dbo.sdud_silver;", engine)
+    print("\n✅ Loaded from SQL:", df.shape)
+
+    # 1) Suppression rate
+    supp_rate = df["is_suppressed"].mean()
+
+    # 2) Coverage of numeric fields (non-null)
+    coverage = df[num_cols].notna().mean()
+
+    # 3) Non-suppressed rows; normalize product name for consistent grouping
+    df_nonsupp = df[df["is_suppressed"] == False].copy()
+    df_nonsupp["product_name_norm"] = df_nonsupp["product_name"].str.upper().str.strip()
+
+    # exclude placeholder state code 'XX' for state-level KPIs
+    df_state = df_nonsupp[df_nonsupp["state"] != "XX"].copy()
+
+    # 4) High-cost drugs (by total reimbursed)
+    drug_totals = df_state.groupby("product_name_norm")["total_amount_reimbursed"].sum()
+
+    # State-level KPIs (full states summary)
+    state_kpis = (
+        df_state.groupby("state", as_index=False)
+        .agg(
+            total_amount_reimbursed=("total_amount_reimbursed", "sum"),
+            total_prescriptions=("number_of_prescriptions", "sum"),
+            total_units_reimbursed=("units_reimbursed", "sum"),
+            rows=("state", "count"),
+        )
     )
-)
 
-print("\n➡️ Writing `sdud_gold_state_kpis` to SQL (replace)...")
-state_kpis.to_sql("sdud_gold_state_kpis", engine, if_exists="replace", index=False)
+    # KPI cube (state x year x quarter x utilization type) read by the dashboard.
+    # National figures are the sum of the state rows, so 'XX' stays excluded here too.
+    kpi_cube = (
+        df_state.groupby(CUBE_KEYS, as_index=False, dropna=False)
+        .agg(
+            total_amount_reimbursed=("total_amount_reimbursed", "sum"),
+            medicaid_amount_reimbursed=("medicaid_amount_reimbursed", "sum"),
+            total_prescriptions=("number_of_prescriptions", "sum"),
+            total_units_reimbursed=("units_reimbursed", "sum"),
+            rows=("state", "count"),
+        )
+    )
 
-# 2) Top drugs (we'll persist the top-10 table as computed)
-print("➡️ Writing `sdud_gold_top_drugs` to SQL (replace)...")
-top_drugs.to_sql("sdud_gold_top_drugs", engine, if_exists="replace", index=False)
+    top_drivers = (
+        df_state.assign(thera_class=thera_class(df_state["product_name_norm"]))
+        .groupby(TOP_DRIVER_KEYS, as_index=False)["total_amount_reimbursed"]
+        .sum()
+        .rename(columns={"total_amount_reimbursed": "total_reimbursed"})
+    )
+
+    # 5) Cost per prescription (guard against divide by zero)
+    df_nonsupp["cost_per_rx"] = (
+        df_nonsupp["total_amount_reimbursed"] / df_nonsupp["number_of_prescriptions"]
+    )
+    cpp = df_nonsupp["cost_per_rx"].replace([pd.NA, pd.NaT, float("inf")], pd.NA).dropna()
+    cpp_sketches = cell_sketch_rows(add_cell_sketches({}, df_nonsupp))
+
+    return {
+        "rows": len(df),
+        "supp_rate": supp_rate,
+        "coverage": coverage,
+        "drug_totals": drug_totals,
+        "state_kpis": state_kpis,
+        "kpi_cube": kpi_cube,
+        "top_drivers": top_drivers,
+        "cpp_stats": cpp.describe(percentiles=CPP_PERCENTILES),
+        "cpp_sketches": cpp_sketches,
+    }
+
+
+# -----------------------------
+# Chunked mode (bounded memory)
+# -----------------------------
+def _fold(acc, part, keys):
+    """Add a chunk's partial group-by sums into the running totals."""
+    if acc is None:
+        return part
+    return pd.concat([acc, part]).groupby(level=keys, dropna=False, observed=True).sum()
+
+
+def _plain_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Undo the compact read dtypes so to_sql creates the same column types as the in-memory mode."""
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype(object)
+        elif pd.api.types.is_extension_array_dtype(df[col].dtype) and pd.api.types.is_integer_dtype(df[col].dtype):
+            df[col] = df[col].astype("float64" if df[col].isna().any() else "int64")
+    return df
+
+
+class SliceAggregates:
+    """Running aggregates over chunks of silver rows (chunked and incremental modes)."""
+
+    def __init__(self):
+        self.n_rows = 0
+        self.supp_true = 0
+        self.supp_known = 0
+        self.notna = pd.Series(0, index=num_cols, dtype="int64")
+        self.drug_totals = pd.Series(dtype="float64")
+        self.state_acc = None
+        self.cube_acc = None
+        self.drivers_acc = None
+        self.cell_sketches = {}
+
+    def add(self, chunk: pd.DataFrame) -> None:
+        self.n_rows += len(chunk)
+        self.supp_true += int(chunk["is_suppressed"].sum())
+        self.supp_known += int(chunk["is_suppressed"].notna().sum())
+        self.notna += chunk[num_cols].notna().sum()
+
+        nonsupp = chunk[chunk["is_suppressed"].eq(False).fillna(False).astype(bool)]
+        df_state = nonsupp[nonsupp["state"] != "XX"]
+
+        # Group on the raw category first, then normalize the (few) names
+        drugs = df_state.groupby("product_name", observed=True)["total_amount_reimbursed"].sum()
+        drugs.index = drugs.index.astype(str).str.upper().str.strip()
+        self.drug_totals = self.drug_totals.add(drugs.groupby(level=0).sum(), fill_value=0)
+
+        state_part = df_state.groupby("state", observed=True).agg(
+            total_amount_reimbursed=("total_amount_reimbursed", "sum"),
+            total_prescriptions=("number_of_prescriptions", "sum"),
+            total_units_reimbursed=("units_reimbursed", "sum"),
+            rows=("state", "count"),
+        )
+        self.state_acc = _fold(self.state_acc, state_part, ["state"])
+
+        cube_part = df_state.groupby(CUBE_KEYS, dropna=False, observed=True).agg(
+            total_amount_reimbursed=("total_amount_reimbursed", "sum"),
+            medicaid_amount_reimbursed=("medicaid_amount_reimbursed", "sum"),
+            total_prescriptions=("number_of_prescriptions", "sum"),
+            total_units_reimbursed=("units_reimbursed", "sum"),
+            rows=("state", "count"),
+        )
+        self.cube_acc = _fold(self.cube_acc, cube_part, CUBE_KEYS)
+
+        # Same trick as for drugs: aggregate per raw name, derive the class on the result
+        drivers = (
+            df_state.groupby(["state", "year", "quarter", "utilization_type", "product_name"], observed=True)[
+                "total_amount_reimbursed"
+            ]
+            .sum()
+            .reset_index()
+        )
+        drivers["thera_class"] = thera_class(drivers["product_name"].astype(str).str.upper().str.strip())
+        drivers_part = drivers.groupby(TOP_DRIVER_KEYS, observed=True)[["total_amount_reimbursed"]].sum()
+        self.drivers_acc = _fold(self.drivers_acc, drivers_part, TOP_DRIVER_KEYS)
+
+        add_cell_sketches(self.cell_sketches, nonsupp)
+
+    def sketch(self) -> QuantileSketch:
+        """Cost per Rx over every row folded so far (merge of the cell sketches)."""
+        return merge_sketches(self.cell_sketches.values())
+
+    def state_kpis(self) -> pd.DataFrame:
+        if self.state_acc is None:
+            return pd.DataFrame(columns=["state", *STATE_KPI_MEASURES])
+        return _plain_dtypes(self.state_acc.reset_index())
+
+    def kpi_cube(self) -> pd.DataFrame:
+        if self.cube_acc is None:
+            return pd.DataFrame(columns=CUBE_KEYS)
+        return _plain_dtypes(self.cube_acc.reset_index())
+
+    def top_drivers(self) -> pd.DataFrame:
+        if self.drivers_acc is None:
+            return pd.DataFrame(columns=[*TOP_DRIVER_KEYS, "total_reimbursed"])
+        out = self.drivers_acc.rename(columns={"total_amount_reimbursed": "total_reimbursed"})
+        return _plain_dtypes(out.reset_index())
 
-# 3) Cost per prescription distribution summary
-# 5) Cost per prescription (guard against divide by zero)
-df_nonsupp["cost_per_rx"] = (
-    df_nonsupp["total_amount_reimbursed"] / df_nonsupp["number_of_prescriptions"]
-)
-cpp = df_nonsupp["cost_per_rx"].replace([pd.NA, pd.NaT, float("inf")], pd.NA).dropna()
 
-# cost distribution summary
-cpp_stats = cpp.describe(percentiles=[0.5, 0.9, 0.95, 0.99]).rename_axis("metric").reset_index()
-cpp_stats.columns = ["metric", "value"]
-print("➡️ Writing `sdud_gold_cost_distribution` to SQL (replace)...")
-cpp_stats.to_sql("sdud_gold_cost_distribution", engine, if_exists="replace", index=False)
+def read_silver_chunks(engine, chunk_rows: int, where: str = "", params: dict | None = None):
+    """Stream silver rows (aggregated columns only) with compact dtypes."""
+    sql = SILVER_COLUMNS_SQL.rstrip().rstrip(";")
+    if where:
+        sql += f"\nWHERE {where}"
+    with engine.connect() as conn:
+        conn = conn.execution_options(stream_results=True)
+        yield from pd.read_sql(text(sql), conn, params=params, chunksize=chunk_rows, dtype=SILVER_DTYPES)
 
-print("\n✅ Wrote summary tables: sdud_gold_state_kpis, sdud_gold_top_drugs, sdud_gold_cost_distribution")
 
-# 5) Cost per prescription (guard against divide by zero)
-df_nonsupp["cost_per_rx"] = (
-    df_nonsupp["total_amount_reimbursed"] / df_nonsupp["number_of_prescriptions"]
+def eda_chunked(engine, chunk_rows: int) -> dict:
+    agg = SliceAggregates()
+    t0 = time.perf_counter()
+    for chunk in read_silver_chunks(engine, chunk_rows):
+        agg.add(chunk)
+        print(f"   … {agg.n_rows:,} rows | {time.perf_counter() - t0:.1f}s")
+
+    print("\n✅ Streamed from SQL:", (agg.n_rows, len(SILVER_DTYPES)), f"in chunks of {chunk_rows:,}")
+
+    return {
+        "rows": agg.n_rows,
+        "supp_rate": (agg.supp_true / agg.supp_known) if agg.supp_known else float("nan"),
+        "coverage": (agg.notna / agg.n_rows) if agg.n_rows else agg.notna.astype("float64"),
+        "drug_totals": agg.drug_totals,
+        "state_kpis": agg.state_kpis(),
+        "kpi_cube": agg.kpi_cube(),
+        "top_drivers": agg.top_drivers(),
+        "cpp_stats": agg.sketch().describe(percentiles=CPP_PERCENTILES),
+        "cpp_sketches": cell_sketch_rows(agg.cell_sketches),
+    }
+
+
+# -----------------------------
+# Pushdown mode (aggregate on the server)
+# -----------------------------
+NONSUPP_WHERE = "is_suppressed = 0"
+STATE_WHERE = "is_suppressed = 0 AND (state <> 'XX' OR state IS NULL)"
+
+
+def eda_pushdown(engine) -> dict:
+    def timed_read(label: str, sql: str) -> pd.DataFrame:
+        t0 = time.perf_counter()
+        out = pd.read_sql(text(sql), engine)
+        print(f"   … {label}: {len(out):,} rows in {time.perf_counter() - t0:.2f}s")
+        return out
+
+    # 1) + 2) Suppression rate and numeric coverage in one scan
+    coverage_cols = ",\n       ".join(f"COUNT({c}) AS {c}" for c in num_cols)
+    profile = timed_read(
+        "profile",
+        f"""
+SELECT COUNT(*) AS n_rows,
+       AVG(CAST(is_suppressed AS float)) AS supp_rate,
+       {coverage_cols}
+FROM dbo.sdud_silver;
+""",
+    ).iloc[0]
+    n_rows = int(profile["n_rows"])
+
+    # KPI cube; NULL keys form their own groups, like groupby(dropna=False).
+    # SUM over only NULLs is 0 in pandas, hence the COALESCE.
+    kpi_cube = timed_read(
+        "kpi cube",
+        f"""
+SELECT state, [year], quarter, year_quarter, utilization_type,
+       COALESCE(SUM(total_amount_reimbursed), 0) AS total_amount_reimbursed,
+       COALESCE(SUM(medicaid_amount_reimbursed), 0) AS medicaid_amount_reimbursed,
+       COALESCE(SUM(number_of_prescriptions), 0) AS total_prescriptions,
+       COALESCE(SUM(units_reimbursed), 0) AS total_units_reimbursed,
+       COUNT(state) AS [rows]
+FROM dbo.sdud_silver
+WHERE {STATE_WHERE}
+GROUP BY state, [year], quarter, year_quarter, utilization_type
+ORDER BY state, [year], quarter, year_quarter, utilization_type;
+""",
+    )
+
+    state_kpis = state_kpis_from_cube(kpi_cube)
+
+    top_drivers = timed_read(
+        "top drivers",
+        f"""
+SELECT state, [year], quarter, utilization_type,
+       LEFT(n.norm, CHARINDEX(' ', n.norm + ' ') - 1) AS thera_class,
+       COALESCE(SUM(total_amount_reimbursed), 0) AS total_reimbursed
+FROM dbo.sdud_silver
+CROSS APPLY (SELECT UPPER(LTRIM(RTRIM(product_name))) AS norm) AS n
+WHERE {STATE_WHERE} AND state IS NOT NULL AND product_name IS NOT NULL
+GROUP BY state, [year], quarter, utilization_type, LEFT(n.norm, CHARINDEX(' ', n.norm + ' ') - 1);
+""",
+    )
+
+    # 4) Top drugs; ranking happens on the server
+    top_drugs = timed_read(
+        "top drugs",
+        f"""
+SELECT TOP 10
+       UPPER(LTRIM(RTRIM(product_name))) AS product_name_norm,
+       COALESCE(SUM(total_amount_reimbursed), 0) AS total_amount_reimbursed
+FROM dbo.sdud_silver
+WHERE {STATE_WHERE} AND product_name IS NOT NULL
+GROUP BY UPPER(LTRIM(RTRIM(product_name)))
+ORDER BY COALESCE(SUM(total_amount_reimbursed), 0) DESC;
+""",
+    )
+
+    # 5) Cost per prescription; x/0 is NULL here (inf in pandas) and dropped either way
+    pct_cols = ",\n       ".join(
+        f"PERCENTILE_CONT({p}) WITHIN GROUP (ORDER BY cost_per_rx) OVER () AS p{i}"
+        for i, p in enumerate(CPP_PERCENTILES)
+    )
+    cpp = timed_read(
+        "cost per Rx",
+        f"""
+WITH cpp AS (
+  SELECT CAST(total_amount_reimbursed AS float) / NULLIF(number_of_prescriptions, 0) AS cost_per_rx
+  FROM dbo.sdud_silver
+  WHERE {NONSUPP_WHERE}
+),
+moments AS (
+  SELECT COUNT(cost_per_rx) AS [count], AVG(cost_per_rx) AS mean, STDEV(cost_per_rx) AS std,
+         MIN(cost_per_rx) AS [min], MAX(cost_per_rx) AS [max]
+  FROM cpp
+),
+pct AS (
+  SELECT TOP 1
+       {pct_cols}
+  FROM cpp
+  WHERE cost_per_rx IS NOT NULL
 )
-cpp = df_nonsupp["cost_per_rx"].replace([pd.NA, pd.NaT, float("inf")], pd.NA).dropna()
+SELECT * FROM moments LEFT JOIN pct ON 1 = 1;
+""",
+    ).iloc[0]
+    pcts = sorted(set(CPP_PERCENTILES) | {0.5})
+    cpp_stats = pd.Series(
+        [float(cpp["count"]), cpp["mean"], cpp["std"], cpp["min"]]
+        + [cpp[f"p{CPP_PERCENTILES.index(p)}"] for p in pcts]
+        + [cpp["max"]],
+        index=["count", "mean", "std", "min"] + [f"{p * 100:g}%" for p in pcts] + ["max"],
+        dtype="float64",
+    )
+
+    print(f"\n✅ Aggregated on the server | silver rows={n_rows:,}")
+    return {
+        "rows": n_rows,
+        "supp_rate": profile["supp_rate"],
+        "coverage": (profile[num_cols].astype("float64") / n_rows) if n_rows else profile[num_cols] * 0.0,
+        "drug_totals": top_drugs.set_index("product_name_norm")["total_amount_reimbursed"],
+        "state_kpis": state_kpis,
+        "kpi_cube": kpi_cube,
+        "top_drivers": top_drivers,
+        "cpp_stats": cpp_stats,
+        # Sketches need row-level values; use --mode chunked or incremental to refresh them
+        "cpp_sketches": None,
+    }
+
+
+# -----------------------------
+# Incremental mode (only new / changed quarters)
+# -----------------------------
+# CMS publishes one quarter at a time. Each (year, quarter) partition of silver
+# is fingerprinted on the server (row count + CHECKSUM_AGG); partitions whose
+# fingerprint differs from dbo.sdud_etl_watermark are re-aggregated and merged
+# into the partitioned gold tables, and the small roll-ups are rebuilt from those:
+#   sdud_gold_kpi_cube       -> sdud_gold_state_kpis
+#   sdud_gold_top_drivers    (read directly by the dashboard)
+#   sdud_gold_drug_quarter   -> sdud_gold_top_drugs
+#   sdud_gold_cpp_sketch     -> sdud_gold_cost_distribution (merged cell sketches)
+#   sdud_etl_watermark       -> suppression rate / coverage
+PARTITION_KEYS = ["year", "quarter"]
+WATERMARK = "sdud_etl_watermark"
+DRUG_QUARTER = "sdud_gold_drug_quarter"
+
+PARTITION_FINGERPRINT_SQL = """
+SELECT [year], quarter, COUNT(*) AS n_rows, CHECKSUM_AGG(BINARY_CHECKSUM(*)) AS checksum
+FROM dbo.sdud_silver
+GROUP BY [year], quarter;
+"""
+
+
+def _partition_where(year, quarter) -> tuple[str, dict]:
+    """NULL-safe predicate for one (year, quarter) partition."""
+    clauses, params = [], {}
+    for col, sql_col, value in (("year", "[year]", year), ("quarter", "quarter", quarter)):
+        if value is None:
+            clauses.append(f"{sql_col} IS NULL")
+        else:
+            clauses.append(f"{sql_col} = :{col}")
+            params[col] = value
+    return " AND ".join(clauses), params
+
+
+def _key(value):
+    return None if pd.isna(value) else int(value)
+
+
+def eda_incremental(engine, chunk_rows: int, full_refresh: bool = False) -> dict:
+    fingerprints = pd.read_sql(text(PARTITION_FINGERPRINT_SQL), engine)
+    insp = inspect(engine)
+    if insp.has_table(CPP_SKETCH, schema="dbo") and "state" not in {
+        c["name"] for c in insp.get_columns(CPP_SKETCH, schema="dbo")
+    }:
+        # One sketch per quarter (before per-cell sketches): replace it and re-read every quarter
+        print(f"   note: {CPP_SKETCH} has the per-quarter layout; rebuilding it per cell")
+        with engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE dbo.{CPP_SKETCH}"))
+        full_refresh = True
+    elif insp.has_table(CPP_SKETCH, schema="dbo") and stored_sketch_accuracy(engine) not in (
+        None,
+        RELATIVE_ACCURACY,
+    ):
+        # Sketches of different accuracies don't merge: re-read every quarter
+        print(f"   note: {CPP_SKETCH} was built at another accuracy; rebuilding it")
+        full_refresh = True
+    # Without a watermark the partitioned tables can't be trusted: rebuild them
+    full_refresh = full_refresh or not inspect(engine).has_table(WATERMARK, schema="dbo")
+
+    if full_refresh:
+        seen = fingerprints.iloc[0:0]
+    else:
+        seen = pd.read_sql(text(f"SELECT [year], quarter, n_rows, checksum FROM dbo.{WATERMARK}"), engine)
+
+    cmp = fingerprints.merge(seen, on=PARTITION_KEYS, how="outer", suffixes=("", "_seen"), indicator=True)
+    changed = cmp[
+        (cmp["_merge"] == "left_only")
+        | ((cmp["_merge"] == "both") & ((cmp["n_rows"] != cmp["n_rows_seen"]) | (cmp["checksum"] != cmp["checksum_seen"])))
+    ]
+    removed = cmp[cmp["_merge"] == "right_only"]
+    print(
+        f"\n✅ Partitions: {len(fingerprints)} in silver | {len(changed)} new/changed | "
+        f"{len(removed)} removed{' | full refresh' if full_refresh else ''}"
+    )
+
+    cube_parts, driver_parts, drug_parts, sketch_parts, watermark_rows = [], [], [], [], []
+    t0 = time.perf_counter()
+    for part in changed.itertuples(index=False):
+        year, quarter = _key(part.year), _key(part.quarter)
+        where, params = _partition_where(year, quarter)
+        agg = SliceAggregates()
+        for chunk in read_silver_chunks(engine, chunk_rows, where, params):
+            agg.add(chunk)
+
+        cube_parts.append(agg.kpi_cube())
+        driver_parts.append(agg.top_drivers())
+        drugs = agg.drug_totals.rename_axis("product_name_norm").rename("total_amount_reimbursed").reset_index()
+        drug_parts.append(drugs.assign(year=year, quarter=quarter))
+        sketch_parts.append(cell_sketch_rows(agg.cell_sketches))
+        watermark_rows.append(
+            {
+                "year": year,
+                "quarter": quarter,
+                "n_rows": int(part.n_rows),
+                "checksum": int(part.checksum),
+                "n_suppressed": agg.supp_true,
+                "n_suppressed_known": agg.supp_known,
+                **{f"notna_{c}": int(agg.notna[c]) for c in num_cols},
+                "processed_at": dt.datetime.now(),
+            }
+        )
+        print(f"   … {year}Q{quarter}: {agg.n_rows:,} rows | {time.perf_counter() - t0:.1f}s")
+
+    # Merge: the new partitions are bulk-loaded into staging tables, then the
+    # affected ones replaced in one transaction, so the dashboard sees either the
+    # previous or the refreshed quarter
+    new_rows = {
+        "sdud_gold_kpi_cube": cube_parts,
+        TOP_DRIVERS: driver_parts,
+        DRUG_QUARTER: drug_parts,
+        CPP_SKETCH: sketch_parts,
+        WATERMARK: [pd.DataFrame(watermark_rows)] if watermark_rows else [],
+    }
+    frames = {}
+    for table, parts in new_rows.items():
+        parts = [f for f in parts if not f.empty]
+        frames[table] = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    predicates = None if full_refresh else [
+        _partition_where(_key(part.year), _key(part.quarter))
+        for part in pd.concat([changed, removed]).itertuples(index=False)
+    ]
+    bulk_merge(frames, engine, predicates)
+
+    if engine.dialect.name == "mssql":
+        with engine.begin() as conn:
+            conn.execute(text(TOP_DRIVERS_INDEX.format(table=f"dbo.{TOP_DRIVERS}")))
+            conn.execute(text(CPP_SKETCH_INDEX.format(table=f"dbo.{CPP_SKETCH}")))
+
+    # Roll-ups over the (small) partitioned tables
+    kpi_cube = pd.read_sql(text("SELECT * FROM dbo.sdud_gold_kpi_cube"), engine)
+    drug_totals = pd.read_sql(
+        text(
+            f"""
+SELECT product_name_norm, SUM(total_amount_reimbursed) AS total_amount_reimbursed
+FROM dbo.{DRUG_QUARTER}
+GROUP BY product_name_norm;
+"""
+        ),
+        engine,
+    ).set_index("product_name_norm")["total_amount_reimbursed"]
+
+    sketch = merge_sketches(
+        QuantileSketch.from_dict(json.loads(raw))
+        for raw in pd.read_sql(text(f"SELECT sketch FROM dbo.{CPP_SKETCH}"), engine)["sketch"]
+    )
+
+    wm = pd.read_sql(text(f"SELECT * FROM dbo.{WATERMARK}"), engine)
+    n_rows = int(wm["n_rows"].sum())
+    supp_known = int(wm["n_suppressed_known"].sum())
+    notna = pd.Series({c: wm[f"notna_{c}"].sum() for c in num_cols}, dtype="float64")
+
+    return {
+        "rows": n_rows,
+        "supp_rate": (wm["n_suppressed"].sum() / supp_known) if supp_known else float("nan"),
+        "coverage": (notna / n_rows) if n_rows else notna,
+        "drug_totals": drug_totals,
+        "state_kpis": state_kpis_from_cube(kpi_cube),
+        # Already merged partition by partition above
+        "kpi_cube": None,
+        "top_drivers": None,
+        "cpp_stats": sketch.describe(percentiles=CPP_PERCENTILES),
+        "cpp_sketches": None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Phase 3 EDA + gold KPI tables")
+    parser.add_argument("--mode", choices=["memory", "chunked", "pushdown", "incremental"], default="memory")
+    parser.add_argument("--chunk-rows", type=int, default=200_000)
+    parser.add_argument(
+        "--full-refresh", action="store_true", help="incremental mode: ignore the watermark and rebuild every quarter"
+    )
+    args = parser.parse_args()
+
+    if args.mode == "chunked":
+        res = eda_chunked(engine, args.chunk_rows)
+    elif args.mode == "pushdown":
+        res = eda_pushdown(engine)
+    elif args.mode == "incremental":
+        res = eda_incremental(engine, args.chunk_rows, args.full_refresh)
+    else:
+        res = eda_in_memory(engine)
+
+    print(f"\n📌 Suppression rate: {res['supp_rate']:.2%}")
+
+    coverage = res["coverage"].sort_values(ascending=False)
+    print("\n📌 Numeric coverage (non-null proportion):")
+    print((coverage * 100).round(2).astype(str) + "%")
+
+    state_kpis = res["state_kpis"]
+    top_states = (
+        state_kpis[["state", "total_amount_reimbursed"]]
+        .sort_values("total_amount_reimbursed", ascending=False)
+        .head(10)
+    )
+    print("\n📌 Top 10 states by Total Amount Reimbursed (non-suppressed only):")
+    print(top_states)
+
+    top_drugs = (
+        res["drug_totals"]
+        .rename_axis("product_name_norm")
+        .rename("total_amount_reimbursed")
+        .reset_index()
+        .sort_values("total_amount_reimbursed", ascending=False)
+        .head(10)
+    )
+    print("\n📌 Top 10 drugs by Total Amount Reimbursed (non-suppressed only):")
+    print(top_drugs)
+
+    # --- Persist summary tables back to SQL ---
+    print("\n➡️ Writing `sdud_gold_state_kpis` to SQL (staged swap)...")
+    bulk_replace(state_kpis, "sdud_gold_state_kpis", engine)
+
+    kpi_cube = res["kpi_cube"]
+    if kpi_cube is not None:
+        print(f"➡️ Writing `sdud_gold_kpi_cube` to SQL (staged swap) | cells={len(kpi_cube)}...")
+        bulk_replace(kpi_cube, "sdud_gold_kpi_cube", engine)
+
+    top_drivers = res["top_drivers"]
+    if top_drivers is not None:
+        print(f"➡️ Writing `{TOP_DRIVERS}` to SQL (staged swap) | rows={len(top_drivers):,}...")
+        bulk_replace(
+            top_drivers,
+            TOP_DRIVERS,
+            engine,
+            post_load=[TOP_DRIVERS_INDEX] if engine.dialect.name == "mssql" else None,
+        )
+
+    cpp_sketches = res["cpp_sketches"]
+    if cpp_sketches is not None:
+        print(f"➡️ Writing `{CPP_SKETCH}` to SQL (staged swap) | cells={len(cpp_sketches):,}...")
+        bulk_replace(
+            cpp_sketches,
+            CPP_SKETCH,
+            engine,
+            post_load=[CPP_SKETCH_INDEX] if engine.dialect.name == "mssql" else None,
+        )
+    elif args.mode == "pushdown":
+        print(f"   note: {CPP_SKETCH} not refreshed in pushdown mode")
+
+    print("➡️ Writing `sdud_gold_top_drugs` to SQL (staged swap)...")
+    bulk_replace(top_drugs, "sdud_gold_top_drugs", engine)
+
+    # cost distribution summary
+    cpp_stats = res["cpp_stats"].rename_axis("metric").reset_index()
+    cpp_stats.columns = ["metric", "value"]
+    print("➡️ Writing `sdud_gold_cost_distribution` to SQL (staged swap)...")
+    bulk_replace(cpp_stats, "sdud_gold_cost_distribution", engine)
+
+    # Data-version marker: the dashboard drops its query cache when this changes
+    pd.DataFrame([{"loaded_at": dt.datetime.now(), "source": "04_phase3_eda_kpis"}]).to_sql(
+        "sdud_data_version", engine, if_exists="append", index=False
+    )
+
+    print("\n✅ Wrote summary tables: sdud_gold_state_kpis, sdud_gold_kpi_cube, sdud_gold_top_drivers, sdud_gold_top_drugs, sdud_gold_cost_distribution")
+
+    print("\n📌 Cost per prescription summary (non-suppressed only):")
+    print(res["cpp_stats"])
+
 
-print("\n📌 Cost per prescription summary (non-suppressed only):")
-print(cpp.describe(percentiles=[0.5, 0.9, 0.95, 0.99]))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
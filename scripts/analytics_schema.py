@@ -0,0 +1,102 @@
+"""
+Physical layout of dbo.sdud_analytics (SQL Server).
+
+Shared by scripts/02_ingest_csv.py, which builds it on the staging table before
+the swap, and scripts/05_migrate_analytics.py, which provisions it on the live
+table. Every statement is guarded, so applying it twice is a no-op. `{table}` is
+the schema-qualified table name.
+"""
+
+LAYOUTS = ("columnstore", "rowstore")
+
+# DATA_NOTES.md schema
+CREATE_TABLE = """
+IF OBJECT_ID(N'{table}', N'U') IS NULL
+CREATE TABLE {table} (
+    state VARCHAR(2),
+    [year] INT,
+    quarter INT,
+    year_quarter VARCHAR(10),
+    utilization_type VARCHAR(50),
+    product_name VARCHAR(255),
+    product_name_norm VARCHAR(255),
+    suppression_used VARCHAR(10),
+    is_suppressed BIT,
+    number_of_prescriptions BIGINT,
+    total_amount_reimbursed DECIMAL(18,2),
+    medicaid_amount_reimbursed DECIMAL(18,2),
+    units_reimbursed BIGINT
+);
+"""
+
+# The class key as 02_ingest_csv.py derives it: first token of the normalized name
+THERA_CLASS_EXPR = "CAST(LEFT(product_name_norm, CHARINDEX(' ', product_name_norm + ' ') - 1) AS VARCHAR(255))"
+
+# Tables loaded elsewhere get the class key as a regular column, backfilled
+# once; 02_ingest_csv.py writes it itself. It is not a computed column: a
+# persisted computed column can't be part of a clustered columnstore, and the
+# top-drivers index keys on it.
+ADD_THERA_CLASS = """
+IF COL_LENGTH(N'{table}', N'thera_class') IS NULL
+ALTER TABLE {table} ADD thera_class VARCHAR(255) NULL;
+"""
+
+# One batch of the backfill, repeated in its own transactions until it updates
+# no rows: a single UPDATE over the whole table would hold its locks and log
+# until the end. Every batch re-finds the NULL rows, so batches are kept large.
+BACKFILL_BATCH_ROWS = 100_000
+BACKFILL_THERA_CLASS = f"""
+UPDATE TOP ({{batch_rows}}) {{table}}
+SET thera_class = {THERA_CLASS_EXPR}
+WHERE thera_class IS NULL AND product_name_norm IS NOT NULL;
+"""
+
+
+def _if_no_index(name: str, ddl: str) -> str:
+    return (
+        f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID(N'{{table}}') AND name = N'{name}')\n"
+        f"{ddl};"
+    )
+
+
+def clustered_layout(layout: str) -> list[str]:
+    """
+    columnstore: clustered columnstore index. Every dashboard query aggregates a
+    slice, so segment elimination on year/quarter plus batch mode beats row seeks.
+    rowstore: clustered B-tree on the slice keys, most selective last.
+    A table that already has a clustered index keeps it (see clustered_kind).
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown layout: {layout}")
+    guard = "IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE object_id = OBJECT_ID(N'{table}') AND type IN (1, 5))\n"
+    if layout == "columnstore":
+        return [guard + "CREATE CLUSTERED COLUMNSTORE INDEX CCI_sdud_analytics ON {table};"]
+    return [guard + "CREATE CLUSTERED INDEX CIX_sdud_analytics_slice ON {table} ([year], quarter, utilization_type, state);"]
+
+
+def clustered_kind(index_type: int) -> str:
+    """Layout name of a sys.indexes clustered index type (1 = B-tree, 5 = columnstore)."""
+    return "columnstore" if index_type == 5 else "rowstore"
+
+
+def supporting_indexes(layout: str) -> list[str]:
+    statements = [
+        # Top cost drivers: slice filter + class key, answered from the index alone
+        _if_no_index(
+            "IX_sdud_analytics_top_drivers",
+            "CREATE NONCLUSTERED INDEX IX_sdud_analytics_top_drivers ON {table} "
+            "(state, [year], quarter, utilization_type, thera_class) INCLUDE (total_amount_reimbursed)",
+        ),
+    ]
+    if layout == "columnstore":
+        # Cost per Rx histogram / top-1% share for a single state: a seek instead
+        # of a columnstore scan (the rowstore clustered key already covers this)
+        statements.append(
+            _if_no_index(
+                "IX_sdud_analytics_slice",
+                "CREATE NONCLUSTERED INDEX IX_sdud_analytics_slice ON {table} "
+                "([year], quarter, utilization_type, state) "
+                "INCLUDE (number_of_prescriptions, total_amount_reimbursed)",
+            )
+        )
+    return statements
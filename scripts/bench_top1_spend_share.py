@@ -0,0 +1,91 @@
+"""
+Micro-benchmark: vectorized top1_spend_share vs the original iterrows loop.
+
+    python scripts/bench_top1_spend_share.py            # 10k, 1M, 10M rows
+    python scripts/bench_top1_spend_share.py 10000 50000
+"""
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+from metrics import top1_spend_share  # noqa: E402
+
+
+def top1_spend_share_loop(df_in: pd.DataFrame) -> float:
+    # Reference: the implementation previously inlined in update_executive
+    # (stable sort so rows with equal cost per Rx are visited in the same order).
+    if df_in is None or df_in.empty:
+        return 0.0
+    dfc = df_in.dropna().copy()
+    dfc = dfc[dfc["number_of_prescriptions"] > 0]
+    if dfc.empty:
+        return 0.0
+
+    dfc = dfc.sort_values("cost_per_rx", ascending=False, kind="stable")
+    total_rx = float(dfc["number_of_prescriptions"].sum())
+    total_spend = float(dfc["total_amount_reimbursed"].sum())
+    if total_rx <= 0 or total_spend <= 0:
+        return 0.0
+
+    threshold = total_rx * 0.01
+    cum_rx = 0.0
+    top_spend = 0.0
+
+    for _, r in dfc.iterrows():
+        rx_i = float(r["number_of_prescriptions"])
+        cpp_i = float(r["cost_per_rx"])
+        if rx_i <= 0:
+            continue
+        if cum_rx + rx_i <= threshold:
+            top_spend += cpp_i * rx_i
+            cum_rx += rx_i
+        else:
+            remaining = threshold - cum_rx
+            if remaining > 0:
+                top_spend += cpp_i * remaining
+            break
+
+    return top_spend / total_spend
+
+
+def make_frame(n: int, seed: int = 42) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    rx = rng.integers(1, 500, size=n).astype("float64")
+    cpp = np.round(rng.lognormal(mean=3.5, sigma=1.4, size=n), 2)
+    return pd.DataFrame(
+        {
+            "cost_per_rx": cpp,
+            "number_of_prescriptions": rx,
+            "total_amount_reimbursed": cpp * rx,
+        }
+    )
+
+
+def timed(fn, df: pd.DataFrame, repeat: int):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(df)
+        best = min(best, time.perf_counter() - t0)
+    return result, best
+
+
+def main(sizes):
+    print(f"{'rows':>12} {'loop (s)':>12} {'vectorized (s)':>16} {'speedup':>9}  match")
+    for n in sizes:
+        df = make_frame(n)
+        repeat = 3 if n <= 1_000_000 else 1
+        ref, t_loop = timed(top1_spend_share_loop, df, repeat)
+        got, t_vec = timed(top1_spend_share, df, repeat)
+        match = "yes" if ref == got else f"no ({ref!r} vs {got!r})"
+        print(f"{n:>12,} {t_loop:>12.4f} {t_vec:>16.4f} {t_loop / t_vec:>8.1f}x  {match}")
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(args or [10_000, 1_000_000, 10_000_000])
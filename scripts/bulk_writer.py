@@ -0,0 +1,180 @@
+"""
+Bulk replace of a SQL table without read downtime.
+
+    from bulk_writer import bulk_replace
+    bulk_replace(df, "sdud_gold_kpi_cube", engine)
+
+The frame is loaded into `<name>__staging` with batched executemany calls, then
+swapped in with renames inside one transaction. Readers of `<name>` see either
+the old or the new table, never a missing or half-written one.
+
+    from bulk_writer import bulk_merge
+    bulk_merge({"sdud_gold_kpi_cube": df}, engine, [("[year] = :year", {"year": 2024})])
+
+merges partitions instead: the frames are staged the same way, then the
+matching rows are deleted and the staged rows inserted in one transaction.
+
+On SQL Server create the engine with `fast_executemany=True` (mssql+pyodbc): the
+driver then sends each batch as one parameter array instead of row-by-row
+INSERTs.
+"""
+import time
+
+import pandas as pd
+from sqlalchemy import inspect, text
+from sqlalchemy.types import NVARCHAR
+
+DEFAULT_CHUNKSIZE = 20_000
+
+
+def _string_dtypes(df: pd.DataFrame) -> dict:
+    """
+    Size text columns to the data. pandas maps object columns to NVARCHAR(max) /
+    TEXT, which fast_executemany has to buffer as LOBs; bounded NVARCHAR keeps
+    each parameter array small.
+    """
+    out = {}
+    for col in df.columns:
+        if df[col].dtype == object or pd.api.types.is_string_dtype(df[col].dtype):
+            longest = df[col].dropna().astype(str).str.len().max()
+            length = int(longest) if pd.notna(longest) and longest > 0 else 1
+            if length <= 4000:
+                # Round up so the next load rarely needs a wider column
+                out[col] = NVARCHAR(min(4000, max(16, 1 << (length - 1).bit_length())))
+    return out
+
+
+def _swap_statements(dialect: str, schema: str | None, name: str, staging: str, old: str) -> list[str]:
+    if dialect == "mssql":
+        s = schema or "dbo"
+        return [
+            "SET XACT_ABORT ON",
+            f"IF OBJECT_ID(N'{s}.{old}', N'U') IS NOT NULL DROP TABLE [{s}].[{old}]",
+            f"IF OBJECT_ID(N'{s}.{name}', N'U') IS NOT NULL EXEC sp_rename N'{s}.{name}', N'{old}'",
+            f"EXEC sp_rename N'{s}.{staging}', N'{name}'",
+            f"IF OBJECT_ID(N'{s}.{old}', N'U') IS NOT NULL DROP TABLE [{s}].[{old}]",
+        ]
+    q = f"{schema}." if schema else ""
+    return [
+        f"DROP TABLE IF EXISTS {q}{old}",
+        f"ALTER TABLE {q}{name} RENAME TO {old}",
+        f"ALTER TABLE {q}{staging} RENAME TO {name}",
+        f"DROP TABLE IF EXISTS {q}{old}",
+    ]
+
+
+def staging_name(name: str) -> str:
+    return f"{name}__staging"
+
+
+def _swap_in_statements(engine, name: str, schema: str | None) -> list[str]:
+    stmts = _swap_statements(engine.dialect.name, schema, name, staging_name(name), f"{name}__old")
+    if engine.dialect.name != "mssql" and not inspect(engine).has_table(name, schema=schema):
+        # Nothing to move aside on the first load (the T-SQL batch checks OBJECT_ID itself)
+        stmts = [s for s in stmts if f"RENAME TO {name}__old" not in s]
+    return stmts
+
+
+def swap_in(engine, names: list[str], schema: str | None = "dbo") -> None:
+    """Replace each table in `names` with its `<name>__staging` table, all in one transaction."""
+    statements = [stmt for name in names for stmt in _swap_in_statements(engine, name, schema)]
+    with engine.begin() as conn:
+        for stmt in statements:
+            conn.execute(text(stmt))
+
+
+def _load_staging(df: pd.DataFrame, name: str, engine, schema: str | None, chunksize: int, dtype: dict | None) -> float:
+    """Write `df` to `<name>__staging` in batches; returns the load time in seconds."""
+    if engine.dialect.name == "mssql" and not getattr(engine.dialect, "fast_executemany", False):
+        print(f"[bulk_writer] note: {name} loads row by row; create the engine with fast_executemany=True")
+
+    t0 = time.perf_counter()
+    df.to_sql(
+        staging_name(name),
+        engine,
+        schema=schema,
+        if_exists="replace",
+        index=False,
+        chunksize=chunksize,
+        dtype={**_string_dtypes(df), **(dtype or {})},
+    )
+    return time.perf_counter() - t0
+
+
+def _report(name: str, n_rows: int, t_load: float, how: str) -> None:
+    rate = n_rows / t_load if t_load > 0 else float("inf")
+    print(f"[bulk_writer] {name}: {n_rows:,} rows loaded in {t_load:.2f}s ({rate:,.0f} rows/s), {how}")
+
+
+def bulk_replace(
+    df: pd.DataFrame,
+    name: str,
+    engine,
+    schema: str | None = "dbo",
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    dtype: dict | None = None,
+    post_load: list[str] | None = None,
+) -> int:
+    """
+    Replace `schema.name` with the contents of `df`.
+
+    `post_load` statements (e.g. CREATE INDEX) run against the staging table
+    before the swap; `{table}` in them is replaced with its qualified name.
+    Returns the number of rows written.
+    """
+    qualified_staging = f"{schema}.{staging_name(name)}" if schema else staging_name(name)
+    t_load = _load_staging(df, name, engine, schema, chunksize, dtype)
+
+    with engine.begin() as conn:
+        for stmt in post_load or []:
+            conn.execute(text(stmt.format(table=qualified_staging)))
+
+    swap_in(engine, [name], schema=schema)
+    _report(name, len(df), t_load, "swapped in")
+    return len(df)
+
+
+def bulk_merge(
+    frames: dict,
+    engine,
+    predicates: list[tuple[str, dict]] | None,
+    schema: str | None = "dbo",
+    chunksize: int = DEFAULT_CHUNKSIZE,
+) -> dict:
+    """
+    Merge new partitions into existing tables: for every `{name: df}` in `frames`,
+    the rows matching any of `predicates` ((where, params) pairs; None for all
+    rows) are deleted and the rows of `df` inserted, for all tables in one
+    transaction.
+
+    Frames are bulk-loaded into `<name>__staging` first, like in bulk_replace,
+    and copied over with INSERT ... SELECT inside the transaction. A table that
+    does not exist yet is created by swapping its staging table in. Returns the
+    number of rows written per table.
+    """
+    q = f"{schema}." if schema else ""
+    quote = engine.dialect.identifier_preparer.quote_identifier
+    t_load = {
+        name: _load_staging(df, name, engine, schema, chunksize, None) for name, df in frames.items() if not df.empty
+    }
+
+    statements = []
+    for name, df in frames.items():
+        if not inspect(engine).has_table(name, schema=schema):
+            if name in t_load:
+                statements += [(stmt, {}) for stmt in _swap_in_statements(engine, name, schema)]
+            continue
+        for where, params in predicates if predicates is not None else [("1 = 1", {})]:
+            statements.append((f"DELETE FROM {q}{name} WHERE {where}", params))
+        if name in t_load:
+            cols = ", ".join(quote(c) for c in df.columns)
+            statements.append((f"INSERT INTO {q}{name} ({cols}) SELECT {cols} FROM {q}{staging_name(name)}", {}))
+            statements.append((f"DROP TABLE {q}{staging_name(name)}", {}))
+
+    with engine.begin() as conn:
+        for stmt, params in statements:
+            conn.execute(text(stmt), params)
+
+    for name, seconds in t_load.items():
+        _report(name, len(frames[name]), seconds, "merged in")
+    return {name: len(df) for name, df in frames.items()}
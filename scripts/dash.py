@@ -1,9 +1,16 @@
+import sys
+from pathlib import Path
+
 import pandas as pd
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, inspect, text
 
 from dash import Dash, dcc, html, Input, Output
 import plotly.express as px
 
+# Shared metric helpers live next to the main dashboard
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+from metrics import top1_spend_share  # noqa: E402
+
 # -----------------------------
 # DB connection
 # -----------------------------
@@ -14,6 +21,15 @@ CONN_STR = (
 )
 engine = create_engine(CONN_STR)
 
+# Therapeutic class key: the column materialized at load time when present
+# (scripts/02_ingest_csv.py), otherwise derived per row
+_analytics_columns = {c["name"] for c in inspect(engine).get_columns("sdud_analytics", schema="dbo")}
+THERA_CLASS = (
+    "thera_class"
+    if "thera_class" in _analytics_columns
+    else "LEFT(product_name_norm, CHARINDEX(' ', product_name_norm + ' ') - 1)"
+)
+
 # -----------------------------
 # Helper: fetch filter options
 # -----------------------------
@@ -347,29 +363,29 @@ def update_dashboard(state, year, quarter, util_type, scope):
     # -----------------------------
     # Top cost drivers by condition (therapeutic class proxy)
     # -----------------------------
-    top_class_state_sql = """
+    top_class_state_sql = f"""
     SELECT TOP 15
-      LEFT(product_name_norm, CHARINDEX(' ', product_name_norm + ' ') - 1) AS thera_class,
+      {THERA_CLASS} AS thera_class,
       SUM(total_amount_reimbursed) AS total_reimbursed
     FROM dbo.sdud_analytics
     WHERE state = :state
       AND [year] = :year
       AND quarter = :quarter
       AND utilization_type = :util
-    GROUP BY LEFT(product_name_norm, CHARINDEX(' ', product_name_norm + ' ') - 1)
+    GROUP BY {THERA_CLASS}
     ORDER BY total_reimbursed DESC;
     """
 
-    top_class_nat_sql = """
+    top_class_nat_sql = f"""
     SELECT TOP 15
-      LEFT(product_name_norm, CHARINDEX(' ', product_name_norm + ' ') - 1) AS thera_class,
+      {THERA_CLASS} AS thera_class,
       SUM(total_amount_reimbursed) AS total_reimbursed
     FROM dbo.sdud_analytics
     WHERE state <> 'XX'
       AND [year] = :year
       AND quarter = :quarter
       AND utilization_type = :util
-    GROUP BY LEFT(product_name_norm, CHARINDEX(' ', product_name_norm + ' ') - 1)
+    GROUP BY {THERA_CLASS}
     ORDER BY total_reimbursed DESC;
     """
 
@@ -445,42 +461,6 @@ def update_dashboard(state, year, quarter, util_type, scope):
       AND total_amount_reimbursed IS NOT NULL;
     """
 
-    def top1_spend_share(df_in: pd.DataFrame) -> float:
-        if df_in is None or df_in.empty:
-            return 0.0
-        dfc = df_in.dropna().copy()
-        dfc = dfc[dfc["number_of_prescriptions"] > 0]
-        if dfc.empty:
-            return 0.0
-
-        dfc = dfc.sort_values("cost_per_rx", ascending=False)
-
-        total_rx = float(dfc["number_of_prescriptions"].sum())
-        total_spend = float(dfc["total_amount_reimbursed"].sum())
-        if total_rx <= 0 or total_spend <= 0:
-            return 0.0
-
-        threshold = total_rx * 0.01
-        cum_rx = 0.0
-        top_spend = 0.0
-
-        for _, r in dfc.iterrows():
-            rx_i = float(r["number_of_prescriptions"])
-            cpp_i = float(r["cost_per_rx"])
-            if rx_i <= 0:
-                continue
-
-            if cum_rx + rx_i <= threshold:
-                top_spend += cpp_i * rx_i
-                cum_rx += rx_i
-            else:
-                remaining = threshold - cum_rx
-                if remaining > 0:
-                    top_spend += cpp_i * remaining
-                break
-
-        return top_spend / total_spend
-
     cpp_state = pd.read_sql(text(cpp_state_sql), engine, params=params_state).dropna()
     cpp_state["scope"] = "State"
     state_share = top1_spend_share(cpp_state)
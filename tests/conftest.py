@@ -0,0 +1,8 @@
+import sys
+from pathlib import Path
+
+# app/ and scripts/ are flat script directories, not packages. scripts/ goes
+# last: its dash.py would otherwise shadow the dash package.
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "app"))
+sys.path.append(str(ROOT / "scripts"))
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from array_cube import ArrayCube
+
+MEASURES = list(ArrayCube.MEASURES)
+
+
+@pytest.fixture
+def cells():
+    rng = np.random.default_rng(0)
+    keys = pd.MultiIndex.from_product(
+        [["CA", "NY", "TX", None], [2023, 2024], [1, 2, 3, 4], ["FFSU", "MCOU"]],
+        names=list(ArrayCube.DIMENSIONS),
+    ).to_frame(index=False)
+    # Drop some cells so `present` matters
+    keys = keys.sample(frac=0.8, random_state=1).reset_index(drop=True)
+    return keys.assign(**{m: rng.uniform(0, 1e6, len(keys)).round(2) for m in MEASURES})
+
+
+def test_round_trip_through_memory_mapped_files(cells, tmp_path):
+    cube = ArrayCube.from_frame(cells, data_version="2024-01-01 00:00:00")
+    path = ArrayCube.version_dir(str(tmp_path), cube.data_version)
+    cube.save(path)
+    loaded = ArrayCube.load(path)
+
+    assert loaded.dims == cube.dims
+    assert loaded.data_version == cube.data_version
+    assert isinstance(loaded.present, np.memmap)
+    for m in MEASURES:
+        np.testing.assert_array_equal(loaded.measures[m], cube.measures[m])
+    np.testing.assert_array_equal(loaded.present, cube.present)
+
+
+def test_kpi_matches_pandas(cells):
+    cube = ArrayCube.from_frame(cells)
+    row = cells.dropna(subset=["state"]).iloc[0]
+    sel = cells[
+        (cells["state"] == row["state"])
+        & (cells["year"] == row["year"])
+        & (cells["quarter"] == row["quarter"])
+        & (cells["utilization_type"] == row["utilization_type"])
+    ]
+    kpi = cube.kpi(row["state"], row["year"], row["quarter"], row["utilization_type"])
+    assert kpi["total_reimbursed"] == pytest.approx(sel["total_amount_reimbursed"].sum())
+    assert cube.kpi("ZZ", 2024, 1, "FFSU")["total_reimbursed"] is None
+
+
+def test_trend_matches_pandas(cells):
+    cube = ArrayCube.from_frame(cells)
+    sel = cells[cells["state"].notna() & (cells["year"] == 2024) & (cells["utilization_type"] == "FFSU")]
+    for state, rows in ((None, sel), ("CA", sel[sel["state"] == "CA"])):
+        trend = cube.trend(state, 2024, "FFSU")
+        expected = rows.groupby("quarter")["total_amount_reimbursed"].sum()
+        assert trend["quarter"].tolist() == expected.index.tolist()
+        np.testing.assert_allclose(trend["total_reimbursed"], expected.to_numpy())
+
+
+def test_ranking_matches_state_kpis(cells):
+    cube = ArrayCube.from_frame(cells)
+    ranking = cube.ranking(2024, 2, "FFSU")
+    assert len(ranking) > 0
+    for row in ranking.itertuples():
+        assert row.total_reimbursed == pytest.approx(cube.kpi(row.state, 2024, 2, "FFSU")["total_reimbursed"])
+
+
+def test_national_figures_leave_out_rows_without_a_state(cells):
+    cube = ArrayCube.from_frame(cells)
+    named = cells[cells["state"].notna() & (cells["year"] == 2024) & (cells["utilization_type"] == "FFSU")]
+
+    kpi = cube.kpi(None, 2024, 2, "FFSU")
+    assert kpi["prescriptions"] == pytest.approx(named.loc[named["quarter"] == 2, "total_prescriptions"].sum())
+
+    ranking = cube.ranking(2024, 2, "FFSU")
+    assert set(ranking["state"]) == set(named.loc[named["quarter"] == 2, "state"])
+    assert ranking["total_reimbursed"].sum() == pytest.approx(kpi["total_reimbursed"])
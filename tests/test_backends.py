@@ -0,0 +1,14 @@
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool, QueuePool
+
+from backends import pool_capacity
+
+
+def test_pool_capacity_counts_overflow():
+    engine = create_engine("sqlite://", poolclass=QueuePool, pool_size=3, max_overflow=2)
+    assert pool_capacity(engine) == 5
+
+
+def test_pool_capacity_unbounded():
+    assert pool_capacity(create_engine("sqlite://", poolclass=NullPool)) is None
+    assert pool_capacity(create_engine("sqlite://", poolclass=QueuePool, max_overflow=-1)) is None
@@ -0,0 +1,72 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.exc import DBAPIError
+
+from bulk_writer import bulk_merge, bulk_replace
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'main.db'}")
+    dbo = tmp_path / "dbo.db"
+
+    @event.listens_for(engine, "connect")
+    def attach_dbo(dbapi_conn, _):
+        dbapi_conn.execute(f"ATTACH DATABASE '{dbo}' AS dbo")
+
+    return engine
+
+
+def read(engine, name):
+    return pd.read_sql(f"SELECT * FROM dbo.{name} ORDER BY state", engine)
+
+
+def test_first_load_creates_the_table(engine):
+    df = pd.DataFrame({"state": ["CA", "NY"], "total": [1.5, 2.0]})
+    assert bulk_replace(df, "gold", engine, chunksize=1) == 2
+    pd.testing.assert_frame_equal(read(engine, "gold"), df)
+
+
+def test_replace_swaps_in_the_new_rows(engine):
+    bulk_replace(pd.DataFrame({"state": ["CA", "NY", "TX"], "total": [1.0, 2.0, 3.0]}), "gold", engine)
+    df = pd.DataFrame({"state": ["WA"], "total": [9.0], "rows": [4]})
+    bulk_replace(df, "gold", engine)
+
+    pd.testing.assert_frame_equal(read(engine, "gold"), df)
+    tables = inspect(engine).get_table_names(schema="dbo")
+    assert tables == ["gold"], "staging and old tables are dropped after the swap"
+
+
+def test_post_load_runs_against_the_staging_table(engine):
+    df = pd.DataFrame({"state": ["CA"], "total": [1.0]})
+    bulk_replace(df, "gold", engine, post_load=["INSERT INTO {table} (state, total) VALUES ('NY', 2.0)"])
+    pd.testing.assert_frame_equal(read(engine, "gold"), pd.DataFrame({"state": ["CA", "NY"], "total": [1.0, 2.0]}))
+
+
+def test_failed_load_keeps_the_old_table(engine):
+    df = pd.DataFrame({"state": ["CA"], "total": [1.0]})
+    bulk_replace(df, "gold", engine)
+    with pytest.raises(DBAPIError):
+        bulk_replace(df, "gold", engine, post_load=["CREATE INDEX broken ON {table} (no_such_column)"])
+    pd.testing.assert_frame_equal(read(engine, "gold"), df)
+
+
+def test_merge_replaces_only_the_matching_partitions(engine):
+    bulk_replace(pd.DataFrame({"state": ["CA", "NY", "TX"], "quarter": [1, 2, 2]}), "gold", engine)
+    new = pd.DataFrame({"state": ["AK", "WA"], "quarter": [2, 3]})
+    predicates = [("quarter = :quarter", {"quarter": 2}), ("quarter = :quarter", {"quarter": 3})]
+
+    assert bulk_merge({"gold": new, "other": pd.DataFrame()}, engine, predicates) == {"gold": 2, "other": 0}
+    expected = pd.DataFrame({"state": ["AK", "CA", "WA"], "quarter": [2, 1, 3]})
+    pd.testing.assert_frame_equal(read(engine, "gold"), expected)
+    assert inspect(engine).get_table_names(schema="dbo") == ["gold"]
+
+
+def test_merge_creates_missing_tables_and_clears_on_full_refresh(engine):
+    df = pd.DataFrame({"state": ["CA"], "rows": [3]})
+    bulk_merge({"gold": df}, engine, [("state = :state", {"state": "CA"})])
+    pd.testing.assert_frame_equal(read(engine, "gold"), df)
+
+    bulk_merge({"gold": pd.DataFrame()}, engine, None)
+    assert read(engine, "gold").empty
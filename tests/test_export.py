@@ -0,0 +1,66 @@
+import gzip
+import io
+
+import pytest
+
+pytest.importorskip("duckdb_engine")
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from export import export_sql, iter_csv, iter_parquet  # noqa: E402
+from queries import DUCKDB  # noqa: E402
+
+SQL = export_sql(DUCKDB)
+PARAMS = {"state": "CA", "year": 2024, "quarter": 1, "util": "FFSU"}
+
+
+@pytest.fixture
+def duck():
+    engine = create_engine("duckdb:///:memory:", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE SCHEMA dbo"))
+        conn.execute(
+            text(
+                "CREATE TABLE dbo.sdud_analytics (state VARCHAR, year INTEGER, quarter INTEGER, "
+                "utilization_type VARCHAR, product_name VARCHAR, units_reimbursed BIGINT, "
+                "total_amount_reimbursed DECIMAL(18,2))"
+            )
+        )
+        # units_reimbursed is NULL throughout the first chunk
+        conn.execute(
+            text(
+                "INSERT INTO dbo.sdud_analytics VALUES "
+                "('CA', 2024, 1, 'FFSU', 'A', NULL, 10.50), ('CA', 2024, 1, 'FFSU', 'B', NULL, NULL), "
+                "('CA', 2024, 1, 'FFSU', NULL, 7, 3.25), ('CA', 2024, 1, 'FFSU', 'D', 9, 1.00), "
+                "('NY', 2024, 1, 'FFSU', 'E', 1, 2.00)"
+            )
+        )
+    return engine
+
+
+def read_parquet(chunks) -> pa.Table:
+    return pq.read_table(io.BytesIO(b"".join(chunks)))
+
+
+def test_parquet_schema_comes_from_column_types(duck):
+    table = read_parquet(iter_parquet(duck, SQL, PARAMS, chunk_rows=2))
+    assert table.num_rows == 4
+    assert table.schema.field("units_reimbursed").type == pa.int64()
+    assert table.schema.field("total_amount_reimbursed").type == pa.decimal128(18, 2)
+    assert table.column("units_reimbursed").to_pylist() == [None, None, 7, 9]
+    assert pq.ParquetFile(io.BytesIO(b"".join(iter_parquet(duck, SQL, PARAMS, 2)))).num_row_groups == 2
+
+
+def test_parquet_empty_result_is_a_valid_file(duck):
+    table = read_parquet(iter_parquet(duck, SQL, {**PARAMS, "state": "TX"}, chunk_rows=2))
+    assert table.num_rows == 0
+    assert table.schema.names[:2] == ["state", "year"]
+    assert table.schema.field("year").type == pa.int64()
+
+
+def test_csv_streams_all_rows(duck):
+    lines = gzip.decompress(b"".join(iter_csv(duck, SQL, PARAMS, chunk_rows=2))).decode().splitlines()
+    assert lines[0].startswith("state,year,quarter")
+    assert len(lines) == 5
@@ -0,0 +1,27 @@
+import forecasting
+from forecasting import ForecastCache
+
+
+def test_versioned_entries_never_expire_and_unversioned_ones_do(monkeypatch):
+    now = {"t": 0.0}
+    monkeypatch.setattr(forecasting.time, "monotonic", lambda: now["t"])
+    cache, calls = ForecastCache(max_entries=8), []
+
+    def fit(value):
+        calls.append(value)
+        return value
+
+    cache.get_or_fit(("CA", "FFSU", "v1"), lambda: fit("v1"))
+    cache.get_or_fit(("CA", "FFSU", None), lambda: fit("none"), ttl_seconds=60)
+    now["t"] += 61
+    assert cache.get_or_fit(("CA", "FFSU", "v1"), lambda: fit("v1 again")) == "v1"
+    assert cache.get_or_fit(("CA", "FFSU", None), lambda: fit("none again"), ttl_seconds=60) == "none again"
+    assert calls == ["v1", "none", "none again"]
+
+
+def test_least_recently_used_is_evicted():
+    cache = ForecastCache(max_entries=2)
+    for key in "abac":  # a is used again, so b is the one evicted
+        cache.get_or_fit((key,), lambda key=key: key)
+    assert cache.stats()["evictions"] == 1
+    assert cache.get_or_fit(("b",), lambda: "refit") == "refit"
@@ -0,0 +1,98 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+import forecasting
+from forecasting import (
+    BAND_QUANTILES,
+    Z_95,
+    backtest_score,
+    bootstrap_bands,
+    fit_forecast,
+    select_model,
+    selection_pool,
+)
+
+SEASONAL = np.tile([100.0, 120.0, 90.0, 130.0], 5)
+
+
+@pytest.fixture
+def trend_series():
+    rng = np.random.default_rng(0)
+    t = np.arange(24)
+    return 1000 + 20 * t + 50 * np.sin(t * np.pi / 2) + rng.normal(0, 10, len(t))
+
+
+def test_select_model_picks_the_lowest_backtest_error():
+    best, score, scores = select_model(SEASONAL)
+    assert scores["snaive"] == 0.0
+    assert (best, score) == ("snaive", 0.0)
+    assert set(scores) <= set(forecasting.AUTO_CANDIDATES)
+
+
+def test_select_model_in_a_pool_matches_serial(trend_series):
+    pool = selection_pool(2)
+    try:
+        serial = select_model(trend_series)
+        parallel = select_model(trend_series, pool, workers=2, budget_seconds=60)
+    finally:
+        pool.shutdown()
+    assert parallel[0] == serial[0]
+    assert parallel[2] == pytest.approx(serial[2])
+
+
+def test_backtest_stops_at_the_deadline(trend_series):
+    assert math.isfinite(backtest_score(trend_series, "naive"))
+    assert backtest_score(trend_series, "naive", deadline=time.time() - 1) == math.inf
+
+
+def test_nothing_scores_falls_back_to_naive():
+    best, score, scores = select_model([5.0, 6.0])
+    assert best == "naive" and math.isnan(score)
+    assert all(s == math.inf for s in scores.values())
+
+
+def test_fixed_models_have_no_score(trend_series):
+    fit = fit_forecast(trend_series, "snaive", horizon=8)
+    assert fit["method"] == "snaive" and fit["score"] is None
+    np.testing.assert_array_equal(fit["forecast"], trend_series[-4:][np.arange(8) % 4])
+
+
+def test_auto_fallback_reports_the_naive_score():
+    y = SEASONAL - 100  # not positive: multiplicative seasonality can't be fitted
+    fit = fit_forecast(y, forecasting.AUTO, horizon=4, selection=("ets_mul", 0.01))
+    assert fit["method"] == "naive"
+    assert fit["score"] == pytest.approx(backtest_score(y, "naive"))
+
+
+def test_normal_interval_widens_per_error_cycle(trend_series):
+    fit = fit_forecast(trend_series, "snaive", horizon=8)
+    half_width = (fit["upper"] - fit["lower"]) / 2
+    expected = Z_95 * fit["residual_std"] * np.sqrt([1, 1, 1, 1, 2, 2, 2, 2])
+    np.testing.assert_allclose(half_width, expected)
+
+
+def test_bootstrap_bands_are_reproducible_and_ordered():
+    rng = np.random.default_rng(1)
+    forecast, residuals = np.linspace(100, 110, 8), rng.normal(0, 5, 30)
+    bands = bootstrap_bands(forecast, residuals, cycle=4)
+    assert bands.shape == (len(BAND_QUANTILES), 8)
+    np.testing.assert_array_equal(bands, bootstrap_bands(forecast, residuals, cycle=4))
+    assert (np.diff(bands, axis=0) > 0).all()
+    # Errors accumulate once per cycle: wider in the second year than in the first
+    width = bands[-1] - bands[0]
+    assert width[4:].min() > width[:4].max()
+
+
+def test_bootstrap_bands_without_spread_are_the_forecast():
+    forecast = np.array([1.0, 2.0, 3.0])
+    np.testing.assert_array_equal(bootstrap_bands(forecast, [])[0], forecast)
+    np.testing.assert_allclose(bootstrap_bands(forecast, [2.0, 2.0, np.nan]), np.tile(forecast, (4, 1)))
+
+
+def test_bootstrap_fit_returns_the_requested_bands(trend_series):
+    fit = fit_forecast(trend_series, "ets", horizon=6, interval="bootstrap", quantiles=(0.1, 0.9))
+    assert sorted(fit["bands"]) == [0.1, 0.9]
+    assert (fit["lower"] < fit["bands"][0.1]).all() and (fit["bands"][0.9] < fit["upper"]).all()
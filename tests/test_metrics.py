@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench_top1_spend_share import make_frame, top1_spend_share_loop
+from metrics import top1_spend_share, top1_spend_share_head, top_share_arrays
+
+
+# Totals are summed by numpy here and by pandas in the loop, which can differ in
+# the last bit; a wrong boundary row is off by far more than that.
+def frame(cpp, rx):
+    cpp = np.asarray(cpp, dtype="float64")
+    rx = np.asarray(rx, dtype="float64")
+    return pd.DataFrame({"cost_per_rx": cpp, "number_of_prescriptions": rx, "total_amount_reimbursed": cpp * rx})
+
+
+@pytest.mark.parametrize("n,seed", [(1, 0), (50, 1), (1000, 2), (20000, 3)])
+def test_matches_loop_on_random_frames(n, seed):
+    df = make_frame(n, seed)
+    assert top1_spend_share(df) == pytest.approx(top1_spend_share_loop(df), rel=1e-12)
+
+
+@pytest.mark.parametrize(
+    "rx",
+    [
+        [1, 2, 97],  # threshold (1.0) exactly at the end of the first row
+        [0.4, 0.4, 99.2],  # threshold inside the third row
+        [0.25, 0.5, 0.25, 99.0],  # threshold exactly at the end of the third row
+        [3, 97],  # first row alone crosses it: only a fraction of it counts
+    ],
+)
+def test_fractional_boundaries(rx):
+    df = frame(np.linspace(100, 1, len(rx)), rx)
+    assert top1_spend_share(df) == pytest.approx(top1_spend_share_loop(df), rel=1e-12)
+
+
+def test_ties_keep_row_order():
+    # Equal cost per Rx: the stable order decides which row is cut
+    df = frame([5, 5, 5, 1], [0.6, 0.6, 0.6, 98.2])
+    assert top1_spend_share(df) == pytest.approx(top1_spend_share_loop(df), rel=1e-12)
+
+
+def test_missing_and_zero_rows_are_ignored():
+    df = frame([10, np.nan, 7, 3], [1, 5, 0, 99])
+    assert top1_spend_share(df) == pytest.approx(top1_spend_share_loop(df), rel=1e-12)
+
+
+def test_empty_inputs():
+    assert top1_spend_share(pd.DataFrame()) == 0.0
+    assert top1_spend_share(frame([1, 2], [0, 0])) == 0.0
+    assert top_share_arrays([], [], []) == 0.0
+
+
+def test_head_with_population_totals_matches_full_frame():
+    df = make_frame(5000, 7)
+    ranked = df.sort_values("cost_per_rx", ascending=False, kind="stable")
+    head = ranked[ranked["number_of_prescriptions"].cumsum().shift(fill_value=0) <= 0.01 * df["number_of_prescriptions"].sum()]
+    head = head.assign(
+        total_rx=df["number_of_prescriptions"].sum(),
+        total_spend=df["total_amount_reimbursed"].sum(),
+    )
+    assert len(head) < len(df)
+    assert top1_spend_share_head(head) == pytest.approx(top1_spend_share(df), rel=1e-12)
@@ -0,0 +1,171 @@
+import importlib.util
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+import sqlalchemy
+from sqlalchemy import event
+
+from conftest import ROOT
+
+# Pushdown mode is T-SQL; it runs against a scratch SQL Server database when
+# SDUD_TEST_MSSQL_URL is set (its dbo.sdud_silver and gold tables are replaced).
+MSSQL_URL = os.getenv("SDUD_TEST_MSSQL_URL")
+
+# Gold tables every mode writes, with their key columns
+GOLD_TABLES = {
+    "sdud_gold_state_kpis": ["state"],
+    "sdud_gold_kpi_cube": ["state", "year", "quarter", "year_quarter", "utilization_type"],
+    "sdud_gold_top_drivers": ["state", "year", "quarter", "utilization_type", "thera_class"],
+    "sdud_gold_top_drugs": ["product_name_norm"],
+}
+# Cost per Rx percentiles come from the sketch in chunked mode (within 1%)
+SKETCH_ACCURACY = 0.01
+
+
+@pytest.fixture(scope="module")
+def phase3():
+    spec = importlib.util.spec_from_file_location("phase3_eda_kpis", ROOT / "scripts" / "04_phase3_eda_kpis.py")
+    module = importlib.util.module_from_spec(spec)
+    # The script's module-level SQL Server engine is swapped out by each test
+    create_engine = sqlalchemy.create_engine
+    sqlalchemy.create_engine = lambda *args, **kwargs: None
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sqlalchemy.create_engine = create_engine
+    return module
+
+
+@pytest.fixture(scope="module")
+def silver():
+    rng = np.random.default_rng(3)
+    n = 3000
+    df = pd.DataFrame(
+        {
+            "state": np.array(["CA", "NY", "TX", "XX", None], dtype=object)[
+                rng.choice(5, n, p=[0.3, 0.3, 0.3, 0.05, 0.05])
+            ],
+            "year": rng.integers(2023, 2025, n),
+            "quarter": rng.integers(1, 5, n),
+            "utilization_type": np.array(["FFSU", "MCOU"])[rng.integers(0, 2, n)],
+            "product_name": np.array(
+                ["humira pen ", "LIPITOR 10MG", "Lipitor 10mg", "OZEMPIC", "ELIQUIS 5MG", "KEYTRUDA", None],
+                dtype=object,
+            )[rng.integers(0, 7, n)],
+            "number_of_prescriptions": rng.integers(0, 300, n).astype(float),
+            "units_reimbursed": rng.integers(0, 3000, n).astype(float),
+        }
+    )
+    df["year_quarter"] = df["year"].astype(str) + "Q" + df["quarter"].astype(str)
+    df["total_amount_reimbursed"] = (df["number_of_prescriptions"] * rng.lognormal(3, 1, n)).round(2)
+    df["medicaid_amount_reimbursed"] = (df["total_amount_reimbursed"] * 0.9).round(2)
+    df["non_medicaid_amount_reimbursed"] = (df["total_amount_reimbursed"] * 0.1).round(2)
+    suppressed = rng.random(n) < 0.1
+    measures = ["number_of_prescriptions", "total_amount_reimbursed", "medicaid_amount_reimbursed"]
+    df.loc[suppressed, [*measures, "non_medicaid_amount_reimbursed"]] = np.nan
+    df["is_suppressed"] = suppressed
+    df.loc[rng.random(n) < 0.05, "units_reimbursed"] = np.nan
+    return df
+
+
+def mode_engine(mode, silver, tmp_path):
+    """Engine with `silver` as dbo.sdud_silver: SQLite (schema dbo attached) or SQL Server."""
+    if mode == "pushdown":
+        if not MSSQL_URL:
+            pytest.skip("pushdown mode needs SQL Server (set SDUD_TEST_MSSQL_URL)")
+        engine = sqlalchemy.create_engine(MSSQL_URL, fast_executemany=True)
+    else:
+        engine = sqlalchemy.create_engine(f"sqlite:///{tmp_path / f'{mode}.db'}")
+        dbo = tmp_path / f"{mode}_dbo.db"
+
+        @event.listens_for(engine, "connect")
+        def attach_dbo(dbapi_conn, _):
+            dbapi_conn.execute(f"ATTACH DATABASE '{dbo}' AS dbo")
+
+    silver.to_sql("sdud_silver", engine, schema="dbo", if_exists="replace", index=False)
+    return engine
+
+
+def run_mode(phase3, engine, monkeypatch, *args):
+    monkeypatch.setattr(phase3, "engine", engine)
+    monkeypatch.setattr(sys, "argv", ["04_phase3_eda_kpis.py", *args])
+    phase3.main()
+    with engine.connect() as conn:
+        return {
+            name: pd.read_sql(f"SELECT * FROM dbo.{name}", conn)
+            for name in [*GOLD_TABLES, "sdud_gold_cost_distribution", "sdud_gold_cpp_sketch"]
+            if sqlalchemy.inspect(conn).has_table(name, schema="dbo")
+        }
+
+
+def sorted_by(df, keys):
+    return df.sort_values(keys, na_position="first", ignore_index=True)[sorted(df.columns)]
+
+
+@pytest.fixture(scope="module")
+def gold_memory(phase3, silver, tmp_path_factory):
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        engine = mode_engine("memory", silver, tmp_path_factory.mktemp("memory"))
+        return run_mode(phase3, engine, monkeypatch, "--mode", "memory")
+
+
+def assert_same_gold(gold, expected, percentile_rtol):
+    for name, keys in GOLD_TABLES.items():
+        pd.testing.assert_frame_equal(
+            sorted_by(gold[name], keys), sorted_by(expected[name], keys), check_dtype=False, obj=name
+        )
+
+    expected_cpp = expected["sdud_gold_cost_distribution"].set_index("metric")["value"]
+    actual_cpp = gold["sdud_gold_cost_distribution"].set_index("metric")["value"].reindex(expected_cpp.index)
+    exact = ["count", "mean", "std", "min", "max"]
+    pd.testing.assert_series_equal(actual_cpp[exact], expected_cpp[exact])
+    np.testing.assert_allclose(actual_cpp.drop(exact), expected_cpp.drop(exact), rtol=percentile_rtol)
+
+    if "sdud_gold_cpp_sketch" in gold:
+        keys = ["state", "year", "quarter", "utilization_type"]
+        sketches = [sorted_by(g["sdud_gold_cpp_sketch"], keys) for g in (gold, expected)]
+        pd.testing.assert_frame_equal(sketches[0][[*keys, "n"]], sketches[1][[*keys, "n"]], check_dtype=False)
+        # Same buckets per cell; only the float running sums depend on the chunking
+        for a, b in zip(*(s["sketch"] for s in sketches)):
+            a, b = json.loads(a), json.loads(b)
+            assert a.pop("total") == pytest.approx(b.pop("total"))
+            assert a.pop("m2") == pytest.approx(b.pop("m2"))
+            assert a == b
+
+
+@pytest.mark.parametrize("mode", ["chunked", "pushdown"])
+def test_gold_tables_match_memory_mode(mode, phase3, silver, gold_memory, tmp_path, monkeypatch):
+    engine = mode_engine(mode, silver, tmp_path)
+    gold = run_mode(phase3, engine, monkeypatch, "--mode", mode, "--chunk-rows", "700")
+    assert_same_gold(gold, gold_memory, SKETCH_ACCURACY if mode == "chunked" else 1e-9)
+
+
+# CHECKSUM_AGG is T-SQL; on SQLite the partitions are fingerprinted by their measures
+SQLITE_FINGERPRINT_SQL = """
+SELECT year, quarter, COUNT(*) AS n_rows,
+       CAST(SUM(COALESCE(total_amount_reimbursed, 0) * 100 + COALESCE(number_of_prescriptions, 0)) AS INTEGER)
+         AS checksum
+FROM dbo.sdud_silver
+GROUP BY year, quarter;
+"""
+
+
+def test_incremental_merges_new_and_changed_quarters(phase3, silver, gold_memory, tmp_path, monkeypatch):
+    monkeypatch.setattr(phase3, "PARTITION_FINGERPRINT_SQL", SQLITE_FINGERPRINT_SQL)
+    # First run: the latest quarter is missing and an older one is later restated
+    latest = (silver["year"] == 2024) & (silver["quarter"] == 4)
+    restated = (silver["year"] == 2023) & (silver["quarter"] == 2)
+    earlier = silver[~latest].copy()
+    earlier.loc[restated, "total_amount_reimbursed"] *= 2
+    engine = mode_engine("incremental", earlier, tmp_path)
+    run_mode(phase3, engine, monkeypatch, "--mode", "incremental", "--chunk-rows", "700")
+
+    silver.to_sql("sdud_silver", engine, schema="dbo", if_exists="replace", index=False)
+    gold = run_mode(phase3, engine, monkeypatch, "--mode", "incremental", "--chunk-rows", "700")
+    assert_same_gold(gold, gold_memory, SKETCH_ACCURACY)
+    with engine.connect() as conn:
+        assert not [t for t in sqlalchemy.inspect(conn).get_table_names(schema="dbo") if "__" in t]
@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+import pytest
+
+from quantile_sketch import QuantileSketch
+
+QUANTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999]
+
+
+def values(n=50_000, seed=0):
+    return np.random.default_rng(seed).lognormal(mean=3.5, sigma=1.4, size=n)
+
+
+def assert_within_accuracy(sketch, x):
+    for q in QUANTILES:
+        exact = np.quantile(x, q)
+        assert abs(sketch.quantile(q) - exact) <= sketch.relative_accuracy * abs(exact) + 1e-12, q
+
+
+def test_quantiles_within_relative_accuracy():
+    x = values()
+    assert_within_accuracy(QuantileSketch().update(x), x)
+
+
+def test_merge_equals_sketch_of_all_values():
+    x = values()
+    parts = np.array_split(x, 7)
+    merged = QuantileSketch()
+    for part in parts:
+        merged.merge(QuantileSketch().update(part))
+    whole = QuantileSketch().update(x)
+
+    assert merged.positive == whole.positive
+    assert merged.count == whole.count == len(x)
+    assert merged.mean == pytest.approx(x.mean(), rel=1e-12)
+    assert merged.std == pytest.approx(x.std(ddof=1), rel=1e-9)
+    assert (merged.min, merged.max) == (x.min(), x.max())
+    assert_within_accuracy(merged, x)
+
+
+def test_zeros_negatives_and_missing_values():
+    x = np.concatenate([values(1000), np.zeros(50), -values(200, seed=1)])
+    sketch = QuantileSketch().update(np.concatenate([x, [np.nan, np.inf]]))
+    assert sketch.count == len(x)
+    assert_within_accuracy(sketch, x)
+
+
+def test_round_trip_through_json():
+    sketch = QuantileSketch().update(values(5000))
+    restored = QuantileSketch.from_dict(json.loads(json.dumps(sketch.to_dict())))
+    assert restored.positive == sketch.positive
+    assert [restored.quantile(q) for q in QUANTILES] == [sketch.quantile(q) for q in QUANTILES]
+    assert restored.std == sketch.std
+
+
+def test_merge_rejects_different_accuracy():
+    with pytest.raises(ValueError):
+        QuantileSketch(0.01).merge(QuantileSketch(0.02).update([1.0]))
+
+
+def test_histogram_moves_only_values_near_a_bin_edge():
+    x = values(20_000)
+    upper, nbins = np.quantile(x, 0.99), 60
+    sketch = QuantileSketch().update(x)
+    counts = sketch.histogram(nbins, upper)
+    exact, _ = np.histogram(x, bins=nbins, range=(0, upper))
+
+    edges = np.linspace(0, upper, nbins + 1)[1:]
+    nearest = edges[np.abs(x[:, None] - edges).argmin(axis=1)]
+    near_edge = int((np.abs(x - nearest) <= sketch.relative_accuracy * x).sum())
+    # Each moved value leaves one bin and enters another
+    assert np.abs(counts - exact).sum() <= 2 * near_edge
+
+
+def test_reads_sketches_written_with_key_count_dicts():
+    sketch = QuantileSketch(0.001).update(values(2000))
+    legacy = {**sketch.to_dict(), "positive": {str(k): v for k, v in sketch.positive.items()}, "negative": {}}
+    del legacy["encoding"]
+    assert QuantileSketch.from_dict(legacy).positive == sketch.positive
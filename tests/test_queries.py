@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import queries
+
+duckdb = pytest.importorskip("duckdb")
+pytest.importorskip("duckdb_engine")
+from sqlalchemy import create_engine, text  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+
+@pytest.fixture
+def analytics():
+    rng = np.random.default_rng(0)
+    n = 2000
+    return pd.DataFrame(
+        {
+            "state": rng.choice(["CA", "NY", "XX"], n),
+            "year": 2024,
+            "quarter": 1,
+            "utilization_type": "FFSU",
+            "product_name_norm": rng.choice(["HUMIRA PEN", "LIPITOR 10MG", "OZEMPIC"], n),
+            "number_of_prescriptions": rng.integers(0, 50, n).astype(float),
+            "total_amount_reimbursed": rng.lognormal(5, 1, n).round(2),
+            "units_reimbursed": rng.integers(0, 500, n).astype(float),
+        }
+    ).assign(
+        year_quarter="2024Q1",
+        medicaid_amount_reimbursed=lambda df: (df["total_amount_reimbursed"] * 0.9).round(2),
+    )
+
+
+@pytest.fixture
+def duck(analytics):
+    engine = create_engine("duckdb:///:memory:", poolclass=StaticPool)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE SCHEMA dbo"))
+        conn.connection.driver_connection.register("frame", analytics)
+        conn.execute(text("CREATE TABLE dbo.sdud_analytics AS SELECT * FROM frame"))
+    return engine
+
+
+def statements(dialect, scope="state_vs_national"):
+    return queries.executive_statements("CA", 2024, 1, "FFSU", scope, dialect=dialect)
+
+
+@pytest.mark.parametrize("scope", ["state_vs_national", "state_only"])
+@pytest.mark.parametrize("dialect", [queries.MSSQL, queries.DUCKDB])
+def test_statements_render_for_the_dialect(dialect, scope):
+    out = statements(dialect, scope)
+    assert ("kpi_nat" in out) == (scope == "state_vs_national")
+    for name, (kind, sql, params) in out.items():
+        assert kind in ("row", "frame")
+        assert all(f":{p}" in sql for p in params), name
+        if dialect is queries.MSSQL:
+            assert '"year"' not in sql and "LIMIT" not in sql and "quantile_cont" not in sql, name
+        else:
+            assert "[year]" not in sql and "TOP " not in sql and "CHARINDEX" not in sql, name
+
+
+def test_duckdb_statements_run(duck, analytics):
+    with duck.connect() as conn:
+        out = {
+            name: conn.execute(text(sql), params).mappings().all()
+            for name, (_, sql, params) in statements(queries.DUCKDB).items()
+        }
+
+    state = analytics[analytics["state"] == "CA"]
+    national = analytics[analytics["state"] != "XX"]
+    assert out["kpi_state"][0]["total_reimbursed"] == pytest.approx(state["total_amount_reimbursed"].sum())
+    assert out["kpi_nat"][0]["total_reimbursed"] == pytest.approx(national["total_amount_reimbursed"].sum())
+    assert {r["state"] for r in out["ranking"]} == {"CA", "NY"}
+    assert {r["thera_class"] for r in out["top_state"]} == {"HUMIRA", "LIPITOR", "OZEMPIC"}
+
+
+@pytest.mark.parametrize("dialect", [queries.MSSQL, queries.DUCKDB])
+def test_histogram_bin_count_is_a_literal(dialect):
+    _, sql, params = statements(dialect)["cpp_hist"]
+    assert ":nbins" not in sql
+    assert f"THEN {queries.CPP_NBINS} - 1" in sql
+    assert "nbins" not in params
+
+
+@pytest.mark.parametrize("value", [2.5, "60; DROP TABLE x", True])
+def test_int_literal_rejects_non_integers(value):
+    with pytest.raises((ValueError, TypeError)):
+        queries.int_literal(value)
+
+
+def test_histogram_matches_numpy(duck, analytics):
+    _, sql, params = statements(queries.DUCKDB)["cpp_hist"]
+    with duck.connect() as conn:
+        hist = pd.read_sql(text(sql), conn, params=params)
+
+    rows = analytics[(analytics["state"] != "XX") & (analytics["number_of_prescriptions"] > 0)]
+    cpp = rows["total_amount_reimbursed"] / rows["number_of_prescriptions"]
+    # One cap over both scopes' rows (state rows count twice), as the overlay shares its bins
+    x_max = np.quantile(pd.concat([cpp[rows["state"] == "CA"], cpp]), 0.99)
+    assert hist["x_max"].iloc[0] == pytest.approx(x_max)
+    for scope, sel in (("State", rows["state"] == "CA"), ("National", slice(None))):
+        expected, _ = np.histogram(cpp[sel], bins=queries.CPP_NBINS, range=(0, x_max))
+        got = hist[hist["scope"] == scope].set_index("bin")["n"].reindex(range(queries.CPP_NBINS), fill_value=0)
+        np.testing.assert_array_equal(got.to_numpy(), expected)
@@ -0,0 +1,73 @@
+import pytest
+
+import query_cache
+from query_cache import QueryCache, make_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache.time, "monotonic", clock)
+    return clock
+
+
+def loader(value, calls):
+    def _load():
+        calls.append(value)
+        return value
+
+    return _load
+
+
+def test_key_ignores_formatting_and_param_order():
+    assert make_key("SELECT 1\n  FROM t ;", {"b": 2, "a": 1}) == make_key("SELECT 1 FROM t", {"a": 1, "b": 2})
+
+
+def test_hit_then_ttl_expiry(clock):
+    cache, calls = QueryCache(ttl_seconds=60), []
+    assert cache.get_or_load("q", None, loader(1, calls)) == 1
+    assert cache.get_or_load("q", None, loader(2, calls)) == 1
+    clock.now += 61
+    assert cache.get_or_load("q", None, loader(3, calls)) == 3
+    assert calls == [1, 3]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_is_evicted(clock):
+    cache, calls = QueryCache(max_entries=2), []
+    cache.get_or_load("a", None, loader("a", calls))
+    cache.get_or_load("b", None, loader("b", calls))
+    cache.get_or_load("a", None, loader("a", calls))  # a is now the most recent
+    cache.get_or_load("c", None, loader("c", calls))  # evicts b
+    cache.get_or_load("a", None, loader("a", calls))
+    cache.get_or_load("b", None, loader("b", calls))
+    assert calls == ["a", "b", "c", "b"]
+    assert cache.evictions == 2
+
+
+def test_version_bump_drops_every_entry(clock):
+    version = {"v": 1}
+    cache, calls = QueryCache(version_fn=lambda: version["v"], version_check_seconds=30), []
+    cache.get_or_load("q", None, loader("old", calls))
+    version["v"] = 2
+    # Not re-polled before version_check_seconds
+    assert cache.get_or_load("q", None, loader("new", calls)) == "old"
+    clock.now += 31
+    assert cache.get_or_load("q", None, loader("new", calls)) == "new"
+    assert cache.invalidations == 1
+    assert cache.current_version() == 2
+
+
+def test_disabled_cache_always_loads(clock):
+    cache, calls = QueryCache(max_entries=0), []
+    cache.get_or_load("q", None, loader(1, calls))
+    cache.get_or_load("q", None, loader(1, calls))
+    assert calls == [1, 1]